@@ -1,21 +1,96 @@
 from django.contrib import admin
-from api.models import Department, Job, HiredEmployee
+from django.db import transaction
+from api.models import Department, Job, HiredEmployee, IngestJob
+from api.reports import bump_data_version
+from api.routers import reporting_reads
+from api.summary import HiresSummaryUpdater
+
+
+class ReportingChangeListMixin:
+    """The change list reads from the reporting replica when it can be used (api/routers.py)."""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != "GET":
+            # Bulk actions read what they are about to change from the primary
+            return super().changelist_view(request, extra_context)
+        with reporting_reads():
+            response = super().changelist_view(request, extra_context)
+            # The result list is a lazy queryset, evaluated when the template renders
+            if hasattr(response, "render"):
+                response.render()
+        return response
+
+
+class ReportDataAdminMixin:
+    """
+    Edits made in the admin invalidate the cached reports of `report_table` once
+    they commit, as the uploads do (bump_data_version).
+    """
+    report_table = None
+
+    def data_changed(self):
+        transaction.on_commit(lambda: bump_data_version(self.report_table))
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.data_changed()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.data_changed()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        self.data_changed()
+
 
 @admin.register(Department)
-class DepartmentAdmin(admin.ModelAdmin):
+class DepartmentAdmin(ReportDataAdminMixin, ReportingChangeListMixin, admin.ModelAdmin):
+    report_table = "departments"
     list_display = ('id', 'department',)
     search_fields = ('id', 'department',)
     ordering = ('id',)
 
 @admin.register(HiredEmployee)
-class HiredEmployeeAdmin(admin.ModelAdmin):
+class HiredEmployeeAdmin(ReportDataAdminMixin, ReportingChangeListMixin, admin.ModelAdmin):
+    report_table = "employees"
     list_display = ('id', 'name')
     search_fields = ('id', 'name')
     ordering = ('-id',)
 
+    # The summary the reports read (api/summary.py) follows the admin's edits in the same transaction
+
+    def summary_rows(self, queryset):
+        return list(queryset.values(*HiresSummaryUpdater.columns))
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            # The row this save overwrites, if any (a changed id saves a new row)
+            previous = self.summary_rows(HiredEmployee.objects.filter(pk=obj.pk))
+            super().save_model(request, obj, form, change)
+            HiresSummaryUpdater().apply(self.summary_rows(HiredEmployee.objects.filter(pk=obj.pk)), removed=previous)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            HiresSummaryUpdater().apply([], removed=self.summary_rows(HiredEmployee.objects.filter(pk=obj.pk)))
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            HiresSummaryUpdater().apply([], removed=self.summary_rows(queryset))
+            super().delete_queryset(request, queryset)
+
 
 @admin.register(Job)
-class JobAdmin(admin.ModelAdmin):
+class JobAdmin(ReportDataAdminMixin, ReportingChangeListMixin, admin.ModelAdmin):
+    report_table = "jobs"
     list_display = ('id', 'job')
     search_fields = ('id', 'job')
-    ordering = ('id',)
\ No newline at end of file
+    ordering = ('id',)
+
+
+@admin.register(IngestJob)
+class IngestJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'table', 'file_name', 'state', 'rows_processed', 'created_at')
+    list_filter = ('state', 'table')
+    ordering = ('-id',)
@@ -1,6 +1,59 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+
+# Set in the parallel ingest worker processes (api/parallel.py)
+INGEST_WORKER_ENV = "API_INGEST_WORKER"
+
+
+def is_management_script(path):
+    """manage.py, django-admin or `python -m django` (django/__main__.py)."""
+    name = os.path.basename(path)
+    if name == "__main__.py":
+        return os.path.basename(os.path.dirname(path)) == "django"
+    return name in ("manage.py", "django-admin")
+
+
+def serves_requests(argv):
+    """
+    False for management commands (migrate, test, load_csv, ...) and for the
+    parallel ingest workers, True for the web server (gunicorn, uvicorn and their
+    workers) and runserver's child.
+    """
+    if os.environ.get(INGEST_WORKER_ENV):
+        return False # They inherit the server's argv
+    if not argv or not is_management_script(argv[0]):
+        return True
+    if len(argv) > 1 and argv[1] == "runserver":
+        # The autoreloader's parent only watches files
+        return os.environ.get("RUN_MAIN") == "true" or "--noreload" in argv
+    return False
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+    schema_ready = False
+
+    def ready(self):
+        # Background jobs left queued or interrupted by a restart resume at startup,
+        # not when the next upload happens to start the executor
+        if not settings.INGEST_JOBS_EAGER and serves_requests(sys.argv):
+            from . import jobs
+
+            jobs.get_executor()
+
+    def check_schema(self, using="default"):
+        """
+        Returns True when every migration has been applied. Migrations are applied by
+        entrypoint.sh at startup, so a positive result is cached for the life of the
+        process; a stale schema is checked again on the next call.
+        """
+        if not self.schema_ready:
+            executor = MigrationExecutor(connections[using])
+            self.schema_ready = not executor.migration_plan(executor.loader.graph.leaf_nodes())
+        return self.schema_ready
@@ -0,0 +1,93 @@
+"""
+Async access to PostgreSQL for the report views served by the ASGI app.
+
+Django's ORM has no async cursor (its async query API still runs the query on a
+thread), so the async report views (api/async_views.py) run the report SQL from
+api/reports.py through asyncpg. Each event loop keeps one small connection pool
+per database alias, built from the same DATABASES settings Django uses.
+"""
+import asyncio
+import re
+import weakref
+
+import asyncpg
+from django.conf import settings
+
+_PARAMETER = re.compile(r"%\((\w+)\)s")
+
+# event loop -> {alias: task creating the pool}
+_pools = weakref.WeakKeyDictionary()
+
+
+def to_asyncpg(sql, params):
+    """Rewrites the `%(name)s` placeholders of a report query as $1, $2, ... Returns (sql, args)."""
+    names = []
+
+    def number(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return _PARAMETER.sub(number, sql), [params[name] for name in names]
+
+
+def _create_pool(using):
+    database = settings.DATABASES[using]
+    return asyncpg.create_pool(
+        host=database["HOST"],
+        port=database["PORT"],
+        user=database["USER"],
+        password=database["PASSWORD"],
+        database=database["NAME"],
+        min_size=1,
+        max_size=settings.ASYNC_DB_POOL_SIZE,
+    )
+
+
+async def get_pool(using="default"):
+    pools = _pools.setdefault(asyncio.get_running_loop(), {})
+    if using not in pools:
+        # Store the task rather than the pool so concurrent first requests share it
+        pools[using] = asyncio.ensure_future(_create_pool(using))
+    try:
+        return await pools[using]
+    except Exception:
+        pools.pop(using, None)
+        raise
+
+
+async def close_pools():
+    """Closes the pools of the running event loop."""
+    for task in _pools.pop(asyncio.get_running_loop(), {}).values():
+        try:
+            pool = await task
+        except Exception:
+            continue
+        await pool.close()
+
+
+async def run_report(sql, params, using="default"):
+    """Async counterpart of api.reports.run_report."""
+    query, args = to_asyncpg(sql, params)
+    pool = await get_pool(using)
+    return [dict(record) for record in await pool.fetch(query, *args)]
+
+
+async def stream_report(sql, params, chunk_size=2000, using="default"):
+    """
+    Async counterpart of api.reports.stream_report: yields the list of column names
+    first, then lists of up to `chunk_size` rows read from a server-side cursor.
+    """
+    query, args = to_asyncpg(sql, params)
+    pool = await get_pool(using)
+    async with pool.acquire() as connection, connection.transaction():
+        statement = await connection.prepare(query)
+        cursor = await statement.cursor(*args)
+        # The query runs before the columns are yielded, as in api.reports.stream_report
+        rows = await cursor.fetch(chunk_size)
+        # Taken from the statement, so an empty result still has its columns
+        yield [attribute.name for attribute in statement.get_attributes()]
+        while rows:
+            yield [tuple(row) for row in rows]
+            rows = await cursor.fetch(chunk_size)
@@ -0,0 +1,101 @@
+"""
+Native async versions of the report endpoints, used when the project is served
+through globant_challenge/asgi.py (see ASYNC_QUERY_VIEWS in api/urls.py).
+
+They answer exactly like the sync views in api/views.py (same parameters, cache
+entries, ETags and streaming formats), but the queries run on asyncpg
+(api/async_db.py), so a request waiting on the database or on a slow client
+doesn't hold a worker thread. DRF views are sync only, so these are plain Django
+views; they render JSON and CSV, not the browsable API.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import async_db
+from .materialized import arefreshed_after
+from .reports import aget_data_versions, aiter_csv, aiter_json_array, astarted_report, report_cache_key
+from .routers import areporting_database
+from .serializers import ReportParamsSerializer
+from .views import DepartmentsAboveAverageReport, HiresByQuarterReport
+
+
+class AsyncCachedReportView(View):
+    params_serializer_class = ReportParamsSerializer
+    report_name = "report"
+    report_tables = ("employees", "departments", "jobs")
+    stream_chunk_size = 2000
+
+    def build_query(self, **params):
+        raise NotImplementedError
+
+    def materialized_query(self, **params):
+        return None
+
+    async def get(self, request, *args, **kwargs):
+        output_format = request.GET.get("format", "json")
+        if output_format not in ("json", "csv"):
+            return JsonResponse({"detail": "Not found."}, status=404)
+        params = self.params_serializer_class(data=request.GET)
+        if not params.is_valid():
+            return JsonResponse({"error": params.errors}, status=400)
+
+        versions = await aget_data_versions(self.report_tables)
+        key = report_cache_key(self.report_name, params.validated_data, versions)
+        etag = quote_etag(key.rsplit(":", 1)[1])
+        last_modified = max(versions) // 10**9
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        # Same choice of query and database as the sync views
+        fresh = request.GET.get("fresh") in ("1", "true")
+        changed_at = max(versions)
+        query = None if fresh else self.materialized_query(**params.validated_data)
+        refreshed = query and await arefreshed_after(changed_at)
+        if refreshed:
+            changed_at = max(changed_at, refreshed)
+        else:
+            query = self.build_query(**params.validated_data)
+
+        using, current = await areporting_database(changed_at=changed_at / 10**9)
+        if request.GET.get("stream") in ("1", "true") or output_format == "csv":
+            try:
+                response = await self.streaming_response(output_format, *query, using=using)
+            except Exception as e:
+                return JsonResponse({"error": f"An error occurred: {str(e)}"}, status=500)
+        else:
+            results = None if fresh else await cache.aget(key)
+            if results is None:
+                try:
+                    results = await async_db.run_report(*query, using=using)
+                except Exception as e:
+                    return JsonResponse({"error": f"An error occurred: {str(e)}"}, status=500)
+                if current:
+                    await cache.aset(key, results, settings.REPORT_CACHE_TIMEOUT)
+            response = JsonResponse(results, encoder=JSONEncoder, safe=False)
+        if current:
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    async def streaming_response(self, output_format, sql, params, using="default"):
+        # The query runs here, before the response starts
+        batches = await astarted_report(async_db.stream_report(sql, params, chunk_size=self.stream_chunk_size, using=using))
+        if output_format == "csv":
+            response = StreamingHttpResponse(aiter_csv(batches), content_type="text/csv; charset=utf-8")
+            response["Content-Disposition"] = f'attachment; filename="{self.report_name}.csv"'
+            return response
+        return StreamingHttpResponse(aiter_json_array(batches), content_type="application/json")
+
+
+class HiresByQuarterAsyncView(HiresByQuarterReport, AsyncCachedReportView):
+    pass
+
+
+class DepartmentsAboveAverageAsyncView(DepartmentsAboveAverageReport, AsyncCachedReportView):
+    pass
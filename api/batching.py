@@ -0,0 +1,91 @@
+"""
+Batch sizes of the ingest engines (api/ingest.py).
+
+AdaptiveBatchSize tunes the number of rows per batch while a file is loaded,
+from the throughput of the batches already written; the starting point of each
+table is the best size found by `python manage.py bench_batch_size`, recorded in
+INGEST_BATCH_SIZES_FILE, or the upload view's `batch_size`.
+"""
+import json
+import os
+
+from django.conf import settings
+
+# Bind parameters per statement in the PostgreSQL protocol (bulk_create / IN lists)
+MAX_QUERY_PARAMETERS = 65535
+
+
+class AdaptiveBatchSize:
+    """
+    Picks the size of the next batch by hill climbing on rows per second: the
+    size moves by `factor` in one direction while the throughput improves by more
+    than `tolerance`, and when it gets worse it turns around with a smaller step.
+    On a plateau it stays put, so it doesn't grow for no gain.
+
+    The size never leaves [min_size, max_size], nor goes over `max_rows` (see
+    `cap_rows`) or `max_bytes` of payload per batch, estimated from the bytes per
+    row measured so far.
+    """
+
+    def __init__(self, initial, min_size=None, max_size=None, max_bytes=None, factor=2.0, tolerance=0.05):
+        self.min_size = min_size or settings.INGEST_BATCH_SIZE_MIN
+        self.max_size = max_size or settings.INGEST_BATCH_SIZE_MAX
+        self.max_bytes = max_bytes or settings.INGEST_BATCH_MAX_BYTES
+        self.max_rows = self.max_size
+        self.factor = factor
+        self.tolerance = tolerance
+        self.direction = 1
+        self.row_bytes = None
+        self.last_rate = None
+        self.size = self.bounded(initial)
+
+    def cap_rows(self, rows):
+        """Hard limit on the rows of a batch (e.g. bind parameters of the engine's statements)."""
+        if rows:
+            self.max_rows = min(self.max_size, rows)
+            self.size = self.bounded(self.size)
+
+    def bounded(self, size):
+        upper = self.max_rows
+        if self.row_bytes:
+            upper = min(upper, int(self.max_bytes // self.row_bytes))
+        # The hard limits win over min_size
+        return max(1, min(max(int(size), self.min_size), upper))
+
+    def observe(self, rows, payload_bytes, seconds):
+        """Takes the measurements of a batch just written and updates `size`."""
+        if rows < self.size or seconds <= 0:
+            return # The last, partial batch of a load says little
+        if payload_bytes:
+            self.row_bytes = payload_bytes / rows
+        rate = rows / seconds
+        if self.last_rate is None or rate > self.last_rate * (1 + self.tolerance):
+            step = self.direction
+        elif rate < self.last_rate * (1 - self.tolerance):
+            self.direction = -self.direction
+            self.factor = max(1.1, self.factor ** 0.5)
+            step = self.direction
+        else:
+            step = 0
+        self.last_rate = rate
+        size = self.bounded(self.size * self.factor ** step)
+        if step and size == self.size:
+            self.direction = -self.direction # Against a bound
+        self.size = size
+
+
+def recorded_batch_sizes():
+    """{table: batch size} saved by bench_batch_size, or {} if there's none."""
+    try:
+        with open(settings.INGEST_BATCH_SIZES_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_batch_sizes(sizes):
+    recorded = {**recorded_batch_sizes(), **sizes}
+    path = settings.INGEST_BATCH_SIZES_FILE
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(recorded, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
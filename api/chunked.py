@@ -0,0 +1,194 @@
+"""
+Resumable chunked uploads.
+
+Instead of one multipart POST, a large CSV file can be sent as numbered chunks
+within an upload session:
+
+  POST   upload/<table>/sessions/           -> creates the session
+  PUT    upload/sessions/<id>/chunks/<n>/   -> one chunk (raw body, X-Chunk-SHA256 header)
+  POST   upload/sessions/<id>/commit/       -> merges the staged rows into the table
+  GET    upload/sessions/<id>/              -> state, next chunk expected, rows so far
+  DELETE upload/sessions/<id>/              -> aborts it
+
+Every chunk is parsed, validated and COPYed into the session's UNLOGGED staging
+table while it's being received, so ingest overlaps with the transfer and the
+commit only runs the merge of a single-request upload (api/ingest.py).
+
+A chunk can end anywhere within a row: the bytes after its last line break are
+kept with the session and put in front of the next chunk, which is why chunks
+must be sent in order. A chunk is staged in one transaction together with the
+session's state, so one that fails or whose checksum doesn't match leaves nothing
+behind and can be sent again; sending again a chunk already staged with the same
+checksum is a no-op, so after a lost response a client resumes from `next_chunk`.
+Only plain CSV is accepted (no compressed or columnar formats).
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import status
+
+from . import metrics
+from .ingest import create_staging_table, drop_staging_table, get_ingest_engine, iter_csv_rows
+from .models import UploadSession
+from .reports import bump_data_version
+
+
+def create_session(view, mode="insert", strict=True):
+    expire_sessions()
+    return UploadSession.objects.create(
+        table=view.table_name, mode=mode, strict_references=strict,
+        staging_table=create_staging_table(view.model_class),
+    )
+
+
+def expire_sessions():
+    """Drops the staged rows of open sessions that received nothing for UPLOAD_SESSION_EXPIRY_SECONDS."""
+    stale_before = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_EXPIRY_SECONDS)
+    for session in UploadSession.objects.filter(state=UploadSession.OPEN, updated_at__lt=stale_before):
+        close_session(session, UploadSession.EXPIRED)
+
+
+def close_session(session, state):
+    drop_staging_table(session.staging_table)
+    session.state = state
+    session.finished_at = timezone.now()
+    session.save()
+
+
+def _complete_lines(chunks, session, digest, timings):
+    # Yields the bytes of the chunk up to its last line break, prefixed by the
+    # previous chunk's tail; what's left becomes the session's new tail.
+    tail = bytes(session.tail)
+    for chunk in timings.timed(chunks, "read", count_bytes=True):
+        digest.update(chunk)
+        data = tail + chunk
+        end = data.rfind(b"\n") + 1
+        if end:
+            yield data[:end]
+        tail = data[end:]
+    session.tail = tail
+
+
+def _stage(view, session, chunks, errors, digest=None):
+    """Validates the complete rows of `chunks` and copies them to the staging table. Returns (rows read, rows staged)."""
+    rows_read = [0]
+
+    def counted(lines):
+        for data in lines:
+            rows_read[0] += data.count(b"\n")
+            yield data
+
+    first_row_number = session.rows_received + 1
+    timings = metrics.StageTimer()
+    engine = get_ingest_engine(
+        view.model_class, view.expected_header, batch_size=view.ingest_batch_size(),
+        staging_table=session.staging_table, first_position=first_row_number, timings=timings,
+    )
+    references = view.reference_checker(session.strict_references)
+    lines = counted(_complete_lines(chunks, session, digest or hashlib.sha256(), timings))
+    rows = view.validated_rows(
+        iter_csv_rows(lines, timings=timings), errors, first_row_number=first_row_number, references=references,
+        upsert=session.mode == "upsert", timings=timings,
+    )
+    for values in rows:
+        engine.add(values)
+    engine.flush()
+    metrics.observe(view.table_name, timings)
+    if references:
+        rejected = session.rejected_references or {}
+        session.rejected_references = {field: rejected.get(field, 0) + count for field, count in references.rejected.items()}
+    session.rows_received += rows_read[0]
+    session.rows_staged += engine.copied
+    return rows_read[0], engine.copied
+
+
+def _locked_session(session_id):
+    session = UploadSession.objects.select_for_update().filter(pk=session_id).first()
+    if session is None:
+        return None, ({"error": "Upload session not found."}, status.HTTP_404_NOT_FOUND)
+    if session.state != UploadSession.OPEN:
+        return None, ({"error": f"Upload session is {session.state}."}, status.HTTP_409_CONFLICT)
+    return session, None
+
+
+def receive_chunk(session_id, number, chunks, checksum):
+    """
+    Stages chunk `number` of a session, given as an iterable of byte chunks whose
+    SHA-256 must be `checksum` (hex). Returns the response payload and status code.
+    """
+    from .views import UPLOAD_VIEWS
+
+    checksum = checksum.lower()
+    with transaction.atomic():
+        session, failure = _locked_session(session_id)
+        if failure:
+            return failure
+        if number < session.next_chunk:
+            if session.checksums[number] != checksum:
+                return {"error": f"Chunk {number} was already received with another checksum."}, status.HTTP_409_CONFLICT
+            return {"message": f"Chunk {number} was already received.", "next_chunk": session.next_chunk}, status.HTTP_200_OK
+        if number > session.next_chunk:
+            return {"error": f"Expected chunk {session.next_chunk}, got {number}."}, status.HTTP_409_CONFLICT
+
+        errors = []
+        digest = hashlib.sha256()
+        rows_read, rows_staged = _stage(UPLOAD_VIEWS[session.table](), session, chunks, errors, digest)
+        if digest.hexdigest() != checksum:
+            # Nothing of this chunk is kept; it can be sent again
+            transaction.set_rollback(True)
+            return {"error": f"Checksum mismatch for chunk {number}."}, status.HTTP_400_BAD_REQUEST
+        session.checksums.append(checksum)
+        session.errors.extend(errors)
+        session.save()
+    return {
+        "chunk": number, "next_chunk": session.next_chunk, "rows": rows_read, "staged": rows_staged, "errors": errors,
+    }, status.HTTP_200_OK
+
+
+def commit_session(session_id):
+    """Merges the staged rows of a session into its table. Returns the response payload and status code."""
+    from .views import UPLOAD_VIEWS
+
+    with transaction.atomic():
+        session, failure = _locked_session(session_id)
+        if failure:
+            return failure
+        view = UPLOAD_VIEWS[session.table]()
+        if session.tail:
+            # The file's last row, without a line break after it
+            _stage(view, session, [b"\n"], session.errors)
+        timings = metrics.StageTimer()
+        engine = get_ingest_engine(
+            view.model_class, view.expected_header, summaries=view.summaries,
+            staging_table=session.staging_table, upsert=session.mode == "upsert", timings=timings,
+        )
+        engine.copied = session.rows_staged
+        engine.finish()
+        counts = engine.as_dict()
+        counts["chunks"] = session.next_chunk
+        if session.rejected_references is not None:
+            counts["rejected_references"] = session.rejected_references
+        payload, status_code = view.ingest_result(session.errors, counts)
+        metrics.observe(view.table_name, timings, counts, status_code)
+        session.result = payload
+        close_session(session, UploadSession.COMMITTED)
+        if engine.merged:
+            transaction.on_commit(lambda: bump_data_version(view.table_name))
+    return payload, status_code
+
+
+def abort_session(session_id):
+    with transaction.atomic():
+        session, failure = _locked_session(session_id)
+        if failure:
+            return failure
+        close_session(session, UploadSession.ABORTED)
+    return {"message": "Upload session aborted."}, status.HTTP_200_OK
+
+
+def available():
+    # Sessions keep their rows in a PostgreSQL UNLOGGED staging table
+    return connection.vendor == "postgresql"
@@ -0,0 +1,160 @@
+"""
+Upload file formats.
+
+Besides plain CSV the upload endpoints take gzip or zstandard compressed CSV,
+which is decompressed as it is read (only the current chunk is ever held in
+memory), and Parquet or Arrow IPC files, which are read as record batches and
+handed to the columnar validator as DataFrames without going through text.
+
+zstandard and pyarrow are optional: without them those formats are rejected
+with a 400 (see `unavailable_reason`).
+"""
+import math
+import zlib
+from datetime import datetime, timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Format -> file name suffixes, longest first so ".csv.gz" isn't taken for ".gz"
+SUFFIXES = {
+    "csv.gz": (".csv.gz",),
+    "csv.zst": (".csv.zst",),
+    "csv": (".csv",),
+    "parquet": (".parquet",),
+    "arrow": (".arrow", ".feather", ".ipc"),
+}
+COLUMNAR_FORMATS = ("parquet", "arrow")
+CSV_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class FileFormatError(ValueError):
+    pass
+
+
+def detect_format(file_name):
+    """Format of an upload from its file name, or None if it isn't supported."""
+    name = file_name.lower()
+    for file_format, suffixes in SUFFIXES.items():
+        if name.endswith(suffixes):
+            return file_format
+    return None
+
+
+def unavailable_reason(file_format):
+    """Message explaining why `file_format` can't be read here, or None if it can."""
+    if file_format == "csv.zst" and zstandard is None:
+        return "Zstandard compressed files need the zstandard package."
+    if file_format in COLUMNAR_FORMATS and pyarrow is None:
+        return "Parquet and Arrow files need the pyarrow package."
+    return None
+
+
+def _decompress(chunks, new_decompressor):
+    # Concatenated members (gzip) or frames (zstd) are read one after another
+    decompressor = new_decompressor()
+    started = False
+    for chunk in chunks:
+        while chunk:
+            started = True
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            if not decompressor.eof:
+                break
+            chunk = decompressor.unused_data
+            decompressor, started = new_decompressor(), False
+    if started:
+        raise FileFormatError("Could not decompress the file: it is truncated.")
+
+
+def iter_decompressed(chunks, file_format):
+    """Yields the CSV bytes of an iterable of byte chunks of a `file_format` file."""
+    try:
+        if file_format == "csv.gz":
+            yield from _decompress(chunks, lambda: zlib.decompressobj(zlib.MAX_WBITS | 16))
+        elif file_format == "csv.zst":
+            yield from _decompress(chunks, lambda: zstandard.ZstdDecompressor().decompressobj())
+        else:
+            yield from chunks
+    except (zlib.error, getattr(zstandard, "ZstdError", zlib.error)) as e:
+        raise FileFormatError(f"Could not decompress the file: {e}") from e
+
+
+def as_text(value):
+    """A Parquet/Arrow value written as it would be in the CSV (nulls become "")."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, datetime):
+        if value != value: # NaT
+            return ""
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).strftime(CSV_DATETIME_FORMAT)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _columns(names, expected):
+    # Columns are taken by name; files whose names differ are read by position
+    if set(expected) <= set(names):
+        return list(expected)
+    if len(names) == len(expected):
+        return list(names)
+    raise FileFormatError(f"Expected columns {', '.join(expected)}; the file has {', '.join(names) or 'none'}.")
+
+
+def _open_arrow(file_obj):
+    try:
+        return pyarrow.ipc.open_file(file_obj)
+    except pyarrow.ArrowInvalid:
+        # Not the random access (file) format: read it as an IPC stream
+        file_obj.seek(0)
+        return pyarrow.ipc.open_stream(file_obj)
+
+
+def _record_batches(file_obj, file_format, expected, batch_size):
+    if file_format == "parquet":
+        parquet_file = pyarrow.parquet.ParquetFile(file_obj)
+        columns = _columns(parquet_file.schema_arrow.names, expected)
+        # Only the needed columns are read, one row group slice at a time
+        batches = parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+    else:
+        reader = _open_arrow(file_obj)
+        columns = _columns(reader.schema.names, expected)
+        if isinstance(reader, pyarrow.ipc.RecordBatchFileReader):
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        else:
+            batches = reader
+    for batch in batches:
+        batch = batch.select(columns)
+        for offset in range(0, batch.num_rows, batch_size):
+            yield batch.slice(offset, batch_size)
+
+
+def iter_frames(file_obj, file_format, expected, batch_size):
+    """
+    Yields DataFrames of at most `batch_size` rows from a seekable Parquet or Arrow
+    file, with the columns of `expected` in that order. Values keep their Arrow
+    types (integers, timestamps, strings); nulls in text columns become "".
+    """
+    try:
+        for batch in _record_batches(file_obj, file_format, expected, batch_size):
+            frame = batch.to_pandas()
+            frame.columns = list(expected)
+            for name in frame.columns:
+                if frame[name].dtype == object:
+                    frame[name] = frame[name].fillna("")
+            yield frame
+    except pyarrow.ArrowException as e:
+        raise FileFormatError(f"Could not read the {file_format} file: {e}") from e
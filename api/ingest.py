@@ -0,0 +1,437 @@
+import codecs
+import csv
+import io
+import time
+import uuid
+
+from django.db import connections
+
+from .batching import MAX_QUERY_PARAMETERS, AdaptiveBatchSize
+from .metrics import StageTimer
+
+
+def iter_text_lines(chunks, encoding="utf-8", timings=None):
+    """
+    Decode an iterable of byte chunks (e.g. `UploadedFile.chunks()`) incrementally
+    and yield one "\n"-terminated line at a time, so only the current chunk and the
+    partial line at its end are ever held in memory.
+    """
+    timings = timings or StageTimer()
+    decoder = codecs.getincrementaldecoder(encoding)()
+    tail = ""
+    for chunk in chunks:
+        with timings.stage("decode"):
+            lines = (tail + decoder.decode(chunk)).split("\n")
+            tail = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_csv_rows(chunks, encoding="utf-8", timings=None):
+    return csv.reader(iter_text_lines(chunks, encoding=encoding, timings=timings))
+
+
+def iter_file_range(path, start, end, chunk_size=64 * 1024):
+    """Yields the bytes of `path` in [start, end) as chunks of at most `chunk_size`."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _copy_value(value):
+    # Encode a value for COPY ... FROM STDIN in PostgreSQL text format.
+    if value is None:
+        return "\\N"
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class BaseIngestEngine:
+    """
+    Collects validated rows (tuples ordered like `fields`) and writes them to
+    the model table in batches, skipping rows whose primary key already exists.
+
+    After `finish()`:
+      copied  -> rows handed to the database (staging table or bulk insert)
+      merged  -> rows actually inserted into the target table
+      skipped -> rows ignored because their id was already present
+
+    With `upsert=True`, rows whose id already exists replace the stored values
+    instead, but only when some value differs; unchanged rows aren't rewritten
+    (no new row version, WAL or index entries). After `finish()`:
+      inserted, updated, unchanged -> rows by outcome (merged = inserted + updated)
+      skipped -> repeated ids within the load (the first occurrence is used)
+
+    `summaries` are updaters (see api/summary.py) that receive the rows actually
+    inserted, and the previous values of the rows updated, in the same transaction.
+    The time spent building, writing and merging batches goes to `timings`.
+
+    `batch_size` is a number of rows, or an AdaptiveBatchSize (api/batching.py)
+    that is told how long each batch took and picks the size of the next one.
+    """
+
+    def __init__(self, model_class, fields, using="default", batch_size=1000, summaries=(), upsert=False, timings=None):
+        self.model_class = model_class
+        self.fields = list(fields)
+        self.using = using
+        self.sizer = None
+        if isinstance(batch_size, AdaptiveBatchSize):
+            self.sizer = batch_size
+            self.sizer.cap_rows(self.max_batch_rows())
+            batch_size = self.sizer.size
+        self.batch_size = batch_size
+        self.batch_bytes = 0 # Payload of the last batch written
+        self.summaries = list(summaries)
+        self.upsert = upsert
+        self.timings = timings or StageTimer()
+        self.pending = []
+        self.copied = 0
+        self.merged = 0
+        self.skipped = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    def add(self, row):
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        started = time.perf_counter()
+        self.write_batch(batch)
+        self.copied += len(batch)
+        self.observe_batch(len(batch), time.perf_counter() - started)
+
+    def observe_batch(self, rows, seconds):
+        if self.sizer:
+            self.sizer.observe(rows, self.batch_bytes, seconds)
+            self.batch_size = self.sizer.size
+
+    def max_batch_rows(self):
+        """Most rows a batch can hold for this engine's statements, or None for no limit."""
+        return None
+
+    def finish(self):
+        self.flush()
+        with self.timings.stage("merge"):
+            self.merge()
+        if self.upsert:
+            self.merged = self.inserted + self.updated
+            self.skipped = self.copied - self.inserted - self.updated - self.unchanged
+        else:
+            self.skipped = self.copied - self.merged
+        return self
+
+    def write_batch(self, batch):
+        raise NotImplementedError
+
+    def merge(self):
+        """Called by `finish()` once every batch is written."""
+
+    def as_dict(self):
+        if self.upsert:
+            return {
+                "copied": self.copied, "merged": self.merged, "inserted": self.inserted,
+                "updated": self.updated, "unchanged": self.unchanged, "skipped": self.skipped,
+            }
+        return {"copied": self.copied, "merged": self.merged, "skipped": self.skipped}
+
+
+class PostgresCopyIngestEngine(BaseIngestEngine):
+    """
+    Streams every batch into a temporary staging table with COPY FROM STDIN and
+    merges the staging table into the target with INSERT ... ON CONFLICT DO NOTHING
+    (DO UPDATE ... WHERE <values differ> when upserting).
+    Must run inside a transaction (the staging table is dropped on commit).
+
+    With `staging_table`, the batches go to that existing table instead (see
+    create_staging_table); parallel ingest (api/parallel.py) has several engines
+    fill one shared table and a single one `merge()` it. Each staged row records
+    its load position, counted from `first_position`, so both merges keep the
+    first row of each id in file order.
+
+    Rows are encoded into the batch's COPY data (UTF-8 bytes) every `encode_rows`
+    rows rather than when the batch is written, so a batch of any size is held
+    as about one byte per character instead of as tuples of Python objects, and at
+    most `encode_rows` tuples are alive at a time.
+    """
+
+    encode_rows = 1000
+
+    def __init__(self, *args, staging_table=None, first_position=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.first_position = first_position
+        self.table = self.model_class._meta.db_table
+        self.staging_table = staging_table or f"{self.table}_staging"
+        self.columns = [self.model_class._meta.get_field(f).column for f in self.fields]
+        self.staging_ready = staging_table is not None
+        self.buffer = io.BytesIO()
+        self.buffered = 0 # Rows of the current batch already in `buffer`
+        self.encode_seconds = 0.0
+
+    def add(self, row):
+        self.pending.append(row)
+        if len(self.pending) >= self.encode_rows or self.buffered + len(self.pending) >= self.batch_size:
+            self.encode_pending()
+            if self.buffered >= self.batch_size:
+                self.flush()
+
+    def encode_pending(self):
+        """Appends the pending rows to the COPY text of the current batch."""
+        if not self.pending:
+            return
+        started = time.perf_counter()
+        with self.timings.stage("batch_build"):
+            lines = []
+            for position, row in enumerate(self.pending, start=self.first_position + self.copied + self.buffered):
+                lines.append("\t".join(map(_copy_value, row)))
+                lines.append(f"\t{position}\n")
+            self.buffer.write("".join(lines).encode())
+        self.buffered += len(self.pending)
+        self.pending = []
+        self.encode_seconds += time.perf_counter() - started
+
+    def flush(self):
+        self.encode_pending()
+        if not self.buffered:
+            return
+        rows, buffer = self.buffered, self.buffer
+        self.buffer, self.buffered = io.BytesIO(), 0
+        started = time.perf_counter()
+        self.write_buffer(buffer)
+        self.copied += rows
+        # The batch took its encoding time as well, spread over the adds
+        self.observe_batch(rows, time.perf_counter() - started + self.encode_seconds)
+        self.encode_seconds = 0.0
+
+    def _create_staging_table(self, cursor):
+        qn = connections[self.using].ops.quote_name
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS {qn(self.staging_table)} "
+            f"({_staging_columns(qn(self.table))}) ON COMMIT DROP"
+        )
+        cursor.execute(f"TRUNCATE {qn(self.staging_table)}")
+        self.staging_ready = True
+
+    def write_buffer(self, buffer):
+        qn = connections[self.using].ops.quote_name
+        self.batch_bytes = buffer.tell()
+        buffer.seek(0)
+        columns = ", ".join([*(qn(c) for c in self.columns), STAGING_ORDER_COLUMN])
+        with self.timings.stage("write"), connections[self.using].cursor() as cursor:
+            if not self.staging_ready:
+                self._create_staging_table(cursor)
+            cursor.copy_expert(f"COPY {qn(self.staging_table)} ({columns}) FROM STDIN", buffer)
+
+    def merge(self):
+        """Moves the staging table into the target table and empties it."""
+        if not self.staging_ready:
+            return
+        if self.upsert:
+            self._merge_upsert()
+            return
+        qn = connections[self.using].ops.quote_name
+        columns = ", ".join(qn(c) for c in self.columns)
+        pk_column = qn(self.model_class._meta.pk.column)
+        # The first row of each id in the file wins, whatever order the rows were staged in
+        merge = (
+            f"INSERT INTO {qn(self.table)} ({columns}) "
+            f"SELECT DISTINCT ON ({pk_column}) {columns} FROM {qn(self.staging_table)} "
+            f"ORDER BY {pk_column}, {STAGING_ORDER_COLUMN} "
+            f"ON CONFLICT ({pk_column}) DO NOTHING"
+        )
+        with connections[self.using].cursor() as cursor:
+            if self.summaries:
+                # Feed the rows that were really inserted to the summaries in the same statement
+                returning = sorted({qn(c) for summary in self.summaries for c in summary.columns})
+                ctes = [f"inserted AS ({merge} RETURNING {', '.join(returning)})"]
+                ctes += [f"summary_{i} AS ({summary.sql('inserted')})" for i, summary in enumerate(self.summaries)]
+                cursor.execute(f"WITH {', '.join(ctes)} SELECT COUNT(*) FROM inserted")
+                self.merged = cursor.fetchone()[0]
+            else:
+                cursor.execute(merge)
+                self.merged = cursor.rowcount
+            cursor.execute(f"TRUNCATE {qn(self.staging_table)}")
+
+    def _merge_upsert(self):
+        qn = connections[self.using].ops.quote_name
+        table = qn(self.table)
+        pk_column = qn(self.model_class._meta.pk.column)
+        columns = [qn(c) for c in self.columns]
+        values = [c for c in columns if c != pk_column]
+        column_list = ", ".join(columns)
+
+        def row(alias):
+            return f"({', '.join(f'{alias}.{c}' for c in values)})"
+
+        ctes = [
+            # One row per id, the first one loaded
+            f"source AS (SELECT DISTINCT ON ({pk_column}) {column_list} FROM {qn(self.staging_table)} "
+            f"ORDER BY {pk_column}, {STAGING_ORDER_COLUMN})"
+        ]
+        returning = sorted({qn(c) for summary in self.summaries for c in summary.columns})
+        if self.summaries:
+            # The current values of the rows about to change, for the summaries to take out
+            ctes.append(
+                f"previous AS (SELECT {', '.join(f't.{c}' for c in returning)} FROM {table} t "
+                f"JOIN source s ON t.{pk_column} = s.{pk_column} WHERE {row('t')} IS DISTINCT FROM {row('s')})"
+            )
+        # xmax is 0 only for freshly inserted row versions
+        ctes.append(
+            f"upserted AS (INSERT INTO {table} ({column_list}) SELECT {column_list} FROM source "
+            f"ON CONFLICT ({pk_column}) DO UPDATE SET {', '.join(f'{c} = EXCLUDED.{c}' for c in values)} "
+            f"WHERE {row(table)} IS DISTINCT FROM {row('EXCLUDED')} "
+            f"RETURNING {', '.join([*returning, '(xmax = 0) AS inserted'])})"
+        )
+        ctes += [
+            f"summary_{i} AS ({summary.sql('upserted', removed='previous')})"
+            for i, summary in enumerate(self.summaries)
+        ]
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"WITH {', '.join(ctes)} SELECT (SELECT COUNT(*) FROM source), "
+                f"COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM upserted"
+            )
+            distinct, self.inserted, self.updated = cursor.fetchone()
+            self.unchanged = distinct - self.inserted - self.updated
+            cursor.execute(f"TRUNCATE {qn(self.staging_table)}")
+
+
+class BulkCreateIngestEngine(BaseIngestEngine):
+    """
+    Fallback for backends without COPY: bulk_create(ignore_conflicts=True), with
+    the existing ids of each batch looked up first so the counts stay exact.
+    When upserting, the existing rows are compared in Python and only the
+    changed ones are written back with bulk_update.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen_ids = set()
+
+    def max_batch_rows(self):
+        # One bind parameter per value in bulk_create / bulk_update
+        return MAX_QUERY_PARAMETERS // len(self.fields)
+
+    def write_batch(self, batch):
+        # Estimated from the first row, as the size of its COPY text
+        self.batch_bytes = len(batch) * sum(len(_copy_value(value)) + 1 for value in batch[0])
+        with self.timings.stage("write"):
+            if self.upsert:
+                self._upsert_batch(batch)
+            else:
+                self._insert_batch(batch)
+
+    def _instance(self, row):
+        return self.model_class(**dict(zip(self.fields, row)))
+
+    def _as_dicts(self, rows):
+        # Rows as the summaries take them; only built when there are summaries
+        return [dict(zip(self.fields, row)) for row in rows] if self.summaries else []
+
+    def _insert_batch(self, batch):
+        # Rows stay tuples; model instances are only built for the rows to insert
+        pk_index = self.fields.index(self.model_class._meta.pk.name)
+        manager = self.model_class.objects.using(self.using)
+        existing = set(manager.filter(pk__in={row[pk_index] for row in batch}).values_list("pk", flat=True))
+        new_rows = {}
+        for row in batch:
+            if row[pk_index] not in existing:
+                new_rows.setdefault(row[pk_index], row)
+        self.merged += len(new_rows)
+        with self.timings.stage("batch_build"):
+            objects = [self._instance(row) for row in new_rows.values()]
+        manager.bulk_create(objects, ignore_conflicts=True)
+        rows = self._as_dicts(new_rows.values())
+        for summary in self.summaries:
+            summary.apply(rows, using=self.using)
+
+    def _upsert_batch(self, batch):
+        pk_index = self.fields.index(self.model_class._meta.pk.name)
+        rows = {}
+        for row in batch:
+            if row[pk_index] not in self.seen_ids:
+                self.seen_ids.add(row[pk_index])
+                rows[row[pk_index]] = row
+        manager = self.model_class.objects.using(self.using)
+        existing = manager.in_bulk(list(rows))
+        new_rows, changed_rows, changed, previous_rows = [], [], [], []
+        for pk, row in rows.items():
+            current = existing.get(pk)
+            if current is None:
+                new_rows.append(row)
+            elif any(getattr(current, field) != value for field, value in zip(self.fields, row)):
+                if self.summaries:
+                    previous_rows.append({field: getattr(current, field) for field in self.fields})
+                # The instance just loaded takes the new values, rather than building another one
+                for field, value in zip(self.fields, row):
+                    setattr(current, field, value)
+                changed.append(current)
+                changed_rows.append(row)
+            else:
+                self.unchanged += 1
+        manager.bulk_create([self._instance(row) for row in new_rows])
+        update_fields = [field for field in self.fields if field != self.model_class._meta.pk.name]
+        manager.bulk_update(changed, update_fields)
+        self.inserted += len(new_rows)
+        self.updated += len(changed_rows)
+        rows = self._as_dicts(new_rows + changed_rows)
+        for summary in self.summaries:
+            summary.apply(rows, using=self.using, removed=previous_rows)
+
+
+# Load position of the staging rows; the upsert merge keeps the first row of each id
+STAGING_ORDER_COLUMN = "_row"
+
+
+def _staging_columns(table):
+    return f"LIKE {table} INCLUDING DEFAULTS, {STAGING_ORDER_COLUMN} bigint NOT NULL"
+
+
+def create_staging_table(model_class, using="default"):
+    """
+    Creates an UNLOGGED copy of the model table that outlives the transaction and
+    is visible to every connection, and returns its name. Drop it with drop_staging_table.
+    """
+    qn = connections[using].ops.quote_name
+    name = f"{model_class._meta.db_table}_staging_{uuid.uuid4().hex[:12]}"
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"CREATE UNLOGGED TABLE {qn(name)} ({_staging_columns(qn(model_class._meta.db_table))})")
+    return name
+
+
+def drop_staging_table(name, using="default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {connections[using].ops.quote_name(name)}")
+
+
+def get_ingest_engine(
+    model_class, fields, using="default", batch_size=1000, summaries=(), staging_table=None, upsert=False, first_position=1,
+    timings=None,
+):
+    options = {"using": using, "batch_size": batch_size, "summaries": summaries, "upsert": upsert, "timings": timings}
+    if connections[using].vendor == "postgresql":
+        return PostgresCopyIngestEngine(
+            model_class, fields, staging_table=staging_table, first_position=first_position, **options
+        )
+    return BulkCreateIngestEngine(model_class, fields, **options)
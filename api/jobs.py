@@ -0,0 +1,153 @@
+"""
+Background ingestion jobs.
+
+Uploads that are too large to process inside the request are stored with the
+default file storage, recorded as an `IngestJob` and run by a thread pool local
+to the web process (no external broker). Job state lives in the database, so it
+can be polled from any process. The executor is started when a serving process
+starts (ApiConfig.ready), and its first task picks up the queued and interrupted
+jobs left by the previous run.
+"""
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import formats
+from .models import IngestJob
+from .parallel import ingest_file
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.INGEST_JOB_WORKERS, thread_name_prefix="ingest-job"
+            )
+            _executor.submit(_resume_at_start, _executor)
+    return _executor
+
+
+def _resume_at_start(executor):
+    try:
+        resume_pending_jobs(executor)
+    finally:
+        connection.close() # This pool thread's connection
+
+
+def resume_pending_jobs(executor):
+    # Running jobs that stopped reporting progress were interrupted (their ingest
+    # transaction was rolled back with the process), so they start over.
+    stale_before = timezone.now() - timedelta(seconds=settings.INGEST_JOB_STALE_SECONDS)
+    IngestJob.objects.filter(state=IngestJob.RUNNING, updated_at__lt=stale_before).update(
+        state=IngestJob.QUEUED, rows_processed=0, started_at=None
+    )
+    for job_id in IngestJob.objects.filter(state=IngestJob.QUEUED).values_list("pk", flat=True):
+        executor.submit(run_job, job_id)
+
+
+def local_path(name):
+    """Filesystem path of a stored file, or None if the storage isn't local."""
+    try:
+        return default_storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def create_job(table, file_obj, parallel="", strict_references=True, mode="insert"):
+    """Stores the uploaded file and queues a job for it once the transaction commits."""
+    file_path = default_storage.save(f"ingest_jobs/{uuid.uuid4().hex}_{file_obj.name}", file_obj)
+    job = IngestJob.objects.create(
+        table=table, file_name=file_obj.name, file_path=file_path, parallel=parallel,
+        strict_references=strict_references, mode=mode,
+    )
+    transaction.on_commit(lambda: enqueue(job.pk))
+    return job
+
+
+def enqueue(job_id):
+    if settings.INGEST_JOBS_EAGER:
+        run_job(job_id)
+    else:
+        get_executor().submit(run_job, job_id)
+
+
+class ProgressReporter(threading.Thread):
+    """
+    Periodically saves the number of rows processed by a running job. It runs on
+    its own thread (and so its own DB connection), which makes progress visible
+    while the job's ingest transaction is still open.
+    """
+
+    def __init__(self, job_id, interval):
+        super().__init__(daemon=True, name=f"ingest-job-{job_id}-progress")
+        self.job_id = job_id
+        self.interval = interval
+        self.rows = 0
+        self.stopped = threading.Event()
+
+    def __call__(self, rows):
+        self.rows = rows
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                IngestJob.objects.filter(pk=self.job_id).update(rows_processed=self.rows, updated_at=timezone.now())
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job_id):
+    from .views import UPLOAD_VIEWS
+
+    # Claim the job; another worker (or process) may already have picked it up
+    claimed = IngestJob.objects.filter(pk=job_id, state=IngestJob.QUEUED).update(
+        state=IngestJob.RUNNING, started_at=timezone.now(), updated_at=timezone.now()
+    )
+    if not claimed:
+        return
+    job = IngestJob.objects.get(pk=job_id)
+    reporter = ProgressReporter(job_id, settings.INGEST_JOB_PROGRESS_SECONDS)
+    reporter.start()
+    try:
+        view = UPLOAD_VIEWS[job.table]()
+        file_format = formats.detect_format(job.file_name) or "csv"
+        # Compressed and columnar files can't be split into byte ranges
+        file_path = local_path(job.file_path) if job.parallel and file_format == "csv" else None
+        if file_path:
+            payload, status_code = ingest_file(
+                view, file_path, parallel=job.parallel, progress=reporter, strict=job.strict_references, mode=job.mode
+            )
+        else:
+            with default_storage.open(job.file_path, "rb") as file_obj:
+                source = file_obj if file_format in formats.COLUMNAR_FORMATS else file_obj.chunks()
+                payload, status_code = view.ingest(
+                    source, progress=reporter, strict=job.strict_references, mode=job.mode, file_format=file_format
+                )
+        job.result = payload
+        job.errors = payload.get("errors", [])
+        job.state = IngestJob.SUCCEEDED
+    except Exception as e:
+        job.errors = [f"An error occurred: {str(e)}"]
+        job.state = IngestJob.FAILED
+    finally:
+        reporter.stop()
+    job.rows_processed = reporter.rows
+    job.finished_at = timezone.now()
+    job.save()
+    default_storage.delete(job.file_path)
+    if not settings.INGEST_JOBS_EAGER:
+        connection.close()
@@ -0,0 +1,67 @@
+import csv
+import io
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.batching import AdaptiveBatchSize, record_batch_sizes
+from api.management.commands.bench_validation import VIEWS, synthetic_rows
+
+DEFAULT_SIZES = "250,500,1000,2000,5000,10000,20000,50000"
+# Stages whose time depends on the batch size (see api/metrics.py)
+WRITE_STAGES = ("batch_build", "write", "merge")
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads synthetic rows into each table with a range of fixed batch sizes and "
+        "records the fastest size per table in INGEST_BATCH_SIZES_FILE, where the "
+        "uploads start from. Every load is rolled back, so the tables are left as they were."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", action="append", choices=sorted(VIEWS), help="Repeat for several; all tables by default.")
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma separated batch sizes to try.")
+        parser.add_argument("--repeat", type=int, default=3, help="Loads per size; the median is used.")
+        parser.add_argument("--no-record", action="store_true", help="Only print the results.")
+
+    def handle(self, *args, **options):
+        sizes = sorted({int(size) for size in options["sizes"].split(",")})
+        best = {}
+        for table in options["table"] or sorted(VIEWS):
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerows(synthetic_rows(table, options["rows"], invalid_ratio=0))
+            content = buffer.getvalue().encode()
+
+            self.stdout.write(f"{table}: {options['rows']:,} rows, median of {options['repeat']} loads")
+            self.stdout.write(f"{'batch size':>12}{'write rows/s':>16}{'total rows/s':>16}")
+            results = {size: self.measure(table, content, options, lambda size=size: size) for size in sizes}
+            for size, (write_rate, total_rate) in results.items():
+                self.stdout.write(f"{size:>12}{write_rate:>16,.0f}{total_rate:>16,.0f}")
+            best[table] = max(results, key=lambda size: results[size][0])
+            write_rate, total_rate = self.measure(table, content, options, lambda: AdaptiveBatchSize(best[table]))
+            self.stdout.write(f"{'adaptive':>12}{write_rate:>16,.0f}{total_rate:>16,.0f}")
+            self.stdout.write(f"best: {best[table]}\n")
+
+        if not options["no_record"]:
+            record_batch_sizes(best)
+            self.stdout.write(f"Recorded {best}.")
+
+    def measure(self, table, content, options, batch_size):
+        """Median (rows/s of the write stages, rows/s overall) of loading `content`."""
+        view = VIEWS[table]()
+        view.ingest_batch_size = batch_size # Fixed size, or a fresh AdaptiveBatchSize per load
+        write_rates, total_rates = [], []
+        for _ in range(options["repeat"]):
+            with transaction.atomic():
+                payload, _ = view.ingest(self.chunks(content), strict=False)
+                transaction.set_rollback(True)
+            seconds = payload["timings"]["seconds"]
+            write_rates.append(options["rows"] / sum(seconds.get(stage, 0) for stage in WRITE_STAGES))
+            total_rates.append(options["rows"] / seconds["total"])
+        return statistics.median(write_rates), statistics.median(total_rates)
+
+    def chunks(self, content, size=64 * 1024):
+        return (content[i:i + size] for i in range(0, len(content), size))
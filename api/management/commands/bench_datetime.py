@@ -0,0 +1,79 @@
+import random
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from api.models import HiredEmployee
+from api.validation import DATETIME_FORMAT, ColumnarValidator, parse_upload_datetime
+
+
+def legacy_column_datetimes(column):
+    # The columnar validation before: regex check, then pd.to_datetime and to_pydatetime
+    matched = column.str.fullmatch(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z").eq(True).to_numpy()
+    parsed = pd.DatetimeIndex(pd.to_datetime(column.where(matched), format=DATETIME_FORMAT, errors="coerce", utc=True))
+    return parsed.to_pydatetime(), matched & ~parsed.isna()
+
+
+def synthetic_datetimes(count, invalid_ratio):
+    rng = random.Random(0)
+    for _ in range(count):
+        if rng.random() < invalid_ratio:
+            yield "2021-13-01T00:00:00Z"
+        else:
+            yield f"2021-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}Z"
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-row cost of parsing the upload datetimes, before and after the fromisoformat fast path, "
+        "in the row validation (validate_row) and in the columnar validation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--invalid-ratio", type=float, default=0.01)
+
+    def handle(self, *args, **options):
+        values = list(synthetic_datetimes(options["rows"], options["invalid_ratio"]))
+        column = pd.Series(values, dtype=object)
+        validator = ColumnarValidator(HiredEmployee, ["datetime"])
+        model_field = HiredEmployee._meta.get_field("datetime")
+
+        def run(parse):
+            parsed = []
+            for value in values:
+                try:
+                    parsed.append(parse(value))
+                except ValueError:
+                    parsed.append(None)
+            return parsed
+
+        legacy_row, legacy_row_parsed = self.measure(lambda: run(parse_datetime), result=True)
+        row, row_parsed = self.measure(lambda: run(parse_upload_datetime), result=True)
+        legacy_columnar, (legacy_parsed, legacy_matched) = self.measure(lambda: legacy_column_datetimes(column), result=True)
+        columnar, (parsed, matched) = self.measure(lambda: validator._validate_column(column, model_field), result=True)
+
+        # Both versions of each path must accept the same values and give the same datetimes
+        if row_parsed != legacy_row_parsed:
+            raise CommandError("The row validation parsed the values differently from parse_datetime.")
+        if not np.array_equal(legacy_matched, matched) or list(legacy_parsed[legacy_matched]) != list(parsed[matched]):
+            raise CommandError("The columnar validation parsed the values differently from pd.to_datetime.")
+
+        count = len(values)
+        self.stdout.write(f"{count:,} values, {options['invalid_ratio']:.0%} invalid (ns per row)")
+        self.stdout.write(f"{'':<12}{'before':>12}{'after':>12}{'speedup':>10}")
+        for name, before, after in (("row", legacy_row, row), ("columnar", legacy_columnar, columnar)):
+            self.stdout.write(f"{name:<12}{before / count * 1e9:>12,.0f}{after / count * 1e9:>12,.0f}{before / after:>9.1f}x")
+
+    def measure(self, function, repeat=3, result=False):
+        """Best wall time of `repeat` calls (and the last result if `result`)."""
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            value = function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return (best, value) if result else best
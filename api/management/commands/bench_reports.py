@@ -0,0 +1,129 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.reports import DEFAULT_YEAR, departments_above_average_query, hires_by_period_query
+
+# The report queries as they were before the index and the half-open ranges
+LEGACY_HIRES_BY_QUARTER_SQL = """
+    SELECT d.department, j.job,
+    COUNT(*) FILTER (WHERE EXTRACT(quarter FROM h.datetime) = 1) AS "Q1",
+    COUNT(*) FILTER (WHERE EXTRACT(quarter FROM h.datetime) = 2) AS "Q2",
+    COUNT(*) FILTER (WHERE EXTRACT(quarter FROM h.datetime) = 3) AS "Q3",
+    COUNT(*) FILTER (WHERE EXTRACT(quarter FROM h.datetime) = 4) AS "Q4"
+    FROM api_hiredemployee h
+    INNER JOIN api_department d ON h.department_id = d.id
+    INNER JOIN api_job j ON h.job_id = j.id
+    WHERE EXTRACT(year FROM h.datetime) = %(year)s
+    GROUP BY d.department, j.job
+    ORDER BY d.department, j.job;
+"""
+
+LEGACY_DEPARTMENTS_ABOVE_AVERAGE_SQL = """
+    WITH DepartmentHires AS (
+        SELECT d.id, d.department, COUNT(he.id) AS hired_count
+        FROM api_department d
+        JOIN api_hiredemployee he ON d.id = he.department_id
+        WHERE EXTRACT(YEAR FROM he.datetime) = %(year)s
+        GROUP BY d.id, d.department
+    ),
+    AverageHires AS (SELECT AVG(hired_count) AS avg_hires FROM DepartmentHires)
+    SELECT dh.id, dh.department, dh.hired_count AS hired
+    FROM DepartmentHires dh, AverageHires avg
+    WHERE dh.hired_count > avg.avg_hires
+    ORDER BY dh.hired_count DESC;
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds synthetic hires and prints the latency of the report queries before "
+        "(EXTRACT filters, no index) and after (half-open ranges, composite index). "
+        "The seeded rows are deleted afterwards unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--millions", type=float, default=1.0, help="Synthetic hires to seed, in millions.")
+        parser.add_argument("--departments", type=int, default=12)
+        parser.add_argument("--jobs", type=int, default=183)
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query; the median is reported.")
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded rows.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            self.stderr.write("bench_reports needs PostgreSQL.")
+            return
+        hires = int(options["millions"] * 1_000_000)
+        repeat = options["repeat"]
+        legacy = {"year": DEFAULT_YEAR}
+        cases = [
+            ("hires_by_quarter", LEGACY_HIRES_BY_QUARTER_SQL, legacy, *hires_by_period_query(DEFAULT_YEAR)),
+            ("departments_above_average", LEGACY_DEPARTMENTS_ABOVE_AVERAGE_SQL, legacy, *departments_above_average_query(DEFAULT_YEAR)),
+        ]
+
+        with connection.cursor() as cursor:
+            seeded = self.seed(cursor, hires, options["departments"], options["jobs"])
+            try:
+                # VACUUM sets the visibility map so the index can serve index-only scans
+                cursor.execute("VACUUM ANALYZE api_hiredemployee")
+
+                # "Before": keep the planner off every index on the table
+                with transaction.atomic():
+                    for setting in ("enable_indexscan", "enable_indexonlyscan", "enable_bitmapscan"):
+                        cursor.execute(f"SET LOCAL {setting} = off")
+                    before = {
+                        name: (self.time(cursor, old_sql, old_params, repeat), self.time(cursor, sql, params, repeat))
+                        for name, old_sql, old_params, sql, params in cases
+                    }
+                after = {name: self.time(cursor, sql, params, repeat) for name, _, _, sql, params in cases}
+            finally:
+                if not options["keep"]:
+                    self.cleanup(cursor, seeded)
+
+        self.stdout.write(f"{hires:,} synthetic hires, median of {repeat} runs (ms)")
+        self.stdout.write(f"{'query':<28}{'legacy, no index':>18}{'ranges, no index':>18}{'ranges + index':>16}")
+        for name, _, _, _, _ in cases:
+            legacy_ms, ranges_ms = before[name]
+            self.stdout.write(f"{name:<28}{legacy_ms:>18.1f}{ranges_ms:>18.1f}{after[name]:>16.1f}")
+
+    def seed(self, cursor, hires, departments, jobs):
+        """Inserts the synthetic rows and returns what is needed to delete them again."""
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM api_hiredemployee")
+        first_id = cursor.fetchone()[0] + 1
+        cursor.execute(
+            "INSERT INTO api_department (id, department) SELECT g, 'Department ' || g "
+            "FROM generate_series(1, %s) g ON CONFLICT (id) DO NOTHING RETURNING id", [departments]
+        )
+        department_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "INSERT INTO api_job (id, job) SELECT g, 'Job ' || g "
+            "FROM generate_series(1, %s) g ON CONFLICT (id) DO NOTHING RETURNING id", [jobs]
+        )
+        job_ids = [row[0] for row in cursor.fetchall()]
+        # Hires spread over 2019-2023, so roughly a fifth of them fall in the report year
+        cursor.execute(
+            "INSERT INTO api_hiredemployee (id, name, datetime, department_id, job_id) "
+            "SELECT g, 'Synthetic ' || g, "
+            "timestamptz '2019-01-01 00:00:00+00' + random() * interval '5 years', "
+            "1 + floor(random() * %s)::int, 1 + floor(random() * %s)::int "
+            "FROM generate_series(%s, %s) g",
+            [departments, jobs, first_id, first_id + hires - 1],
+        )
+        return first_id, first_id + hires - 1, department_ids, job_ids
+
+    def cleanup(self, cursor, seeded):
+        first_id, last_id, department_ids, job_ids = seeded
+        cursor.execute("DELETE FROM api_hiredemployee WHERE id BETWEEN %s AND %s", [first_id, last_id])
+        cursor.execute("DELETE FROM api_department WHERE id = ANY(%s)", [department_ids])
+        cursor.execute("DELETE FROM api_job WHERE id = ANY(%s)", [job_ids])
+
+    def time(self, cursor, sql, params, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
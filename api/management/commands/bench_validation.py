@@ -0,0 +1,56 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.views import DepartmentUploadView, HiredEmployeeUploadView, JobUploadView
+
+VIEWS = {
+    "departments": DepartmentUploadView,
+    "jobs": JobUploadView,
+    "employees": HiredEmployeeUploadView,
+}
+
+
+def synthetic_rows(table, count, invalid_ratio):
+    rng = random.Random(0)
+    # Start well above any real id so the uniqueness checks find no matches
+    for i in range(10**9, 10**9 + count):
+        if rng.random() < invalid_ratio:
+            yield [str(i), "", "2021-13-01T00:00:00Z", "x", "1"][:len(VIEWS[table].expected_header)]
+        elif table == "employees":
+            yield [str(i), f"Employee {i}", f"2021-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T08:30:00Z", str(rng.randint(1, 12)), str(rng.randint(1, 180))]
+        else:
+            yield [str(i), f"Name {i}"]
+
+
+class Command(BaseCommand):
+    help = "Compares the per-row serializer validation against the columnar (pandas) validation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", choices=sorted(VIEWS), default="employees")
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--invalid-ratio", type=float, default=0.01)
+
+    def handle(self, *args, **options):
+        view = VIEWS[options["table"]]()
+        rows = list(synthetic_rows(options["table"], options["rows"], options["invalid_ratio"]))
+
+        errors = []
+        start = time.perf_counter()
+        serializer_valid = sum(
+            1 for row_number, row in enumerate(rows, start=1)
+            if view.validate_row(row_number, row, errors) is not None
+        )
+        serializer_time = time.perf_counter() - start
+
+        columnar_errors = []
+        start = time.perf_counter()
+        columnar_valid = sum(1 for _ in view.validated_rows(rows, columnar_errors))
+        columnar_time = time.perf_counter() - start
+
+        if columnar_errors != errors or columnar_valid != serializer_valid:
+            self.stderr.write("The two validation paths disagree.")
+        for label, valid, elapsed in (("serializer", serializer_valid, serializer_time), ("columnar", columnar_valid, columnar_time)):
+            self.stdout.write(f"{label:>10}: {valid} valid / {len(rows)} rows in {elapsed:.3f}s ({len(rows) / elapsed:,.0f} rows/s)")
+        self.stdout.write(f"speedup: {serializer_time / columnar_time:.1f}x")
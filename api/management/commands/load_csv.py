@@ -0,0 +1,120 @@
+import argparse
+import glob
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from api import formats, materialized
+from api.parallel import MODES, ingest_file, ingest_paths
+from api.views import UPLOAD_MODES, UPLOAD_VIEWS
+
+# Referenced tables first, so strict mode finds the departments and jobs of the employees
+TABLE_ORDER = ["departments", "jobs", "employees"]
+# Table of a file whose table isn't given, by a word in its name (e.g. hired_employees.csv)
+TABLE_NAMES = {"departments": "department", "jobs": "job", "employees": "employee"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads local files into the tables with the same validation and ingest engine as the upload "
+        "endpoints, without going through HTTP. Each --path is a file, a directory or a glob; departments "
+        "and jobs are loaded before employees, and the files of a table in parallel."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", action="append", required=True, help="File, directory or glob; repeat for several.")
+        parser.add_argument("--table", choices=TABLE_ORDER, help="Table of every file; by default it's taken from each file name.")
+        parser.add_argument("--workers", type=int, help="Worker processes (INGEST_PARALLEL_WORKERS by default).")
+        parser.add_argument(
+            "--parallel", choices=MODES, default="chunks",
+            help="How a table's only CSV file is split across the workers (see api/parallel.py).",
+        )
+        parser.add_argument("--mode", choices=UPLOAD_MODES, default="insert")
+        parser.add_argument("--strict", action=argparse.BooleanOptionalAction, default=None, help="Reject rows with dangling references (INGEST_STRICT_REFERENCES by default).")
+        parser.add_argument("--max-errors", type=int, default=20, help="Row errors printed per file.")
+
+    def handle(self, *args, **options):
+        if not apps.get_app_config("api").check_schema():
+            raise CommandError("Database schema is not up to date. Run `python manage.py migrate`.")
+        files = self.files_by_table(options["path"], options["table"])
+
+        started = time.perf_counter()
+        total_rows = failed = 0
+        for table in TABLE_ORDER:
+            if table not in files:
+                continue
+            view = UPLOAD_VIEWS[table]()
+            table_started = time.perf_counter()
+            table_rows = 0
+            for path, payload, status_code, seconds in self.load(view, files[table], options):
+                rows = payload.get("timings", {}).get("rows", 0)
+                table_rows += rows
+                errors = payload.get("errors", [])
+                failed += bool(errors)
+                self.stdout.write(
+                    f"{table} {path}: {rows:,} rows, {payload.get('merged', 0):,} loaded, {len(errors):,} errors "
+                    f"in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)"
+                )
+                for error in errors[:options["max_errors"]]:
+                    self.stderr.write(f"  {error}")
+                if len(errors) > options["max_errors"]:
+                    self.stderr.write(f"  ... and {len(errors) - options['max_errors']:,} more")
+            seconds = time.perf_counter() - table_started
+            total_rows += table_rows
+            self.stdout.write(f"{table}: {table_rows:,} rows in {seconds:.1f}s ({table_rows / max(seconds, 1e-9):,.0f} rows/s)")
+
+        seconds = time.perf_counter() - started
+        self.stdout.write(f"Total: {total_rows:,} rows in {seconds:.1f}s ({total_rows / max(seconds, 1e-9):,.0f} rows/s)")
+        # This process would exit before the debounced refresh of the report views
+        if materialized.run_pending_refresh():
+            self.stdout.write("Refreshed the report views.")
+        if failed:
+            raise CommandError(f"{failed} file(s) finished with errors.")
+
+    def load(self, view, paths, options):
+        """Yields (path, payload, status code, seconds) for each file of a table."""
+        if len(paths) == 1 and formats.detect_format(paths[0]) == "csv":
+            # A single plain CSV file is split into byte ranges instead
+            started = time.perf_counter()
+            try:
+                payload, status_code = ingest_file(
+                    view, paths[0], parallel=options["parallel"], workers=options["workers"],
+                    strict=options["strict"], mode=options["mode"],
+                )
+            except Exception as e:
+                payload, status_code = {"errors": [f"An error occurred: {str(e)}"]}, None
+            yield paths[0], payload, status_code, time.perf_counter() - started
+        else:
+            yield from ingest_paths(view, paths, workers=options["workers"], strict=options["strict"], mode=options["mode"])
+
+    def files_by_table(self, patterns, table=None):
+        files = {}
+        for pattern in patterns:
+            if os.path.isdir(pattern):
+                # Only the files of a directory in a supported format
+                paths = [
+                    path for path in sorted(glob.glob(os.path.join(pattern, "*")))
+                    if os.path.isfile(path) and formats.detect_format(path)
+                ]
+            else:
+                paths = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+            if not paths:
+                raise CommandError(f"No files found at {pattern}.")
+            for path in paths:
+                if not os.path.isfile(path):
+                    raise CommandError(f"{path} is not a file.")
+                if formats.detect_format(path) is None:
+                    raise CommandError(f"{path}: not a CSV (optionally .csv.gz or .csv.zst), Parquet or Arrow file.")
+                path_table = table or self.table_of(path)
+                if path not in files.setdefault(path_table, []):
+                    files[path_table].append(path)
+        return files
+
+    def table_of(self, path):
+        name = os.path.basename(path).lower()
+        matches = [table for table, word in TABLE_NAMES.items() if word in name]
+        if len(matches) != 1:
+            raise CommandError(f"Can't tell the table of {path} from its name; use --table.")
+        return matches[0]
@@ -0,0 +1,170 @@
+import itertools
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+DEFAULT_CONFIGS = [
+    "runserver:conn=0",
+    "gunicorn:workers=2,threads=1,conn=0",
+    "gunicorn:workers=2,threads=4,conn=60",
+    "gunicorn:workers=4,threads=4,conn=60",
+    "uvicorn:workers=4",
+]
+
+# (label, method, path); upload bodies are generated per request
+ENDPOINTS = [
+    ("hires_by_quarter (cached)", "GET", "/api/query/hires_by_quarter/"),
+    ("hires_by_quarter (stream)", "GET", "/api/query/hires_by_quarter/?stream=1"),
+    ("departments_above_average", "GET", "/api/query/departments_above_average/?stream=1"),
+    ("hires_by_month (live)", "GET", "/api/query/hires_by_quarter/?granularity=month&stream=1"),
+    ("upload departments", "POST", "/api/upload/departments/?background=0"),
+]
+
+
+def parse_config(config):
+    """'gunicorn:workers=4,threads=4,conn=60' -> ('gunicorn', {'workers': 4, ...})"""
+    server, _, options = config.partition(":")
+    if server not in ("runserver", "gunicorn", "uvicorn"):
+        raise CommandError(f"Unknown server '{server}' in '{config}'. Use runserver, gunicorn or uvicorn.")
+    values = {"workers": 1, "threads": 1, "conn": 0}
+    for option in filter(None, options.split(",")):
+        name, _, value = option.partition("=")
+        if name not in values:
+            raise CommandError(f"Unknown option '{name}' in '{config}'. Use workers, threads or conn.")
+        values[name] = int(value)
+    return server, values
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests the query and upload endpoints under several server configurations "
+        "(runserver, gunicorn (WSGI) or uvicorn (ASGI, async report views), workers, threads, "
+        "CONN_MAX_AGE) and prints p50/p99 latency "
+        "and requests per second. Runs against a throwaway database created next to the "
+        "configured one, seeded with synthetic data and dropped at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--config", action="append", dest="configs", help=f"Server configuration; repeatable. Default: {' '.join(DEFAULT_CONFIGS)}")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and configuration.")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--millions", type=float, default=0.1, help="Synthetic hires to seed, in millions.")
+        parser.add_argument("--upload-rows", type=int, default=100, help="Rows per upload request.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("loadtest needs PostgreSQL.")
+        configs = [parse_config(config) for config in options["configs"] or DEFAULT_CONFIGS]
+        database = f"loadtest_{uuid.uuid4().hex[:8]}"
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE DATABASE "{database}"')
+        cache_dir = tempfile.mkdtemp(prefix="loadtest_cache_")
+        env = {
+            **os.environ,
+            "POSTGRES_DB": database,
+            "CACHE_BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "CACHE_LOCATION": cache_dir,
+        }
+        try:
+            self.manage(env, "migrate", "--noinput")
+            self.manage(env, "bench_reports", "--keep", "--repeat", "1", "--millions", str(options["millions"]))
+            self.manage(env, "rebuild_hires_summary")
+            upload_ids = itertools.count(10**8)
+            results = []
+            for server, values in configs:
+                label = f"{server} workers={values['workers']} threads={values['threads']} conn_max_age={values['conn']}"
+                self.stdout.write(f"Running {label} ...")
+                results.append((label, self.run_config(server, values, env, options, upload_ids)))
+        finally:
+            connection.close()
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)')
+
+        self.stdout.write(f"\n{options['requests']} requests per endpoint, concurrency {options['concurrency']}")
+        self.stdout.write(f"{'configuration / endpoint':<58}{'p50 ms':>9}{'p99 ms':>9}{'req/s':>9}{'errors':>8}")
+        for label, rows in results:
+            self.stdout.write(label)
+            for endpoint, p50, p99, rps, errors in rows:
+                self.stdout.write(f"  {endpoint:<56}{p50:>9.1f}{p99:>9.1f}{rps:>9.1f}{errors:>8}")
+
+    def manage(self, env, *args):
+        subprocess.run([sys.executable, "manage.py", *args], cwd=settings.BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    def run_config(self, server, values, env, options, upload_ids):
+        port = free_port()
+        env = {**env, "DB_CONN_MAX_AGE": str(values["conn"])}
+        if server == "runserver":
+            command = [sys.executable, "manage.py", "runserver", "--noreload", f"127.0.0.1:{port}"]
+        elif server == "gunicorn":
+            command = [sys.executable, "-m", "gunicorn", "globant_challenge.wsgi:application", "-c", "gunicorn.conf.py"]
+            env.update({
+                "GUNICORN_BIND": f"127.0.0.1:{port}",
+                "WEB_CONCURRENCY": str(values["workers"]),
+                "GUNICORN_THREADS": str(values["threads"]),
+                "GUNICORN_ACCESS_LOG": "",
+            })
+        else:
+            # The ASGI app serves the reports with the async views; uploads still run on threads
+            command = [
+                sys.executable, "-m", "uvicorn", "globant_challenge.asgi:application",
+                "--host", "127.0.0.1", "--port", str(port), "--workers", str(values["workers"]), "--no-access-log",
+            ]
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            self.wait_until_ready(base_url, process)
+            return [self.drive(base_url, endpoint, options, upload_ids) for endpoint in ENDPOINTS]
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    def wait_until_ready(self, base_url, process, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError("The server exited during startup.")
+            try:
+                requests.get(f"{base_url}/api/query/hires_by_quarter/", timeout=5)
+                return
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        raise CommandError("The server did not start in time.")
+
+    def drive(self, base_url, endpoint, options, upload_ids):
+        label, method, path = endpoint
+
+        def call(_):
+            start = time.perf_counter()
+            if method == "POST":
+                body = "".join(f"{next(upload_ids)},Load Test Department\n" for _ in range(options["upload_rows"]))
+                response = requests.post(base_url + path, files={"file": ("departments.csv", body.encode("utf-8"), "text/csv")})
+            else:
+                response = requests.get(base_url + path)
+            response.content
+            return time.perf_counter() - start, response.status_code >= 400
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            samples = list(pool.map(call, range(options["requests"])))
+        elapsed = time.perf_counter() - start
+        latencies = sorted(latency * 1000 for latency, _ in samples)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        errors = sum(1 for _, failed in samples if failed)
+        return label, statistics.median(latencies), p99, len(samples) / elapsed, errors
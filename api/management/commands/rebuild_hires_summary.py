@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api import materialized
+from api.reports import bump_data_version
+from api.summary import rebuild_hires_summary
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the hires summary table (api_hiressummary) from api_hiredemployee."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        buckets = rebuild_hires_summary(using=options["database"])
+        # Cached reports were computed from the old summary
+        bump_data_version("employees")
+        self.stdout.write(f"Rebuilt hires summary: {buckets} buckets.")
+        # This process would exit before the debounced refresh of the report views
+        if materialized.run_pending_refresh():
+            self.stdout.write("Refreshed the report views.")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import materialized
+
+
+class Command(BaseCommand):
+    help = (
+        "Refreshes the materialized views of the 2021 reports now, e.g. from a scheduler when "
+        "REPORT_VIEWS_REFRESH_DELAY_SECONDS is negative."
+    )
+
+    def handle(self, *args, **options):
+        if not materialized.available():
+            raise CommandError("The materialized views need PostgreSQL.")
+        materialized.refresh_report_views()
+        self.stdout.write(f"Refreshed {', '.join(materialized.VIEWS)}.")
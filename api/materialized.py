@@ -0,0 +1,105 @@
+"""
+Materialized views of the 2021 reports (migration 0010).
+
+After every committed change to the report tables (bump_data_version in
+api/reports.py) the views are refreshed with REFRESH MATERIALIZED VIEW
+CONCURRENTLY, which doesn't block the reads. Refreshes are debounced per process:
+the first change schedules one REPORT_VIEWS_REFRESH_DELAY_SECONDS later, and
+every change until it starts is covered by that same refresh, so a burst of
+uploads costs a single refresh. Commands that load data (load_csv,
+rebuild_hires_summary) exit before that timer fires, so they run the pending
+refresh themselves with run_pending_refresh before finishing.
+
+The start time of the last refresh is kept in the cache next to the data versions.
+The report views only read a materialized view when that refresh started after
+the last change to the report's tables; until then they run the live query, so
+the views never serve a result older than the data versions say.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+VIEWS = ["api_report_hires_by_quarter_2021", "api_report_departments_above_average_2021"]
+# [start, end] of the last refresh, in time.time_ns()
+REFRESHED_KEY = "report_views:refreshed"
+
+_timer = None
+_lock = threading.Lock()
+
+
+def available(using="default"):
+    return connections[using].vendor == "postgresql"
+
+
+def refresh_report_views(using="default"):
+    started = time.time_ns()
+    qn = connections[using].ops.quote_name
+    with connections[using].cursor() as cursor:
+        for view in VIEWS:
+            cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {qn(view)}")
+    cache.set(REFRESHED_KEY, [started, time.time_ns()], timeout=None)
+
+
+def schedule_refresh():
+    """Refreshes the views after REPORT_VIEWS_REFRESH_DELAY_SECONDS, unless a refresh is already pending."""
+    global _timer
+    delay = settings.REPORT_VIEWS_REFRESH_DELAY_SECONDS
+    if delay < 0 or not available():
+        return
+    with _lock:
+        if _timer is not None:
+            return # The pending refresh hasn't started, so it will include this change
+        _timer = threading.Timer(delay, _run_scheduled_refresh)
+        _timer.daemon = True
+        _timer.start()
+
+
+def run_pending_refresh():
+    """
+    Runs the scheduled refresh now, if there is one. Returns whether it ran; for
+    processes that exit before the timer would fire.
+    """
+    global _timer
+    with _lock:
+        timer, _timer = _timer, None
+    if timer is None:
+        return False
+    timer.cancel()
+    refresh_report_views()
+    return True
+
+
+def _run_scheduled_refresh():
+    global _timer
+    with _lock:
+        _timer = None # Changes from now on schedule the next refresh
+    try:
+        refresh_report_views()
+    except Exception:
+        logger.exception("Refreshing the report views failed.")
+    finally:
+        connections.close_all() # This thread's connections
+
+
+def _refreshed(refreshed, changed_at):
+    if refreshed is None or refreshed[0] < changed_at:
+        return None
+    return refreshed[1]
+
+
+def refreshed_after(changed_at):
+    """
+    End time (ns) of the last refresh if it started after `changed_at` (ns, the
+    last data version of a report's tables), i.e. if the views have every change; else None.
+    """
+    return _refreshed(cache.get(REFRESHED_KEY), changed_at)
+
+
+async def arefreshed_after(changed_at):
+    return _refreshed(await cache.aget(REFRESHED_KEY), changed_at)
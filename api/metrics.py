@@ -0,0 +1,143 @@
+"""
+Ingest instrumentation.
+
+Every load measures the wall time of each stage of the pipeline with a
+StageTimer and counts the rows and bytes it read. The totals are kept in memory,
+per process, and served in the Prometheus text format at /api/metrics/; a single
+upload can return its own numbers under `timings` (?timings=1).
+
+Stages (the time of a stage never includes the time of another one):
+
+  read            reading the upload (or a Parquet/Arrow record batch)
+  decompress      gzip/zstd decompression
+  decode          bytes -> text, split into lines
+  parse           CSV parsing (csv.reader)
+  validate        columnar validation with pandas
+  parse_datetime  datetime conversion, in either validation path
+  validate_serializer  rows validated one by one through the DRF serializer
+  references      strict mode reference checks
+  batch_build     building the COPY buffer (or model objects) of a batch
+  write           COPY into the staging table (or bulk_create/bulk_update)
+  merge           merge of the staging table into the target table
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+STAGES = [
+    "read", "decompress", "decode", "parse", "validate", "parse_datetime",
+    "validate_serializer", "references", "batch_build", "write", "merge",
+]
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+_END = object()
+
+
+class StageTimer:
+    """
+    Accumulates the seconds spent in each stage of one load. Stages nest: while a
+    stage runs inside another one (e.g. reading a chunk while parsing), the outer
+    stage's clock is paused, so every second is counted once. Also counts the rows
+    and bytes read (`counters`).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = defaultdict(float)
+        self.counters = Counter()
+        self._stack = []
+
+    def start(self, stage):
+        now = time.perf_counter()
+        if self._stack:
+            outer, since = self._stack[-1]
+            self.seconds[outer] += now - since
+        self._stack.append([stage, now])
+
+    def stop(self):
+        now = time.perf_counter()
+        stage, since = self._stack.pop()
+        self.seconds[stage] += now - since
+        if self._stack:
+            self._stack[-1][1] = now
+
+    @contextmanager
+    def stage(self, stage):
+        self.start(stage)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def timed(self, iterable, stage, count_bytes=False):
+        """Yields the items of `iterable`, timing each step under `stage`. Meant for chunks or batches, not rows."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(stage):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            if count_bytes:
+                self.counters["bytes"] += len(item)
+            yield item
+
+    def add(self, timings):
+        """Adds the stage seconds and counters of another load's `as_dict()` (e.g. a part loaded by a worker)."""
+        for stage, seconds in timings["seconds"].items():
+            if stage != "total":
+                self.seconds[stage] += seconds
+        self.counters.update({key: timings[key] for key in ("rows", "bytes")})
+
+    def as_dict(self):
+        seconds = {stage: round(self.seconds[stage], 6) for stage in STAGES if stage in self.seconds}
+        seconds["total"] = round(time.perf_counter() - self.started, 6)
+        return {"seconds": seconds, "rows": self.counters["rows"], "bytes": self.counters["bytes"]}
+
+
+# (metric, labels) -> value, for this process
+_values = defaultdict(float)
+_lock = threading.Lock()
+
+METRICS = {
+    "ingest_stage_seconds_total": ("counter", "Seconds spent in each ingest stage."),
+    "ingest_seconds_total": ("counter", "Wall time of the loads."),
+    "ingest_rows_total": ("counter", "Rows read from the uploaded files."),
+    "ingest_bytes_total": ("counter", "Bytes read from the uploaded files (compressed size)."),
+    "ingest_rows_merged_total": ("counter", "Rows inserted or updated in the tables."),
+    "ingest_uploads_total": ("counter", "Finished loads by response status."),
+}
+
+
+def observe(table, timings, counts=None, status_code=None):
+    """Adds one finished load (or chunk of a load) to the process totals."""
+    data = timings.as_dict()
+    with _lock:
+        for stage, seconds in data["seconds"].items():
+            if stage == "total":
+                _values["ingest_seconds_total", (("table", table),)] += seconds
+            else:
+                _values["ingest_stage_seconds_total", (("table", table), ("stage", stage))] += seconds
+        _values["ingest_rows_total", (("table", table),)] += data["rows"]
+        _values["ingest_bytes_total", (("table", table),)] += data["bytes"]
+        if counts:
+            _values["ingest_rows_merged_total", (("table", table),)] += counts.get("merged", 0)
+        if status_code is not None:
+            _values["ingest_uploads_total", (("table", table), ("status", str(status_code)))] += 1
+
+
+def _labels(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+def render():
+    """The process totals in the Prometheus text exposition format."""
+    with _lock:
+        values = sorted(_values.items())
+    lines = []
+    for metric, (kind, description) in METRICS.items():
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for (name, labels), value in values:
+            if name == metric:
+                lines.append(f"{metric}{{{_labels(labels)}}} {value!r}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-17 20:50
+
+from django.db import migrations, models
+
+INDEX = models.Index(fields=['datetime', 'department_id', 'job_id'], name='api_hired_dt_dept_job_idx')
+
+
+def add_index(apps, schema_editor):
+    model = apps.get_model('api', 'HiredEmployee')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(model, INDEX, concurrently=True)
+    else:
+        schema_editor.add_index(model, INDEX)
+
+
+def remove_index(apps, schema_editor):
+    model = apps.get_model('api', 'HiredEmployee')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(model, INDEX, concurrently=True)
+    else:
+        schema_editor.remove_index(model, INDEX)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction, but it doesn't
+    # block uploads while the index is built on a large table. Other databases
+    # get a plain index.
+    atomic = False
+
+    dependencies = [
+        ('api', '0003_ingestjob'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='hiredemployee', index=INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_index, remove_index),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-17 20:54
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import ExtractQuarter, ExtractYear
+
+
+def build_summary(apps, schema_editor):
+    HiredEmployee = apps.get_model('api', 'HiredEmployee')
+    HiresSummary = apps.get_model('api', 'HiresSummary')
+    db_alias = schema_editor.connection.alias
+    buckets = (
+        HiredEmployee.objects.using(db_alias)
+        .filter(department_id__isnull=False, job_id__isnull=False)
+        .annotate(year=ExtractYear('datetime'), quarter=ExtractQuarter('datetime'))
+        .values('year', 'quarter', 'department_id', 'job_id')
+        .annotate(hires=Count('id'))
+        .order_by()
+    )
+    HiresSummary.objects.using(db_alias).bulk_create([HiresSummary(**bucket) for bucket in buckets], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_hiredemployee_datetime_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HiresSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('quarter', models.SmallIntegerField()),
+                ('department_id', models.IntegerField()),
+                ('job_id', models.IntegerField()),
+                ('hires', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('year', 'quarter', 'department_id', 'job_id'), name='api_hiressummary_bucket_uniq')],
+            },
+        ),
+        migrations.RunPython(build_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_hiressummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='parallel',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_ingestjob_parallel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='strict_references',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_ingestjob_strict_references'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='mode',
+            field=models.CharField(default='insert', max_length=16),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-17 21:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_ingestjob_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=32)),
+                ('strict_references', models.BooleanField(default=True)),
+                ('mode', models.CharField(default='insert', max_length=16)),
+                ('state', models.CharField(choices=[('open', 'Open'), ('committed', 'Committed'), ('aborted', 'Aborted'), ('expired', 'Expired')], default='open', max_length=16)),
+                ('staging_table', models.CharField(max_length=63)),
+                ('checksums', models.JSONField(blank=True, default=list)),
+                ('rows_received', models.BigIntegerField(default=0)),
+                ('rows_staged', models.BigIntegerField(default=0)),
+                ('tail', models.BinaryField(blank=True, default=b'')),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('rejected_references', models.JSONField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# The 2021 reports as of the last refresh, read from api_hiressummary. Each view
+# needs a unique index for REFRESH MATERIALIZED VIEW CONCURRENTLY.
+CREATE_VIEWS = """
+CREATE MATERIALIZED VIEW api_report_hires_by_quarter_2021 AS
+    SELECT
+        s.department_id,
+        s.job_id,
+        d.department,
+        j.job,
+        COALESCE(SUM(s.hires) FILTER (WHERE s.quarter = 1), 0)::bigint AS "Q1",
+        COALESCE(SUM(s.hires) FILTER (WHERE s.quarter = 2), 0)::bigint AS "Q2",
+        COALESCE(SUM(s.hires) FILTER (WHERE s.quarter = 3), 0)::bigint AS "Q3",
+        COALESCE(SUM(s.hires) FILTER (WHERE s.quarter = 4), 0)::bigint AS "Q4"
+    FROM api_hiressummary s
+    INNER JOIN api_department d ON s.department_id = d.id
+    INNER JOIN api_job j ON s.job_id = j.id
+    WHERE s.year = 2021 AND s.hires > 0
+    GROUP BY s.department_id, s.job_id, d.department, j.job;
+CREATE UNIQUE INDEX api_report_hires_by_quarter_2021_uniq
+    ON api_report_hires_by_quarter_2021 (department_id, job_id);
+
+CREATE MATERIALIZED VIEW api_report_departments_above_average_2021 AS
+    WITH DepartmentHires AS (
+        SELECT d.id, d.department, SUM(s.hires)::bigint AS hired_count
+        FROM api_department d
+        JOIN api_hiressummary s ON d.id = s.department_id
+        WHERE s.year = 2021 AND s.hires > 0
+        GROUP BY d.id, d.department
+    ),
+    AverageHires AS (
+        SELECT AVG(hired_count) AS avg_hires FROM DepartmentHires
+    )
+    SELECT dh.id, dh.department, dh.hired_count AS hired
+    FROM DepartmentHires dh, AverageHires avg
+    WHERE dh.hired_count > avg.avg_hires;
+CREATE UNIQUE INDEX api_report_departments_above_average_2021_uniq
+    ON api_report_departments_above_average_2021 (id);
+"""
+
+DROP_VIEWS = """
+DROP MATERIALIZED VIEW IF EXISTS api_report_departments_above_average_2021;
+DROP MATERIALIZED VIEW IF EXISTS api_report_hires_by_quarter_2021;
+"""
+
+
+def create_views(apps, schema_editor):
+    # Materialized views are PostgreSQL only; elsewhere the reports run the live queries
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_VIEWS)
+
+
+def drop_views(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_VIEWS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_uploadsession'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_views, drop_views),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 """
 due to the lack of information in the requirement, we are not using the ForeignKey relationships.
@@ -28,6 +29,116 @@ class HiredEmployee(models.Model):
     # department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, db_column="department_id")
     # job = models.ForeignKey(Job, on_delete=models.SET_NULL, null=True, blank=True, db_column="job_id")
 
+    class Meta:
+        indexes = [
+            # Covers the yearly reports: range scan on datetime, grouping by department and job
+            models.Index(fields=["datetime", "department_id", "job_id"], name="api_hired_dt_dept_job_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
+
+class IngestJob(models.Model):
+    """
+    An upload processed in the background by the local worker pool (see api/jobs.py).
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATE_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    table = models.CharField(max_length=32)
+    file_name = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=255)
+    # "", or a mode of api/parallel.py to load the file with several processes
+    parallel = models.CharField(max_length=16, blank=True, default="")
+    # Reject rows whose references don't exist (see ReferenceChecker in api/validation.py)
+    strict_references = models.BooleanField(default=True)
+    # "insert" or "upsert" (see BaseUploadView.ingest)
+    mode = models.CharField(max_length=16, default="insert")
+    state = models.CharField(max_length=16, choices=STATE_CHOICES, default=QUEUED)
+    rows_processed = models.BigIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def rows_per_second(self):
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.table} job {self.pk} ({self.state})"
+
+class UploadSession(models.Model):
+    """
+    A resumable upload sent as numbered chunks (see api/chunked.py). The rows of the
+    chunks received so far wait in `staging_table` until the session is committed.
+    """
+    OPEN = "open"
+    COMMITTED = "committed"
+    ABORTED = "aborted"
+    EXPIRED = "expired"
+    STATE_CHOICES = [
+        (OPEN, "Open"),
+        (COMMITTED, "Committed"),
+        (ABORTED, "Aborted"),
+        (EXPIRED, "Expired"),
+    ]
+
+    table = models.CharField(max_length=32)
+    strict_references = models.BooleanField(default=True)
+    mode = models.CharField(max_length=16, default="insert")
+    state = models.CharField(max_length=16, choices=STATE_CHOICES, default=OPEN)
+    staging_table = models.CharField(max_length=63)
+    # SHA-256 of each chunk received, in order; the next chunk expected is len(checksums)
+    checksums = models.JSONField(default=list, blank=True)
+    rows_received = models.BigIntegerField(default=0)
+    rows_staged = models.BigIntegerField(default=0)
+    # Bytes of the last chunk after its last line break (a row continued by the next chunk)
+    tail = models.BinaryField(default=b"", blank=True)
+    errors = models.JSONField(default=list, blank=True)
+    rejected_references = models.JSONField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def next_chunk(self):
+        return len(self.checksums)
+
+    def __str__(self):
+        return f"{self.table} upload session {self.pk} ({self.state})"
+
+class HiresSummary(models.Model):
+    """
+    Hires per (year, quarter, department_id, job_id), maintained by the employee
+    uploads in the same transaction as the inserts (see api/summary.py). The yearly
+    reports read from this table instead of aggregating api_hiredemployee.
+    """
+    year = models.IntegerField()
+    quarter = models.SmallIntegerField()
+    department_id = models.IntegerField()
+    job_id = models.IntegerField()
+    hires = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["year", "quarter", "department_id", "job_id"], name="api_hiressummary_bucket_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.year} Q{self.quarter} department {self.department_id} job {self.job_id}: {self.hires}"
@@ -0,0 +1,276 @@
+"""
+Parallel ingest of a single large CSV file.
+
+The file is split into byte ranges that end right after a newline, and every
+range is parsed, validated and loaded by its own worker process with its own
+database connection. Rows are assumed not to contain line breaks (no quoted
+multi-line fields), which holds for the three tables. Two modes:
+
+  chunks -> each range is loaded and committed on its own (BaseUploadView.ingest);
+            a range that fails is reported and doesn't undo the others.
+  atomic -> workers only COPY their valid rows into a shared UNLOGGED staging
+            table and the coordinator merges it into the target table in one
+            transaction, so either every valid row lands or none does.
+
+Error messages carry row numbers of the whole file: the lines of every range are
+counted (also in parallel) before loading starts. Workers are spawned rather than
+forked so they never share the parent's database connections.
+
+`ingest_paths` loads several whole files of a table at once instead, one per
+worker (used by the load_csv command).
+"""
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import repeat
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import formats, metrics
+from .apps import INGEST_WORKER_ENV
+from .ingest import (
+    create_staging_table,
+    drop_staging_table,
+    get_ingest_engine,
+    iter_csv_rows,
+    iter_file_range,
+)
+from .reports import bump_data_version
+
+MODES = ["atomic", "chunks"]
+# Counts of BaseIngestEngine.as_dict, added up over the parts
+COUNTS = ["copied", "merged", "inserted", "updated", "unchanged", "skipped"]
+
+
+def split_file(path, parts):
+    """Splits `path` into at most `parts` [start, end) byte ranges that end on a row boundary."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            f.seek(max(size * i // parts, bounds[-1]))
+            f.readline() # Move to the start of the next row
+            if f.tell() >= size:
+                break
+            if f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def count_lines(path, start, end):
+    return sum(chunk.count(b"\n") for chunk in iter_file_range(path, start, end, chunk_size=1024 * 1024))
+
+
+def _init_worker(database_names):
+    import django
+
+    # Before setup: ApiConfig.ready must not take a worker for a server process
+    os.environ[INGEST_WORKER_ENV] = "1"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "globant_challenge.settings")
+    django.setup()
+    # The parent may be using another database than the settings say (e.g. under tests)
+    for alias, name in database_names.items():
+        settings.DATABASES[alias]["NAME"] = name
+
+
+def _load_part(table, path, start, end, first_row_number, strict, mode, staging_table=None, using="default"):
+    """
+    Worker: loads one byte range of the file. Returns a payload like the one of
+    BaseUploadView.ingest (errors and counts).
+    """
+    from .views import UPLOAD_VIEWS
+
+    view = UPLOAD_VIEWS[table]()
+    chunks = iter_file_range(path, start, end)
+    try:
+        if staging_table is None:
+            payload, _ = view.ingest(chunks, first_row_number=first_row_number, strict=strict, mode=mode)
+            return payload
+        errors = []
+        timings = metrics.StageTimer()
+        # Positions start at the part's first row number, so they follow the file order across parts
+        engine = get_ingest_engine(
+            view.model_class, view.expected_header, using=using, batch_size=view.ingest_batch_size(),
+            staging_table=staging_table, first_position=first_row_number, timings=timings,
+        )
+        references = view.reference_checker(strict)
+        with transaction.atomic(using=using):
+            rows = view.validated_rows(
+                iter_csv_rows(timings.timed(chunks, "read", count_bytes=True), timings=timings), errors,
+                first_row_number=first_row_number, references=references, upsert=mode == "upsert", timings=timings,
+            )
+            for values in rows:
+                engine.add(values)
+            engine.flush()
+        payload = {"errors": errors, "copied": engine.copied, "timings": timings.as_dict()}
+        if references:
+            payload["rejected_references"] = references.rejected
+        return payload
+    finally:
+        connections.close_all()
+
+
+def ingest_file(view, path, parallel="chunks", workers=None, progress=None, strict=None, mode="insert", using="default"):
+    """
+    Loads the CSV file at `path` into the table of `view` (a BaseUploadView) with up
+    to `workers` processes (INGEST_PARALLEL_WORKERS by default); `parallel` is one of
+    MODES, `strict` and `mode` are passed on to BaseUploadView.ingest. Returns the
+    response payload and status code, like BaseUploadView.ingest.
+    """
+    if parallel not in MODES:
+        raise ValueError(f"Unknown parallel mode '{parallel}'. Use one of {MODES}.")
+    size = os.path.getsize(path)
+    parts = min(workers or settings.INGEST_PARALLEL_WORKERS, size // settings.INGEST_PARALLEL_MIN_PART_BYTES)
+    ranges = split_file(path, max(parts, 1))
+    # Small files aren't worth the worker start-up; workers also need a database
+    # server they can all connect to
+    if len(ranges) == 1 or connections[using].vendor != "postgresql":
+        return view.ingest(iter_file_range(path, 0, size), progress=progress, strict=strict, mode=mode)
+
+    errors = []
+    counts = Counter(copied=0, merged=0, skipped=0)
+    # Stage seconds are added up over the workers; the total is the coordinator's wall time
+    timings = metrics.StageTimer()
+    rejected_references = None
+    pool = ProcessPoolExecutor(
+        max_workers=len(ranges),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=({using: settings.DATABASES[using]["NAME"]},),
+    )
+    staging_table = None
+    try:
+        starts, ends = zip(*ranges)
+        line_counts = list(pool.map(count_lines, repeat(path), starts, ends))
+        first_rows = [1 + sum(line_counts[:i]) for i in range(len(ranges))]
+        if parallel == "atomic":
+            staging_table = create_staging_table(view.model_class, using=using)
+
+        futures = {
+            pool.submit(_load_part, view.table_name, path, start, end, first_row, strict, mode, staging_table, using): i
+            for i, (start, end, first_row) in enumerate(zip(starts, ends, first_rows))
+        }
+        part_errors = [[] for _ in ranges]
+        rows_done = 0
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                payload = future.result()
+            except Exception as e:
+                if parallel == "atomic":
+                    raise
+                last_row = first_rows[i] + line_counts[i] - 1
+                payload = {"errors": [f"Rows {first_rows[i]}-{last_row}: Bulk load error: {str(e)}"]}
+            part_errors[i] = payload.get("errors", [])
+            if "timings" in payload:
+                timings.add(payload["timings"])
+            counts.update({key: value for key, value in payload.items() if key in COUNTS})
+            if "rejected_references" in payload:
+                rejected_references = rejected_references or Counter()
+                rejected_references.update(payload["rejected_references"])
+            rows_done += line_counts[i]
+            if progress:
+                progress(rows_done)
+        # Reported in file order, whatever order the parts finished in
+        errors = [error for part in part_errors for error in part]
+
+        if parallel == "atomic":
+            engine = get_ingest_engine(
+                view.model_class, view.expected_header, using=using, summaries=view.summaries,
+                staging_table=staging_table, upsert=mode == "upsert", timings=timings,
+            )
+            engine.copied = counts["copied"]
+            with transaction.atomic(using=using):
+                engine.finish()
+            counts = Counter(engine.as_dict())
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if staging_table:
+            drop_staging_table(staging_table, using=using)
+
+    if counts["merged"]:
+        # The workers committed on their own connections; invalidate the cached reports here
+        bump_data_version(view.table_name)
+    counts = {key: counts[key] for key in COUNTS if key in counts}
+    counts["parts"] = len(ranges)
+    if rejected_references is not None:
+        counts["rejected_references"] = dict(rejected_references)
+    payload, status_code = view.ingest_result(errors, counts)
+    metrics.observe(view.table_name, timings, counts, status_code)
+    payload["timings"] = timings.as_dict()
+    return payload, status_code
+
+
+def ingest_path(view, path, strict=None, mode="insert"):
+    """
+    Loads a local file in any upload format (api/formats.py, told by its name) into
+    the table of `view`, in this process. Returns the payload and status code of
+    BaseUploadView.ingest.
+    """
+    file_format = formats.detect_format(path)
+    if file_format is None:
+        raise formats.FileFormatError(f"{path}: not a CSV (optionally .csv.gz or .csv.zst), Parquet or Arrow file.")
+    reason = formats.unavailable_reason(file_format)
+    if reason:
+        raise formats.FileFormatError(f"{path}: {reason}")
+    if file_format in formats.COLUMNAR_FORMATS:
+        with open(path, "rb") as f:
+            return view.ingest(f, strict=strict, mode=mode, file_format=file_format)
+    return view.ingest(iter_file_range(path, 0, os.path.getsize(path)), strict=strict, mode=mode, file_format=file_format)
+
+
+def _load_path(table, path, strict, mode):
+    """Worker: loads a whole file. Returns (payload, status code, seconds)."""
+    from .views import UPLOAD_VIEWS
+
+    started = time.perf_counter()
+    try:
+        payload, status_code = ingest_path(UPLOAD_VIEWS[table](), path, strict=strict, mode=mode)
+        return payload, status_code, time.perf_counter() - started
+    finally:
+        connections.close_all()
+
+
+def ingest_paths(view, paths, workers=None, strict=None, mode="insert", using="default"):
+    """
+    Loads the files at `paths` into the table of `view`, each one by its own worker
+    process (at most `workers`, INGEST_PARALLEL_WORKERS by default) and committed on
+    its own. Yields (path, payload, status code, seconds) as the files finish; a file
+    that can't be loaded gets a payload with just its error, and status code None.
+    """
+    workers = min(workers or settings.INGEST_PARALLEL_WORKERS, len(paths))
+    if workers <= 1 or connections[using].vendor != "postgresql":
+        for path in paths:
+            started = time.perf_counter()
+            try:
+                payload, status_code = ingest_path(view, path, strict=strict, mode=mode)
+            except Exception as e:
+                payload, status_code = {"errors": [f"An error occurred: {str(e)}"]}, None
+            yield path, payload, status_code, time.perf_counter() - started
+        return
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=({using: settings.DATABASES[using]["NAME"]},),
+    )
+    merged = False
+    try:
+        futures = {pool.submit(_load_path, view.table_name, path, strict, mode): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                payload, status_code, seconds = future.result()
+            except Exception as e:
+                payload, status_code, seconds = {"errors": [f"An error occurred: {str(e)}"]}, None, 0.0
+            merged = merged or bool(payload.get("merged"))
+            yield futures[future], payload, status_code, seconds
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if merged:
+            # The workers committed on their own connections
+            bump_data_version(view.table_name)
@@ -0,0 +1,24 @@
+import csv
+import io
+
+from rest_framework import renderers
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """
+    Lets `?format=csv` through DRF's content negotiation. Report rows are streamed
+    by the views themselves (see CachedReportView); this renderer only handles
+    regular payloads such as validation errors.
+    """
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        buffer = io.StringIO()
+        if rows:
+            writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return buffer.getvalue().encode(self.charset)
@@ -0,0 +1,401 @@
+"""
+Query builder for the reporting endpoints.
+
+Every report is a fixed SQL template plus bound parameters: the year becomes a
+half-open timestamp range (so the (datetime, department_id, job_id) index can be
+used) and the optional filters are added as `= %(name)s` conditions. Nothing from
+the request is ever formatted into the SQL text.
+"""
+import csv
+import hashlib
+import itertools
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import materialized
+
+DEFAULT_YEAR = 2021
+GRANULARITIES = ["quarter", "month", "week"]
+
+
+def year_bounds(year):
+    """Half-open [start, end) timestamp range covering `year`."""
+    return datetime(year, 1, 1, tzinfo=timezone.utc), datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+
+
+def period_buckets(year, granularity):
+    """
+    Returns [(label, start), ...] for the buckets of `year`; each bucket ends where
+    the next one starts and the last one at the end of the year.
+      quarter -> Q1..Q4
+      month   -> M1..M12
+      week    -> W1..W53, seven-day buckets counted from January 1st
+    """
+    start, end = year_bounds(year)
+    if granularity == "quarter":
+        return [(f"Q{q}", datetime(year, 3 * q - 2, 1, tzinfo=timezone.utc)) for q in range(1, 5)]
+    if granularity == "month":
+        return [(f"M{m}", datetime(year, m, 1, tzinfo=timezone.utc)) for m in range(1, 13)]
+    if granularity == "week":
+        buckets = []
+        week_start = start
+        while week_start < end:
+            buckets.append((f"W{len(buckets) + 1}", week_start))
+            week_start += timedelta(days=7)
+        return buckets
+    raise ValueError(f"Unknown granularity '{granularity}'. Use one of {GRANULARITIES}.")
+
+
+def _filters(alias, params, department_id=None, job_id=None):
+    conditions = [f"{alias}.datetime >= %(start)s", f"{alias}.datetime < %(end)s"]
+    if department_id is not None:
+        conditions.append(f"{alias}.department_id = %(department_id)s")
+        params["department_id"] = department_id
+    if job_id is not None:
+        conditions.append(f"{alias}.job_id = %(job_id)s")
+        params["job_id"] = job_id
+    return " AND ".join(conditions)
+
+
+def hires_by_period_query(year=DEFAULT_YEAR, granularity="quarter", department_id=None, job_id=None):
+    """
+    Hires per department and job in `year`, one column per bucket of `granularity`.
+    Returns (sql, params).
+    """
+    start, end = year_bounds(year)
+    params = {"start": start, "end": end}
+    buckets = period_buckets(year, granularity)
+    columns = []
+    for i, (label, bucket_start) in enumerate(buckets):
+        bucket_end = buckets[i + 1][1] if i + 1 < len(buckets) else end
+        params[f"b{i}"], params[f"b{i + 1}"] = bucket_start, bucket_end
+        columns.append(f'COUNT(*) FILTER (WHERE h.datetime >= %(b{i})s AND h.datetime < %(b{i + 1})s) AS "{label}"')
+    sql = f"""
+        SELECT
+        d.department,
+        j.job,
+        {", ".join(columns)}
+        FROM api_hiredemployee h
+        INNER JOIN api_department d ON h.department_id = d.id
+        INNER JOIN api_job j ON h.job_id = j.id
+        WHERE {_filters("h", params, department_id, job_id)}
+        GROUP BY d.department, j.job
+        ORDER BY d.department, j.job;
+    """
+    return sql, params
+
+
+def departments_above_average_query(year=DEFAULT_YEAR, department_id=None, job_id=None):
+    """
+    Departments that hired more than the average of all departments in `year`.
+    `job_id` restricts the hires that are counted; `department_id` only filters the
+    output (the average is still taken over every department). Returns (sql, params).
+    """
+    start, end = year_bounds(year)
+    params = {"start": start, "end": end}
+    output_filter = ""
+    if department_id is not None:
+        output_filter = "AND dh.id = %(department_id)s"
+        params["department_id"] = department_id
+    sql = f"""
+    WITH DepartmentHires AS (
+        SELECT
+            d.id,
+            d.department,
+            COUNT(he.id) AS hired_count
+        FROM
+            api_department d
+        JOIN
+            api_hiredemployee he ON d.id = he.department_id
+        WHERE
+            {_filters("he", params, job_id=job_id)}
+        GROUP BY
+            d.id,
+            d.department
+    ),
+    AverageHires AS (
+        SELECT AVG(hired_count) AS avg_hires
+        FROM DepartmentHires
+    )
+    SELECT
+        dh.id,
+        dh.department,
+        dh.hired_count AS hired
+    FROM
+        DepartmentHires dh,
+        AverageHires avg
+    WHERE
+        dh.hired_count > avg.avg_hires
+        {output_filter}
+    ORDER BY
+        dh.hired_count DESC;
+    """
+    return sql, params
+
+
+def _summary_filters(params, department_id=None, job_id=None):
+    # Buckets emptied by upserts stay in the table with zero hires
+    conditions = ["s.year = %(year)s", "s.hires > 0"]
+    if department_id is not None:
+        conditions.append("s.department_id = %(department_id)s")
+        params["department_id"] = department_id
+    if job_id is not None:
+        conditions.append("s.job_id = %(job_id)s")
+        params["job_id"] = job_id
+    return " AND ".join(conditions)
+
+
+def hires_by_quarter_summary_query(year=DEFAULT_YEAR, department_id=None, job_id=None):
+    """
+    Same result as hires_by_period_query(granularity="quarter"), read from the
+    api_hiressummary table (see api/summary.py). Returns (sql, params).
+    """
+    params = {"year": year}
+    columns = [
+        f'COALESCE(SUM(s.hires) FILTER (WHERE s.quarter = {q}), 0)::bigint AS "Q{q}"'
+        for q in range(1, 5)
+    ]
+    sql = f"""
+        SELECT
+        d.department,
+        j.job,
+        {", ".join(columns)}
+        FROM api_hiressummary s
+        INNER JOIN api_department d ON s.department_id = d.id
+        INNER JOIN api_job j ON s.job_id = j.id
+        WHERE {_summary_filters(params, department_id, job_id)}
+        GROUP BY d.department, j.job
+        ORDER BY d.department, j.job;
+    """
+    return sql, params
+
+
+def departments_above_average_summary_query(year=DEFAULT_YEAR, department_id=None, job_id=None):
+    """
+    Same result as departments_above_average_query, read from the api_hiressummary
+    table. Returns (sql, params).
+    """
+    params = {"year": year}
+    output_filter = ""
+    if department_id is not None:
+        output_filter = "AND dh.id = %(department_id)s"
+        params["department_id"] = department_id
+    sql = f"""
+    WITH DepartmentHires AS (
+        SELECT
+            d.id,
+            d.department,
+            SUM(s.hires)::bigint AS hired_count
+        FROM
+            api_department d
+        JOIN
+            api_hiressummary s ON d.id = s.department_id
+        WHERE
+            {_summary_filters(params, job_id=job_id)}
+        GROUP BY
+            d.id,
+            d.department
+    ),
+    AverageHires AS (
+        SELECT AVG(hired_count) AS avg_hires
+        FROM DepartmentHires
+    )
+    SELECT
+        dh.id,
+        dh.department,
+        dh.hired_count AS hired
+    FROM
+        DepartmentHires dh,
+        AverageHires avg
+    WHERE
+        dh.hired_count > avg.avg_hires
+        {output_filter}
+    ORDER BY
+        dh.hired_count DESC;
+    """
+    return sql, params
+
+
+# --- Materialized views ---
+# The DEFAULT_YEAR reports, kept in materialized views (migration 0010) and
+# refreshed after the uploads (see api/materialized.py).
+
+MATERIALIZED_YEAR = DEFAULT_YEAR
+
+
+def hires_by_quarter_materialized_query(department_id=None, job_id=None):
+    """Same result as hires_by_quarter_summary_query(MATERIALIZED_YEAR), read from its materialized view."""
+    params = {}
+    conditions = ["TRUE"]
+    if department_id is not None:
+        conditions.append("department_id = %(department_id)s")
+        params["department_id"] = department_id
+    if job_id is not None:
+        conditions.append("job_id = %(job_id)s")
+        params["job_id"] = job_id
+    # Rows are per department and job id; the report groups by their names
+    columns = [f'SUM("Q{q}")::bigint AS "Q{q}"' for q in range(1, 5)]
+    sql = f"""
+        SELECT department, job, {", ".join(columns)}
+        FROM api_report_hires_by_quarter_{MATERIALIZED_YEAR}
+        WHERE {" AND ".join(conditions)}
+        GROUP BY department, job
+        ORDER BY department, job;
+    """
+    return sql, params
+
+
+def departments_above_average_materialized_query(department_id=None):
+    """
+    Same result as departments_above_average_summary_query(MATERIALIZED_YEAR)
+    without `job_id` (which changes the average), read from its materialized view.
+    """
+    params = {}
+    output_filter = ""
+    if department_id is not None:
+        output_filter = "WHERE id = %(department_id)s"
+        params["department_id"] = department_id
+    sql = f"""
+        SELECT id, department, hired
+        FROM api_report_departments_above_average_{MATERIALIZED_YEAR}
+        {output_filter}
+        ORDER BY hired DESC;
+    """
+    return sql, params
+
+
+def run_report(sql, params, using="default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [
+            dict(zip(columns, row))
+            for row in cursor.fetchall()
+        ]
+
+
+# --- Streaming ---
+# For results too large to build in memory: rows are read from a server-side
+# (named) cursor `chunk_size` at a time and encoded as they are produced.
+
+def stream_report(sql, params, chunk_size=2000, using="default"):
+    """Yields the list of column names first, then every row as a tuple."""
+    with connections[using].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchmany(chunk_size)
+        # A named cursor only has a description after the first fetch
+        yield [col[0] for col in cursor.description]
+        while rows:
+            yield from rows
+            rows = cursor.fetchmany(chunk_size)
+
+
+def started_report(report_rows):
+    """
+    Runs the query of a stream_report up to its first chunk now and returns the same
+    stream. Streaming responses call it before they start, so a failing query
+    (replica down, statement timeout, ...) gets an error status instead of a
+    truncated body sent with 200.
+    """
+    return itertools.chain([next(report_rows)], report_rows)
+
+
+def iter_json_array(report_rows):
+    """Encodes the output of stream_report as a JSON array of objects, piece by piece."""
+    encoder = JSONEncoder()
+    columns = next(report_rows)
+    separator = "["
+    for row in report_rows:
+        yield separator + encoder.encode(dict(zip(columns, row)))
+        separator = ","
+    yield "[]" if separator == "[" else "]"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(report_rows):
+    """Encodes the output of stream_report as CSV with a header row, line by line."""
+    writer = csv.writer(_Echo())
+    for row in report_rows:
+        yield writer.writerow(row)
+
+
+# Async versions for api.async_db.stream_report, which yields the rows in lists:
+# one piece per list keeps the number of ASGI body messages low.
+
+async def astarted_report(report_batches):
+    """Async counterpart of started_report, for api.async_db.stream_report."""
+    columns = await anext(report_batches)
+
+    async def batches():
+        yield columns
+        async for rows in report_batches:
+            yield rows
+
+    return batches()
+
+
+async def aiter_json_array(report_batches):
+    encoder = JSONEncoder()
+    columns = await anext(report_batches)
+    separator = "["
+    async for rows in report_batches:
+        yield separator + ",".join(encoder.encode(dict(zip(columns, row))) for row in rows)
+        separator = ","
+    yield "[]" if separator == "[" else "]"
+
+
+async def aiter_csv(report_batches):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(await anext(report_batches))
+    async for rows in report_batches:
+        yield "".join(writer.writerow(row) for row in rows)
+
+
+# --- Result cache ---
+# Each uploaded table has a data version in the cache: the time.time_ns() of its
+# last committed upload. Cached report results are keyed by those versions, so an
+# upload makes every dependent entry unreachable and old entries simply expire.
+# A version is never reused, even if its key is evicted and set again.
+
+def data_version_key(table):
+    return f"data_version:{table}"
+
+
+def get_data_versions(tables):
+    keys = [data_version_key(table) for table in tables]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def aget_data_versions(tables):
+    keys = [data_version_key(table) for table in tables]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def bump_data_version(table):
+    cache.set(data_version_key(table), time.time_ns(), timeout=None)
+    # The materialized reports have to catch up with the change
+    materialized.schedule_refresh()
+
+
+def report_cache_key(report, params, versions):
+    payload = json.dumps([report, params, versions], sort_keys=True, default=str)
+    return f"report:{report}:{hashlib.sha1(payload.encode()).hexdigest()}"
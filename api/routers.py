@@ -0,0 +1,122 @@
+"""
+Read replica for reporting.
+
+When the REPORTING_DATABASE alias is configured (see REPORTING_DB_HOST in
+settings.py), the report endpoints and the admin change lists read from it, so
+dashboards don't compete with the upload transactions on the primary. Everything
+else, including the reads of the uploads (existing ids, references), stays on
+"default".
+
+The replica is only used while it's reachable and its replication lag is at most
+REPORTING_MAX_LAG_SECONDS; otherwise those reads go to "default". The lag is
+checked at most every REPORTING_CHECK_SECONDS per process.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+# Seconds the server is behind its primary; 0 when it isn't a standby, or when it
+# has replayed everything it received (an idle primary sends nothing new)
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+# (time of the check, lag in seconds or None if the replica can't be used)
+_last_check = [0.0, None]
+_reads = ContextVar("reporting_reads", default=None)
+
+
+def replica_lag(alias):
+    """Replication lag of `alias` in seconds, or None if it's unknown."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        lag = cursor.fetchone()[0]
+    return None if lag is None else float(lag)
+
+
+def _usable_lag(lag):
+    return lag if lag is not None and lag <= settings.REPORTING_MAX_LAG_SECONDS else None
+
+
+def checked_lag():
+    """Lag of the reporting database if it can be used now, else None."""
+    alias = settings.REPORTING_DATABASE
+    if alias not in settings.DATABASES:
+        return None
+    now = time.monotonic()
+    if now - _last_check[0] >= settings.REPORTING_CHECK_SECONDS:
+        try:
+            lag = _usable_lag(replica_lag(alias))
+        except Exception: # Unreachable, misconfigured, ...
+            # Django discards the broken connection at the end of the request
+            lag = None
+        _last_check[:] = [now, lag]
+    return _last_check[1]
+
+
+def _choice(lag, changed_at):
+    if lag is None:
+        return "default", True
+    # It has every change committed before `now - lag`
+    return settings.REPORTING_DATABASE, changed_at is None or changed_at <= time.time() - lag
+
+
+def reporting_database(changed_at=None):
+    """
+    (alias, current): the database for report reads, the reporting one when it can
+    be used and "default" otherwise, and whether it surely has every change made
+    up to `changed_at` (epoch seconds). Results that aren't current are within
+    the staleness tolerance but shouldn't be cached.
+    """
+    return _choice(checked_lag(), changed_at)
+
+
+async def areporting_database(changed_at=None):
+    """Async counterpart of reporting_database, checking the lag through asyncpg (api/async_db.py)."""
+    from . import async_db
+
+    alias = settings.REPORTING_DATABASE
+    if alias not in settings.DATABASES:
+        return "default", True
+    now = time.monotonic()
+    if now - _last_check[0] >= settings.REPORTING_CHECK_SECONDS:
+        try:
+            pool = await async_db.get_pool(alias)
+            lag = await pool.fetchval(LAG_SQL)
+            lag = _usable_lag(None if lag is None else float(lag))
+        except Exception: # asyncpg and connection errors
+            lag = None
+        _last_check[:] = [now, lag]
+    return _choice(_last_check[1], changed_at)
+
+
+@contextmanager
+def reporting_reads():
+    """Within the block, ORM reads of the api models go to the reporting database when it can be used."""
+    token = _reads.set(reporting_database()[0])
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+class ReportingRouter:
+    """Routes the ORM reads of the api models inside `reporting_reads()`; writes are left to "default"."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == "api":
+            return _reads.get()
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary; other apps get the default checks
+        if obj1._meta.app_label == "api" and obj2._meta.app_label == "api":
+            return True
+        return None
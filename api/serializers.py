@@ -1,36 +1,44 @@
+from django.db import models
 from rest_framework import serializers
-from .models import Department, Job, HiredEmployee
-from django.utils.dateparse import parse_datetime
+from .models import Department, Job, HiredEmployee, IngestJob, UploadSession
+from .reports import DEFAULT_YEAR, GRANULARITIES
+from .validation import DATETIME_FORMAT
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class UploadIntegerField(serializers.IntegerField):
+    """
+    IntegerField that only reads text made of ASCII characters, as the columnar
+    validation does; int() alone would also take other digits, e.g. "١٢".
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and not data.isascii():
+            self.fail("invalid")
+        return super().to_internal_value(data)
+
+class UploadModelSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {**serializers.ModelSerializer.serializer_field_mapping, models.IntegerField: UploadIntegerField}
+
+class DepartmentSerializer(UploadModelSerializer):
     class Meta:
         model = Department
         fields = ["id", "department"]
 
-class JobSerializer(serializers.ModelSerializer):
+class JobSerializer(UploadModelSerializer):
     class Meta:
         model = Job
         fields = ["id", "job"]
 
-class HiredEmployeeSerializer(serializers.ModelSerializer):
+class HiredEmployeeSerializer(UploadModelSerializer):
     # Use IntegerField for foreign keys during input validation
-    department_id = serializers.IntegerField()
-    job_id = serializers.IntegerField()
-    datetime = serializers.DateTimeField(format="%Y-%m-%dT%H:%M:%SZ", input_formats=["%Y-%m-%dT%H:%M:%SZ"])
+    department_id = UploadIntegerField()
+    job_id = UploadIntegerField()
+    # validate_row (api/views.py) passes the value already parsed
+    datetime = serializers.DateTimeField(format=DATETIME_FORMAT, input_formats=[DATETIME_FORMAT])
 
     class Meta:
         model = HiredEmployee
         fields = ["id", "name", "datetime", "department_id", "job_id"]
 
-    def validate_datetime(self, value):
-        # Ensure datetime is parsed correctly, although DRF handles it with input_formats
-        if isinstance(value, str):
-            parsed_dt = parse_datetime(value)
-            if parsed_dt is None:
-                raise serializers.ValidationError("Invalid datetime format. Use ISO format YYYY-MM-DDTHH:MM:SSZ.")
-            return parsed_dt
-        return value
-
     def create(self, validated_data):
         # Pop the _id fields and use the object fields for creation
         department_id = validated_data.pop("department_id")
@@ -45,3 +53,26 @@ class HiredEmployeeSerializer(serializers.ModelSerializer):
         except Job.DoesNotExist:
             raise serializers.ValidationError(f"Job with id {job_id} does not exist.")
 
+
+class IngestJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.FloatField()
+
+    class Meta:
+        model = IngestJob
+        fields = ["id", "table", "file_name", "parallel", "strict_references", "mode", "state", "rows_processed", "rows_per_second", "errors", "result", "created_at", "started_at", "finished_at"]
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    next_chunk = serializers.IntegerField()
+
+    class Meta:
+        model = UploadSession
+        fields = ["id", "table", "strict_references", "mode", "state", "next_chunk", "rows_received", "rows_staged", "errors", "rejected_references", "result", "created_at", "updated_at", "finished_at"]
+
+class ReportParamsSerializer(serializers.Serializer):
+    # Query parameters shared by the reporting endpoints
+    year = serializers.IntegerField(min_value=1900, max_value=9998, default=DEFAULT_YEAR)
+    department_id = serializers.IntegerField(required=False)
+    job_id = serializers.IntegerField(required=False)
+
+class HiresByPeriodParamsSerializer(ReportParamsSerializer):
+    granularity = serializers.ChoiceField(choices=GRANULARITIES, default="quarter")
@@ -0,0 +1,81 @@
+"""
+Incremental maintenance of the HiresSummary table.
+
+The ingest engines (api/ingest.py) hand the updater the rows they actually
+inserted into api_hiredemployee, so ids skipped as duplicates are never counted.
+Hires without a department or job can't appear in the reports (they join on
+both) and are left out of the summary. Upserts that move a hire to another bucket
+take it out of the old one, which can leave buckets at zero hires.
+"""
+from collections import Counter
+from datetime import timezone
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import ExtractQuarter, ExtractYear
+
+from .models import HiredEmployee, HiresSummary
+
+
+class HiresSummaryUpdater:
+    # Columns of the inserted rows the updater needs
+    columns = ["datetime", "department_id", "job_id"]
+
+    def sql(self, inserted, removed=None):
+        """
+        Statement adding the rows of the CTE named `inserted` to the summary and, if
+        given, taking out those of the CTE `removed` (the old values of updated rows);
+        the PostgreSQL engine runs it as part of the same statement as the merge.
+        Both go through one INSERT, as a statement can't update a summary row twice.
+        """
+        table = HiresSummary._meta.db_table
+        changes = f"SELECT datetime, department_id, job_id, 1 AS delta FROM {inserted}"
+        if removed:
+            changes += f" UNION ALL SELECT datetime, department_id, job_id, -1 FROM {removed}"
+        return (
+            f"INSERT INTO {table} (year, quarter, department_id, job_id, hires) "
+            f"SELECT EXTRACT(year FROM datetime)::int, EXTRACT(quarter FROM datetime)::int, department_id, job_id, SUM(delta) "
+            f"FROM ({changes}) changes WHERE department_id IS NOT NULL AND job_id IS NOT NULL "
+            f"GROUP BY 1, 2, 3, 4 HAVING SUM(delta) <> 0 "
+            # A fixed order makes concurrent loads (api/parallel.py) lock buckets in the same order
+            f"ORDER BY 1, 2, 3, 4 "
+            f"ON CONFLICT (year, quarter, department_id, job_id) DO UPDATE SET hires = {table}.hires + EXCLUDED.hires"
+        )
+
+    def apply(self, rows, using="default", removed=()):
+        """
+        Adds inserted rows, given as dicts, to the summary and takes out the `removed`
+        ones (used by the bulk_create fallback).
+        """
+        counts = Counter()
+        for sign, group in ((1, rows), (-1, removed)):
+            for row in group:
+                if row["department_id"] is None or row["job_id"] is None:
+                    continue
+                hired_at = row["datetime"].astimezone(timezone.utc)
+                counts[hired_at.year, (hired_at.month - 1) // 3 + 1, row["department_id"], row["job_id"]] += sign
+        summary = HiresSummary.objects.using(using)
+        for (year, quarter, department_id, job_id), hires in counts.items():
+            if not hires:
+                continue
+            bucket = {"year": year, "quarter": quarter, "department_id": department_id, "job_id": job_id}
+            if not summary.filter(**bucket).update(hires=F("hires") + hires):
+                summary.create(hires=hires, **bucket)
+
+
+def rebuild_hires_summary(using="default"):
+    """Recomputes the whole summary from api_hiredemployee. Returns the number of buckets."""
+    buckets = (
+        HiredEmployee.objects.using(using)
+        .filter(department_id__isnull=False, job_id__isnull=False)
+        .annotate(year=ExtractYear("datetime"), quarter=ExtractQuarter("datetime"))
+        .values("year", "quarter", "department_id", "job_id")
+        .annotate(hires=Count("id"))
+        .order_by()
+    )
+    with transaction.atomic(using=using):
+        HiresSummary.objects.using(using).all().delete()
+        created = HiresSummary.objects.using(using).bulk_create(
+            [HiresSummary(**bucket) for bucket in buckets], batch_size=1000
+        )
+    return len(created)
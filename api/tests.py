@@ -1,8 +1,39 @@
-from django.test import TestCase, Client
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .models import Department, Job, HiredEmployee
+from django.core.files.storage import default_storage
+from django.apps import apps
+from django.core.cache import cache
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils.dateparse import parse_datetime
+from django.core.management import CommandError, call_command
+from . import async_db, formats, jobs, materialized, routers
+from .batching import AdaptiveBatchSize, recorded_batch_sizes
+from .apps import INGEST_WORKER_ENV, serves_requests
+from .async_views import DepartmentsAboveAverageAsyncView, HiresByQuarterAsyncView
+from .ingest import BulkCreateIngestEngine, PostgresCopyIngestEngine, create_staging_table, drop_staging_table, iter_csv_rows, iter_text_lines
+from .parallel import ingest_file, split_file
+from .models import Department, Job, HiredEmployee, HiresSummary, IngestJob, UploadSession
+from .reports import bump_data_version, get_data_versions, iter_json_array, stream_report
+from .summary import HiresSummaryUpdater, rebuild_hires_summary
+from .validation import ColumnarValidator, parse_upload_datetime
+from .views import DepartmentUploadView, HiredEmployeeUploadView, HiresByQuarterReport
+from datetime import datetime, timezone
+import csv
+import gzip
+import hashlib
 import io
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+import time
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
 
 class UploadAPITests(TestCase):
 
@@ -70,6 +101,16 @@ class UploadAPITests(TestCase):
         self.assertIn("errors", response.json())
         self.assertFalse(HiredEmployee.objects.filter(id=103).exists())
 
+    def test_upload_rejects_non_ascii_digit_ids(self):
+        csv_content = "١٢,Dept\n13,Valid"
+        file = SimpleUploadedFile("departments.csv", csv_content.encode("utf-8"), content_type="text/csv")
+        response = self.client.post(reverse("upload-departments"), {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(response.json()["errors"]), 1)
+        self.assertIn("Row 1:", response.json()["errors"][0])
+        self.assertFalse(Department.objects.filter(id=12).exists())
+        self.assertTrue(Department.objects.filter(id=13).exists())
+
     def test_upload_employees_csv_invalid_fk(self):
         csv_content = "id,name,datetime,department_id,job_id\n104,Bad FK Employee,2021-02-01T08:00:00Z,99,99" # Assuming IDs 99 don't exist
         file = SimpleUploadedFile("employees_bad_fk.csv", csv_content.encode("utf-8"), content_type="text/csv")
@@ -83,8 +124,528 @@ class UploadAPITests(TestCase):
             self.assertIn("errors", response.json())
         self.assertFalse(HiredEmployee.objects.filter(id=104).exists())
 
+    def test_strict_mode_rejects_dangling_references(self):
+        csv_content = (
+            "105,Valid,2021-02-01T08:00:00Z,1,1\n"
+            "106,Bad Dept,2021-02-01T08:00:00Z,99,1\n"
+            "107,Bad Both,2021-02-01T08:00:00Z,98,97\n"
+            "108,Bad Job,2021-02-01T08:00:00Z,1,96"
+        )
+        url = reverse("upload-employees")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {"file": SimpleUploadedFile("employees.csv", csv_content.encode("utf-8"))}, format="multipart")
+        self.assertEqual(response.status_code, 207)
+        data = response.json()
+        self.assertEqual(data["rejected_references"], {"department_id": 2, "job_id": 2})
+        self.assertEqual(data["errors"], [
+            "Row 2: Department with id 99 does not exist.",
+            "Row 3: Department with id 98 does not exist. Job with id 97 does not exist.",
+            "Row 4: Job with id 96 does not exist.",
+        ])
+        self.assertEqual(list(HiredEmployee.objects.values_list("id", flat=True)), [105])
+        # The ids are loaded once per upload, not looked up per row
+        lookups = [q for q in queries.captured_queries if 'FROM "api_department"' in q["sql"] or 'FROM "api_job"' in q["sql"]]
+        self.assertEqual(len(lookups), 2)
+
+        csv_content = csv_content.replace("\n10", "\n20").replace("105,", "205,") # Same rows with new ids
+        response = self.client.post(url + "?strict=0", {"file": SimpleUploadedFile("employees.csv", csv_content.encode("utf-8"))}, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("rejected_references", response.json())
+        self.assertEqual(HiredEmployee.objects.count(), 5)
+
+    def test_upload_reports_copied_merged_skipped(self):
+        # id=2 appears twice in the file; only the first occurrence is kept
+        csv_content = "2,New Dept\n2,New Dept again\n3,Other Dept"
+        file = SimpleUploadedFile("departments.csv", csv_content.encode("utf-8"), content_type="text/csv")
+        url = reverse("upload-departments")
+        response = self.client.post(url, {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data["copied"], 3)
+        self.assertEqual(data["merged"], 2)
+        self.assertEqual(data["skipped"], 1)
+        self.assertEqual(data["message"], "Successfully processed file. Inserted 2 records, skipped 1 duplicate ids.")
+        self.assertEqual(Department.objects.get(id=2).department, "New Dept")
+
+    def test_upsert_mode(self):
+        Department.objects.create(id=5, department="Old Name")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT ctid FROM api_department WHERE id = 1")
+            unchanged_ctid = cursor.fetchone()[0]
+        csv_content = "1,Test Dept\n5,New Name\n6,Brand New\n6,Second Occurrence"
+        file = SimpleUploadedFile("departments.csv", csv_content.encode("utf-8"), content_type="text/csv")
+        response = self.client.post(reverse("upload-departments") + "?mode=upsert", {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(
+            {key: data[key] for key in ("copied", "inserted", "updated", "unchanged", "skipped")},
+            {"copied": 4, "inserted": 1, "updated": 1, "unchanged": 1, "skipped": 1},
+        )
+        self.assertEqual(Department.objects.get(id=5).department, "New Name")
+        self.assertEqual(Department.objects.get(id=6).department, "Brand New")
+        # The unchanged row wasn't rewritten
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT ctid FROM api_department WHERE id = 1")
+            self.assertEqual(cursor.fetchone()[0], unchanged_ctid)
+
+        file = SimpleUploadedFile("departments.csv", b"7,Dept", content_type="text/csv")
+        response = self.client.post(reverse("upload-departments") + "?mode=replace", {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_does_not_count_the_whole_table(self):
+        file = SimpleUploadedFile("departments.csv", b"4,Dept 4\n5,Dept 5", content_type="text/csv")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("upload-departments"), {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["merged"], 2)
+        self.assertFalse([q for q in queries.captured_queries if "COUNT(*)" in q["sql"] and "RETURNING" not in q["sql"]])
+
+    def test_upload_timings_and_metrics(self):
+        content = "".join(f"{i},E{i},2021-01-15T08:00:00Z,1,1\n" for i in range(200, 210)) + "210,Bad,2021-13-01T08:00:00Z,1,1\n"
+        url = reverse("upload-employees")
+        response = self.client.post(url, {"file": SimpleUploadedFile("employees.csv", content.encode())}, format="multipart")
+        self.assertNotIn("timings", response.json())
+
+        response = self.client.post(f"{url}?timings=1", {"file": SimpleUploadedFile("more.csv", content.encode())}, format="multipart")
+        timings = response.json()["timings"]
+        self.assertEqual((timings["rows"], timings["bytes"]), (11, len(content)))
+        self.assertLessEqual({"read", "decode", "parse", "validate", "parse_datetime", "validate_serializer", "references", "merge"}, set(timings["seconds"]))
+        # Stages never overlap, so they add up to no more than the whole load
+        stages = sum(seconds for stage, seconds in timings["seconds"].items() if stage != "total")
+        self.assertLessEqual(stages, timings["seconds"]["total"] + 1e-3)
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        text = response.content.decode()
+        self.assertIn("# TYPE ingest_stage_seconds_total counter", text)
+        self.assertIn('ingest_stage_seconds_total{table="employees",stage="parse"} ', text)
+        self.assertRegex(text, r'ingest_uploads_total\{table="employees",status="207"\} [2-9]')
+
+    def test_bulk_create_engine_fallback_counts(self):
+        engine = BulkCreateIngestEngine(Job, ["id", "job"], batch_size=2)
+        for row in [(1, "Test Job"), (2, "Job 2"), (3, "Job 3"), (3, "Job 3 dup")]:
+            engine.add(row)
+        engine.finish()
+        self.assertEqual(engine.as_dict(), {"copied": 4, "merged": 2, "skipped": 2})
+        self.assertEqual(Job.objects.count(), 3)
+
+    def test_copy_engine_holds_large_batches_as_text(self):
+        # A whole load in one batch: held as COPY bytes, not as tuples and datetimes
+        fields = ["id", "name", "datetime", "department_id", "job_id"]
+        row_count = 20000
+        hired_at = datetime(2021, 3, 1, 8, tzinfo=timezone.utc)
+        engine = PostgresCopyIngestEngine(HiredEmployee, fields, batch_size=row_count)
+        tracemalloc.start()
+        try:
+            engine.add((100, "Zoë\tTab", hired_at, 1, 1))
+            for i in range(101, 100 + row_count):
+                engine.add((i, f"Employee {i}", hired_at, 1, 1))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        engine.finish()
+        self.assertEqual(engine.merged, row_count)
+        # The tuples alone would take over 200 bytes per row
+        self.assertLess(peak / row_count, 120)
+        self.assertEqual(HiredEmployee.objects.get(id=100).name, "Zoë\tTab")
+
+class UploadFormatTests(TestCase):
+
+    def setUp(self):
+        Department.objects.create(id=1, department="Test Dept")
+        Job.objects.create(id=1, job="Test Job")
+        self.url = reverse("upload-employees")
+
+    def post(self, name, content):
+        return self.client.post(self.url, {"file": SimpleUploadedFile(name, content)}, format="multipart")
+
+    def test_gzip_csv_is_decompressed_as_a_stream(self):
+        rows = "".join(f"{i},Employee {i},2021-01-15T08:00:00Z,1,1\n" for i in range(1, 2001))
+        # Two gzip members, read in chunks smaller than a member
+        content = gzip.compress(rows.encode()) + gzip.compress(b"2001,Bad,2021-13-01T08:00:00Z,1,1\n")
+        chunks = [content[i:i + 100] for i in range(0, len(content), 100)]
+        self.assertEqual(b"".join(formats.iter_decompressed(chunks, "csv.gz")).decode(), rows + "2001,Bad,2021-13-01T08:00:00Z,1,1\n")
+
+        response = self.post("employees.csv.gz", content)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()["merged"], 2000)
+        self.assertEqual(len(response.json()["errors"]), 1)
+        self.assertIn("Row 2001: Invalid datetime format", response.json()["errors"][0])
+
+        response = self.post("more.csv.gz", content[:-10])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("truncated", response.json()["error"])
+
+    @skipUnless(formats.zstandard, "zstandard is not installed")
+    def test_zstd_csv(self):
+        content = formats.zstandard.ZstdCompressor().compress(b"5,Zstd Employee,2021-02-01T00:00:00Z,1,1\n")
+        response = self.post("employees.csv.zst", content)
+        self.assertEqual(response.status_code, 201, response.json())
+        self.assertTrue(HiredEmployee.objects.filter(id=5, name="Zstd Employee").exists())
+
+    @skipUnless(formats.pyarrow, "pyarrow is not installed")
+    def test_parquet_columns_are_validated_without_text_parsing(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table({
+            # Columns in another order than the CSV, picked by name
+            "job_id": pa.array([1, 1, None, 1], pa.int64()),
+            "department_id": pa.array([1, 99, 1, 1], pa.int32()),
+            "datetime": pa.array([datetime(2021, 3, 1, 9, 30), datetime(2021, 5, 1), datetime(2021, 6, 1), None], pa.timestamp("us", tz="UTC")),
+            "name": ["Parquet 1", "Parquet 2", "Parquet 3", None],
+            "id": pa.array([10, 11, 12, 13], pa.int32()),
+        })
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+        with mock.patch.object(HiredEmployeeUploadView, "validate_row", wraps=HiredEmployeeUploadView().validate_row) as validate_row:
+            response = self.post("employees.parquet", buffer.getvalue())
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()["merged"], 1)
+        self.assertEqual(HiredEmployee.objects.get(id=10).datetime, datetime(2021, 3, 1, 9, 30, tzinfo=timezone.utc))
+        errors = response.json()["errors"]
+        self.assertIn("Row 2: Department with id 99 does not exist.", errors)
+        self.assertTrue(errors[0].startswith("Row 3:") and "job_id" in errors[0])
+        self.assertIn("Row 4: Invalid datetime format ''", errors[1])
+        # Only the rows that failed the columnar checks went through the serializer
+        self.assertEqual(validate_row.call_count, 2)
+
+    @skipUnless(formats.pyarrow, "pyarrow is not installed")
+    def test_arrow_stream_with_positional_columns(self):
+        import pyarrow as pa
+
+        batch = pa.record_batch([
+            pa.array([20, 21]), pa.array(["Arrow 1", "Arrow 2"]),
+            pa.array(["2021-07-01T00:00:00Z", "2021-08-01T00:00:00Z"]), pa.array([1, 1]), pa.array([1, 1]),
+        ], names=["a", "b", "c", "d", "e"])
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        response = self.post("employees.arrow", sink.getvalue())
+        self.assertEqual(response.status_code, 201, response.json())
+        self.assertEqual(HiredEmployee.objects.filter(id__in=[20, 21]).count(), 2)
+
+        response = self.post("employees.parquet", b"not parquet")
+        self.assertEqual(response.status_code, 400)
+
+
+class ChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        Department.objects.create(id=1, department="Test Dept")
+        Job.objects.create(id=1, job="Test Job")
+
+    def create_session(self, **params):
+        response = self.client.post(reverse("upload-sessions", args=["employees"]), params)
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put_chunk(self, session, number, data, checksum=None):
+        return self.client.put(
+            reverse("upload-session-chunk", args=[session["session_id"], number]), data,
+            content_type="application/octet-stream",
+            headers={"X-Chunk-SHA256": checksum or hashlib.sha256(data).hexdigest()},
+        )
+
+    def staged_rows(self, session):
+        table = UploadSession.objects.get(pk=session["session_id"]).staging_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+            return cursor.fetchone()[0]
+
+    def test_chunks_are_staged_as_they_arrive_and_merged_on_commit(self):
+        content = (
+            "1,José,2021-01-15T08:00:00Z,1,1\n"
+            "2,Bad Date,2021-13-01T08:00:00Z,1,1\n"
+            "3,Dangling,2021-02-01T08:00:00Z,7,1\n"
+            "4,Last Row,2021-05-01T08:00:00Z,1,1"
+        ).encode()
+        # Chunk boundaries in the middle of a row and of the two bytes of "é"
+        split = content.index("é".encode()) + 1
+        parts = [content[:split], content[split:70], content[70:]]
+        session = self.create_session()
+
+        response = self.put_chunk(session, 0, parts[0])
+        self.assertEqual(response.json(), {"chunk": 0, "next_chunk": 1, "rows": 0, "staged": 0, "errors": []})
+        self.assertEqual(self.put_chunk(session, 2, parts[2]).status_code, 409) # Out of order
+        self.assertEqual(self.put_chunk(session, 1, parts[1], checksum="0" * 64).status_code, 400)
+
+        response = self.put_chunk(session, 1, parts[1])
+        self.assertEqual(response.json()["rows"], 2)
+        self.assertEqual(response.json()["errors"][0][:6], "Row 2:")
+        # A retried chunk isn't staged twice; with other contents it's refused
+        self.assertEqual(self.put_chunk(session, 1, parts[1]).status_code, 200)
+        self.assertEqual(self.put_chunk(session, 1, b"other").status_code, 409)
+        self.assertEqual(self.put_chunk(session, 2, parts[2]).status_code, 200)
+        self.assertEqual(self.staged_rows(session), 1)
+        self.assertFalse(HiredEmployee.objects.exists())
+
+        status_response = self.client.get(session["session_url"]).json()
+        self.assertEqual((status_response["state"], status_response["next_chunk"], status_response["rows_received"]), ("open", 3, 3))
+
+        response = self.client.post(session["commit_url"])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.json()["merged"], response.json()["chunks"]), (2, 3))
+        self.assertEqual(response.json()["rejected_references"], {"department_id": 1, "job_id": 0})
+        self.assertIn("Row 3: Department with id 7 does not exist.", response.json()["errors"])
+        self.assertEqual(HiredEmployee.objects.get(id=1).name, "José")
+        self.assertEqual(HiredEmployee.objects.get(id=4).name, "Last Row")
+        self.assertEqual(HiresSummary.objects.get(year=2021, quarter=1).hires, 1)
+        self.assertEqual(self.client.post(session["commit_url"]).status_code, 409)
+        self.assertNotIn(UploadSession.objects.get().staging_table, connection.introspection.table_names())
+
+    def test_abort_and_upsert_sessions(self):
+        HiredEmployee.objects.create(id=1, name="Old", datetime=datetime(2021, 1, 1, tzinfo=timezone.utc), department_id=1, job_id=1)
+        session = self.create_session()
+        self.put_chunk(session, 0, b"2,New,2021-01-15T08:00:00Z,1,1\n")
+        self.assertEqual(self.client.delete(session["session_url"]).status_code, 200)
+        self.assertEqual(self.put_chunk(session, 1, b"3,Late,2021-01-15T08:00:00Z,1,1\n").status_code, 409)
+        self.assertFalse(HiredEmployee.objects.filter(id=2).exists())
+
+        session = self.create_session(mode="upsert")
+        self.put_chunk(session, 0, b"1,Renamed,2021-01-01T00:00:00Z,1,1\n")
+        response = self.client.post(session["commit_url"])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["updated"], 1)
+        self.assertEqual(HiredEmployee.objects.get(id=1).name, "Renamed")
+
+
+class SchemaCheckTests(TestCase):
+
+    def setUp(self):
+        self.app_config = apps.get_app_config("api")
+        self.app_config.schema_ready = False
+
+    def upload(self, job_id=20):
+        file = SimpleUploadedFile("jobs.csv", f"{job_id},Some Job".encode("utf-8"), content_type="text/csv")
+        return self.client.post(reverse("upload-jobs"), {"file": file}, format="multipart")
+
+    def test_repeated_uploads_run_no_migration_queries(self):
+        self.assertEqual(self.upload(20).status_code, 201)
+        for job_id in (21, 22):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.upload(job_id).status_code, 201)
+            self.assertFalse([q for q in queries.captured_queries if "django_migrations" in q["sql"]])
+
+    def test_stale_schema_fails_fast(self):
+        with mock.patch("api.apps.MigrationExecutor.migration_plan", return_value=[("api", False)]):
+            response = self.upload()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("migrate", response.json()["error"])
+        self.assertFalse(Job.objects.filter(id=20).exists())
+
+@override_settings(INGEST_JOBS_EAGER=True, MEDIA_ROOT=tempfile.gettempdir(), REPORT_VIEWS_REFRESH_DELAY_SECONDS=-1)
+class IngestJobTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Department.objects.create(id=1, department="Sales")
+        Job.objects.create(id=1, job="Manager")
+
+    def upload(self, url, csv_content):
+        file = SimpleUploadedFile("employees.csv", csv_content.encode("utf-8"), content_type="text/csv")
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, {"file": file}, format="multipart")
+
+    def test_background_upload_returns_job_and_reports_progress(self):
+        csv_content = "201,Emp A,2021-01-15T08:00:00Z,1,1\n202,Emp B,bad-date,1,1\n203,Emp C,2021-04-20T12:30:00Z,1,1"
+        response = self.upload(reverse("upload-employees") + "?background=1", csv_content)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job_id"]
+        self.assertEqual(response.json()["status_url"], reverse("upload-job-status", args=[job_id]))
+
+        status_response = self.client.get(reverse("upload-job-status", args=[job_id]))
+        self.assertEqual(status_response.status_code, 200)
+        data = status_response.json()
+        self.assertEqual(data["state"], IngestJob.SUCCEEDED)
+        self.assertEqual(data["rows_processed"], 3)
+        self.assertIn("rows_per_second", data)
+        self.assertEqual(len(data["errors"]), 1)
+        self.assertIn("Row 2", data["errors"][0])
+        self.assertEqual(data["result"]["merged"], 2)
+        self.assertTrue(HiredEmployee.objects.filter(id__in=[201, 203]).count() == 2)
+        self.assertFalse(os.path.exists(os.path.join(tempfile.gettempdir(), IngestJob.objects.get(pk=job_id).file_path)))
+
+    @override_settings(INGEST_BACKGROUND_MIN_BYTES=10)
+    def test_large_upload_goes_to_background(self):
+        response = self.upload(reverse("upload-jobs"), "10,A Job Title\n11,Another Job Title")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(IngestJob.objects.get(pk=response.json()["job_id"]).table, "jobs")
+        self.assertTrue(Job.objects.filter(id__in=[10, 11]).count() == 2)
+
+    def test_unknown_job_returns_404(self):
+        response = self.client.get(reverse("upload-job-status", args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir(), INGEST_JOB_WORKERS=1, REPORT_VIEWS_REFRESH_DELAY_SECONDS=-1)
+class IngestJobResumeTests(TransactionTestCase):
+    # The executor's threads have their own connections, so the job has to be committed
+
+    def tearDown(self):
+        if jobs._executor is not None:
+            jobs._executor.shutdown(wait=True)
+            jobs._executor = None
+
+    def test_queued_jobs_resume_when_the_server_starts(self):
+        Department.objects.create(id=1, department="Sales")
+        file_path = default_storage.save("ingest_jobs/resume_jobs.csv", io.BytesIO(b"21,Job A\n22,Job B"))
+        job = IngestJob.objects.create(table="jobs", file_name="jobs.csv", file_path=file_path)
+        config = apps.get_app_config("api")
+
+        with mock.patch.object(sys, "argv", ["manage.py", "migrate"]):
+            config.ready()
+        self.assertIsNone(jobs._executor)
+
+        with mock.patch.object(sys, "argv", ["gunicorn", "globant_challenge.wsgi:application"]):
+            config.ready()
+        deadline = time.monotonic() + 10
+        while IngestJob.objects.get(pk=job.pk).state != IngestJob.SUCCEEDED and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(IngestJob.objects.get(pk=job.pk).state, IngestJob.SUCCEEDED)
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_server_processes_are_told_from_commands_and_ingest_workers(self):
+        uvicorn = ["/usr/local/bin/uvicorn", "globant_challenge.asgi:application", "--workers", "4"]
+        # uvicorn's workers are spawned children with the parent's argv
+        with mock.patch("multiprocessing.parent_process", return_value=mock.Mock()):
+            self.assertTrue(serves_requests(uvicorn))
+        self.assertTrue(serves_requests(["/usr/lib/python3.11/site-packages/gunicorn/__main__.py", "-c", "gunicorn.conf.py"]))
+        self.assertTrue(serves_requests(["/usr/lib/python3.11/site-packages/uvicorn/__main__.py", "globant_challenge.asgi:application"]))
+        self.assertFalse(serves_requests(["/usr/lib/python3.11/site-packages/django/__main__.py", "migrate"]))
+        self.assertFalse(serves_requests(["manage.py", "load_csv", "--path", "data"]))
+        self.assertFalse(serves_requests(["manage.py", "runserver"]))
+        with mock.patch.dict(os.environ, {"RUN_MAIN": "true"}):
+            self.assertTrue(serves_requests(["manage.py", "runserver"]))
+        # Parallel ingest workers (api/parallel.py) inherit the server's argv
+        with mock.patch.dict(os.environ, {INGEST_WORKER_ENV: "1"}):
+            self.assertFalse(serves_requests(uvicorn))
+
+
+class BatchSizeTests(TestCase):
+
+    def test_adaptive_size_climbs_to_the_fastest_size(self):
+        sizer = AdaptiveBatchSize(1000, min_size=100, max_size=100000, max_bytes=10**9)
+        sizes = []
+        for _ in range(30):
+            # Per batch overhead plus a per row cost that grows past 8000 rows
+            seconds = 0.05 + sizer.size * 1e-5 * (1 + max(0, sizer.size - 8000) / 2000)
+            sizes.append(sizer.size)
+            sizer.observe(sizer.size, sizer.size * 50, seconds)
+        self.assertTrue(4000 <= sizes[-1] <= 16000, sizes)
+
+    def test_adaptive_size_limits(self):
+        sizer = AdaptiveBatchSize(1000, min_size=100, max_size=100000, max_bytes=1024 * 1024)
+        sizer.observe(1000, 1000 * 512, 0.01) # 512 bytes per row: at most 2048 rows per MB
+        self.assertEqual(sizer.size, 2000)
+        sizer.observe(2000, 2000 * 512, 0.01)
+        self.assertEqual(sizer.size, 2048)
+        sizer.observe(10, 10, 1.0) # Partial batches are ignored
+        self.assertEqual(sizer.size, 2048)
+
+        engine = BulkCreateIngestEngine(HiredEmployee, ["id", "name", "datetime", "department_id", "job_id"], batch_size=AdaptiveBatchSize(50000))
+        self.assertEqual(engine.batch_size, 65535 // 5)
+
+    def test_engine_adjusts_its_batch_size(self):
+        sizer = AdaptiveBatchSize(100, min_size=100)
+        engine = PostgresCopyIngestEngine(Job, ["id", "job"], batch_size=sizer)
+        with transaction.atomic():
+            for i in range(1, 1001):
+                engine.add((i, f"Job {i}"))
+            engine.finish()
+        self.assertGreater(engine.batch_size, 100)
+        self.assertEqual(engine.merged, 1000)
+
+    def test_sweep_command_records_the_best_size(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(INGEST_BATCH_SIZES_FILE=os.path.join(directory, "sizes.json")):
+            call_command("bench_batch_size", "--table", "jobs", "--rows", "500", "--sizes", "100,250", "--repeat", "1", stdout=io.StringIO())
+            self.assertIn(recorded_batch_sizes()["jobs"], (100, 250))
+        self.assertFalse(Job.objects.exists())
+
+
+class StreamingParseTests(SimpleTestCase):
+
+    def test_lines_split_across_chunks(self):
+        # "ñ" is two bytes in UTF-8; split it and the line break across chunks
+        data = "1,Año\n2,\"quoted,\nvalue\"\n3,Last".encode("utf-8")
+        chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+        rows = list(iter_csv_rows(chunks))
+        self.assertEqual(rows, [["1", "Año"], ["2", "quoted,\nvalue"], ["3", "Last"]])
+        self.assertEqual(list(iter_text_lines([b"a\r\nb\n"])), ["a\r\n", "b\n"])
+
+    def test_parse_memory_stays_flat_for_large_file(self):
+        # ~24 MB of synthetic employee rows, generated lazily in 64 KB chunks
+        line = b"1234567,Some Employee Name,2021-07-27T16:02:08Z,1,2\n"
+        chunk = line * (64 * 1024 // len(line))
+        chunk_count = 24 * 16
+
+        def chunks():
+            for _ in range(chunk_count):
+                yield chunk
+
+        tracemalloc.start()
+        try:
+            row_count = sum(1 for _ in iter_csv_rows(chunks()))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(row_count, chunk_count * (len(chunk) // len(line)))
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+class ColumnarValidationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        HiredEmployee.objects.create(id=1, name="Existing", datetime="2021-01-10T10:00:00Z", department_id=1, job_id=1)
+
+    def test_columnar_matches_serializer_path(self):
+        rows = [
+            ["101", "  Valid Employee ", "2021-01-15T08:00:00Z", "1", "1"],
+            ["102", "Bad Month", "2021-13-15T08:00:00Z", "1", "1"],
+            ["103", "", "2021-02-15T08:00:00Z", "1", "1"],
+            ["104", "Lenient Date", "2021-02-15 08:00:00", "1", "1"],
+            ["105", "Empty Job", "2021-02-15T08:00:00Z", "1", ""],
+            ["1", "Existing Id", "2021-02-15T08:00:00Z", "1", "1"],
+            ["2147483648", "Too Big", "2021-02-15T08:00:00Z", "1", "1"],
+            ["106", "x" * 256, "2021-02-15T08:00:00Z", "1", "1"],
+            ["107", "Too Few Columns"],
+        ]
+        view = HiredEmployeeUploadView()
+        checked = ColumnarValidator(HiredEmployee, view.expected_header).validate(rows)
+        for row_number, (row, values) in enumerate(zip(rows, checked), start=1):
+            expected = view.validate_row(row_number, row, [])
+            if values is not None:
+                self.assertEqual(values, expected)
+        self.assertEqual(checked[0], (101, "Valid Employee", datetime(2021, 1, 15, 8, tzinfo=timezone.utc), 1, 1))
+        self.assertEqual(checked[1:], [None] * (len(rows) - 1))
+
+        serializer_errors, columnar_errors = [], []
+        for row_number, row in enumerate(rows, start=1):
+            view.validate_row(row_number, row, serializer_errors)
+        list(view.validated_rows(rows, columnar_errors))
+        self.assertEqual(columnar_errors, serializer_errors)
+
+    def test_valid_batch_needs_one_query(self):
+        rows = [[str(i), f"Emp {i}", "2021-05-01T00:00:00Z", "1", "2"] for i in range(100, 600)]
+        view = HiredEmployeeUploadView()
+        with self.assertNumQueries(1):
+            values = list(view.validated_rows(rows, []))
+        self.assertEqual(len(values), len(rows))
+
+    def test_upload_datetimes_parse_like_parse_datetime(self):
+        for value in ["2021-01-15T08:00:00Z", "2021-02-15 08:00:00", "2021-02-15T08:00:00+02:00", "2021-02-15T08:00Z", "x", ""]:
+            self.assertEqual(parse_upload_datetime(value), parse_datetime(value))
+        for value in ["2021-13-15T08:00:00Z", "2021-02-30T08:00:00Z"]:
+            with self.assertRaises(ValueError):
+                parse_upload_datetime(value)
+        out = io.StringIO()
+        call_command("bench_datetime", "--rows", "1000", stdout=out)
+        self.assertIn("columnar", out.getvalue())
+
 class QueryAPITests(TestCase):
 
+    def setUp(self):
+        cache.clear()
+
     @classmethod
     def setUpTestData(cls):
         # Create departments
@@ -95,22 +656,24 @@ class QueryAPITests(TestCase):
         job1 = Job.objects.create(id=1, job="Manager")
         job2 = Job.objects.create(id=2, job="Analyst")
         # Create employees hired in 2021
-        HiredEmployee.objects.create(id=1, name="Emp 1", datetime="2021-01-10T10:00:00Z", department=dept1, job=job1) # Q1
-        HiredEmployee.objects.create(id=2, name="Emp 2", datetime="2021-02-15T11:00:00Z", department=dept1, job=job1) # Q1
-        HiredEmployee.objects.create(id=3, name="Emp 3", datetime="2021-04-05T12:00:00Z", department=dept1, job=job2) # Q2
-        HiredEmployee.objects.create(id=4, name="Emp 4", datetime="2021-07-20T13:00:00Z", department=dept2, job=job1) # Q3
-        HiredEmployee.objects.create(id=5, name="Emp 5", datetime="2021-08-10T14:00:00Z", department=dept2, job=job1) # Q3
-        HiredEmployee.objects.create(id=6, name="Emp 6", datetime="2021-10-25T15:00:00Z", department=dept2, job=job2) # Q4
-        HiredEmployee.objects.create(id=7, name="Emp 7", datetime="2021-11-11T16:00:00Z", department=dept2, job=job2) # Q4
-        HiredEmployee.objects.create(id=8, name="Emp 8", datetime="2021-12-01T17:00:00Z", department=dept2, job=job2) # Q4
+        HiredEmployee.objects.create(id=1, name="Emp 1", datetime="2021-01-10T10:00:00Z", department_id=dept1.id, job_id=job1.id) # Q1
+        HiredEmployee.objects.create(id=2, name="Emp 2", datetime="2021-02-15T11:00:00Z", department_id=dept1.id, job_id=job1.id) # Q1
+        HiredEmployee.objects.create(id=3, name="Emp 3", datetime="2021-04-05T12:00:00Z", department_id=dept1.id, job_id=job2.id) # Q2
+        HiredEmployee.objects.create(id=4, name="Emp 4", datetime="2021-07-20T13:00:00Z", department_id=dept2.id, job_id=job1.id) # Q3
+        HiredEmployee.objects.create(id=5, name="Emp 5", datetime="2021-08-10T14:00:00Z", department_id=dept2.id, job_id=job1.id) # Q3
+        HiredEmployee.objects.create(id=6, name="Emp 6", datetime="2021-10-25T15:00:00Z", department_id=dept2.id, job_id=job2.id) # Q4
+        HiredEmployee.objects.create(id=7, name="Emp 7", datetime="2021-11-11T16:00:00Z", department_id=dept2.id, job_id=job2.id) # Q4
+        HiredEmployee.objects.create(id=8, name="Emp 8", datetime="2021-12-01T17:00:00Z", department_id=dept2.id, job_id=job2.id) # Q4
         # Create employees hired outside 2021
-        HiredEmployee.objects.create(id=9, name="Emp 9", datetime="2020-12-31T23:59:59Z", department=dept1, job=job1)
-        HiredEmployee.objects.create(id=10, name="Emp 10", datetime="2022-01-01T00:00:00Z", department=dept2, job=job2)
+        HiredEmployee.objects.create(id=9, name="Emp 9", datetime="2020-12-31T23:59:59Z", department_id=dept1.id, job_id=job1.id)
+        HiredEmployee.objects.create(id=10, name="Emp 10", datetime="2022-01-01T00:00:00Z", department_id=dept2.id, job_id=job2.id)
         # Create more hires in dept3 for avg test
-        HiredEmployee.objects.create(id=11, name="Emp 11", datetime="2021-03-01T09:00:00Z", department=dept3, job=job1) # Q1
-        HiredEmployee.objects.create(id=12, name="Emp 12", datetime="2021-03-02T09:00:00Z", department=dept3, job=job1) # Q1
-        HiredEmployee.objects.create(id=13, name="Emp 13", datetime="2021-03-03T09:00:00Z", department=dept3, job=job1) # Q1
-        HiredEmployee.objects.create(id=14, name="Emp 14", datetime="2021-03-04T09:00:00Z", department=dept3, job=job1) # Q1
+        HiredEmployee.objects.create(id=11, name="Emp 11", datetime="2021-03-01T09:00:00Z", department_id=dept3.id, job_id=job1.id) # Q1
+        HiredEmployee.objects.create(id=12, name="Emp 12", datetime="2021-03-02T09:00:00Z", department_id=dept3.id, job_id=job1.id) # Q1
+        HiredEmployee.objects.create(id=13, name="Emp 13", datetime="2021-03-03T09:00:00Z", department_id=dept3.id, job_id=job1.id) # Q1
+        HiredEmployee.objects.create(id=14, name="Emp 14", datetime="2021-03-04T09:00:00Z", department_id=dept3.id, job_id=job1.id) # Q1
+        # Rows created through the ORM (outside the uploads and the admin) bypass the summary
+        rebuild_hires_summary()
 
     def test_hires_by_quarter_query(self):
         url = reverse("query-hires-by-quarter")
@@ -160,4 +723,582 @@ class QueryAPITests(TestCase):
         
         self.assertEqual(response_set, expected_set)
 
+    def test_hires_by_quarter_filters_and_year(self):
+        url = reverse("query-hires-by-quarter")
+        response = self.client.get(url, {"department_id": 2, "job_id": 2})
+        self.assertEqual(response.json(), [{"department": "IT", "job": "Analyst", "Q1": 0, "Q2": 0, "Q3": 0, "Q4": 3}])
+
+        response = self.client.get(url, {"year": 2022})
+        self.assertEqual(response.json(), [{"department": "IT", "job": "Analyst", "Q1": 1, "Q2": 0, "Q3": 0, "Q4": 0}])
+
+    def test_hires_by_month_and_week(self):
+        url = reverse("query-hires-by-quarter")
+        data = self.client.get(url, {"granularity": "month", "department_id": 3}).json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["M3"], 4)
+        self.assertEqual(sum(data[0][f"M{m}"] for m in range(1, 13)), 4)
+
+        data = self.client.get(url, {"granularity": "week", "department_id": 1, "job_id": 1}).json()
+        # Jan 10 falls in the second seven-day bucket, Feb 15 in the seventh
+        self.assertEqual(data[0]["W2"], 1)
+        self.assertEqual(data[0]["W7"], 1)
+        self.assertIn("W53", data[0])
+
+    def test_report_parameters_are_validated(self):
+        response = self.client.get(reverse("query-hires-by-quarter"), {"year": "2021; DROP TABLE api_job", "granularity": "day"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("year", response.json()["error"])
+        self.assertIn("granularity", response.json()["error"])
+
+    def test_departments_above_average_filters(self):
+        url = reverse("query-departments-above-average")
+        # Only Manager hires: Sales=2, IT=2, HR=4 -> average 2.67, HR is above
+        response = self.client.get(url, {"job_id": 1})
+        self.assertEqual(response.json(), [{"id": 3, "department": "HR", "hired": 4}])
+        # The department filter keeps the average over all departments
+        self.assertEqual(self.client.get(url, {"department_id": 1}).json(), [])
+        self.assertEqual(len(self.client.get(url, {"department_id": 2}).json()), 1)
+
+
+# A refresh commits, so the materialized views would miss the rows of the test transaction
+@override_settings(REPORT_VIEWS_REFRESH_DELAY_SECONDS=-1)
+class ReportCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Department.objects.create(id=1, department="Sales")
+        Job.objects.create(id=1, job="Manager")
+        HiredEmployee.objects.create(id=1, name="Emp 1", datetime="2021-01-10T10:00:00Z", department_id=1, job_id=1)
+        rebuild_hires_summary()
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("query-hires-by-quarter")
+
+    def test_repeated_report_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.json(), second.json())
+        # Different parameters are cached separately
+        self.assertEqual(self.client.get(self.url, {"year": 2022}).json(), [])
+
+    def test_upload_invalidates_cached_reports(self):
+        self.assertEqual(self.client.get(self.url).json()[0]["Q1"], 1)
+        csv_content = "2,Emp 2,2021-02-10T10:00:00Z,1,1"
+        file = SimpleUploadedFile("employees.csv", csv_content.encode("utf-8"), content_type="text/csv")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("upload-employees"), {"file": file}, format="multipart")
+        self.assertEqual(self.client.get(self.url).json()[0]["Q1"], 2)
+
+    def test_conditional_requests_get_304(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        not_modified = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(not_modified.status_code, 304)
+
+        bump_data_version("departments")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@skipUnless(settings.REPORTING_DATABASE in settings.DATABASES, "set REPORTING_DB_HOST (and REPORTING_DB_NAME) for a stand-in replica")
+@override_settings(REPORTING_CHECK_SECONDS=0, REPORT_VIEWS_REFRESH_DELAY_SECONDS=-1)
+class ReportingReplicaTests(TestCase):
+    # A second local database stands in for the replica; each one gets a different department name
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        for using, name in (("default", "Primary"), ("reporting", "Replica")):
+            Department.objects.using(using).create(id=1, department=name)
+            Department.objects.using(using).create(id=2, department="Other")
+            Job.objects.using(using).create(id=1, job="Manager")
+            HiresSummary.objects.using(using).create(year=2021, quarter=1, department_id=1, job_id=1, hires=3)
+            HiresSummary.objects.using(using).create(year=2021, quarter=1, department_id=2, job_id=1, hires=1)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("query-hires-by-quarter")
+
+    def tearDown(self):
+        # The outcome of the last lag check is kept per process
+        routers._last_check[:] = [0.0, None]
+
+    def department(self, response):
+        self.assertEqual(response.status_code, 200)
+        return next(row["department"] for row in response.json() if row["department"] != "Other")
+
+    def test_reports_read_from_the_replica(self):
+        response = self.client.get(self.url)
+        self.assertEqual(self.department(response), "Replica")
+        self.assertIn("ETag", response)
+        response = self.client.get(reverse("query-departments-above-average"))
+        self.assertEqual(self.department(response), "Replica")
+
+    def test_fallback_to_primary(self):
+        with mock.patch("api.routers.replica_lag", return_value=120.0):
+            self.assertEqual(self.department(self.client.get(self.url)), "Primary")
+        cache.clear()
+        with mock.patch("api.routers.replica_lag", side_effect=OperationalError("connection refused")):
+            self.assertEqual(self.department(self.client.get(self.url)), "Primary")
+
+    def test_lagging_replica_results_are_not_cached(self):
+        bump_data_version("employees")
+        with mock.patch("api.routers.replica_lag", return_value=10.0):
+            response = self.client.get(self.url)
+        # Within the tolerance, but it may not have the upload just made
+        self.assertEqual(self.department(response), "Replica")
+        self.assertNotIn("ETag", response)
+        with mock.patch("api.routers.replica_lag", return_value=120.0):
+            self.assertEqual(self.department(self.client.get(self.url)), "Primary")
+
+    def test_admin_change_list_reads_from_the_replica(self):
+        User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.login(username="admin", password="password")
+        response = self.client.get(reverse("admin:api_department_changelist"))
+        self.assertContains(response, "Replica")
+        self.assertNotContains(response, "Primary")
+
+    def test_router_only_relates_api_models(self):
+        router = routers.ReportingRouter()
+        department, job = Department(id=1), Job(id=1)
+        self.assertIs(router.allow_relation(department, job), True)
+        self.assertIsNone(router.allow_relation(department, User()))
+        self.assertIsNone(router.allow_relation(User(), User()))
+
+
+class HiresSummaryTests(TestCase):
+
+    def setUp(self):
+        Department.objects.create(id=1, department="Sales")
+        Department.objects.create(id=2, department="IT")
+        Job.objects.create(id=1, job="Manager")
+        HiredEmployee.objects.create(id=1, name="Existing", datetime="2021-01-10T10:00:00Z", department_id=1, job_id=1)
+        rebuild_hires_summary()
+        cache.clear()
+
+    def summary(self):
+        return {
+            (s.year, s.quarter, s.department_id, s.job_id): s.hires
+            for s in HiresSummary.objects.all()
+        }
+
+    def test_upload_counts_only_inserted_rows(self):
+        # id 2 is repeated in the file; only its first occurrence is inserted
+        csv_content = (
+            "2,Emp 2,2021-02-10T10:00:00Z,1,1\n"
+            "2,Emp 2 again,2021-08-10T10:00:00Z,1,1\n"
+            "3,Emp 3,2021-11-10T10:00:00Z,1,1\n"
+            "4,Emp 4,2022-01-10T10:00:00Z,2,1"
+        )
+        file = SimpleUploadedFile("employees.csv", csv_content.encode("utf-8"), content_type="text/csv")
+        self.client.post(reverse("upload-employees"), {"file": file}, format="multipart")
+        self.assertEqual(self.summary(), {(2021, 1, 1, 1): 2, (2021, 4, 1, 1): 1, (2022, 1, 2, 1): 1})
+        incremental = self.summary()
+        rebuild_hires_summary()
+        self.assertEqual(self.summary(), incremental)
+
+    def test_upsert_moves_hires_between_buckets(self):
+        csv_content = (
+            "1,Existing,2021-05-10T10:00:00Z,2,1\n" # moved from Q1/Sales to Q2/IT
+            "2,Emp 2,2021-02-10T10:00:00Z,1,1"
+        )
+        file = SimpleUploadedFile("employees.csv", csv_content.encode("utf-8"), content_type="text/csv")
+        response = self.client.post(reverse("upload-employees") + "?mode=upsert", {"file": file}, format="multipart")
+        self.assertEqual((response.json()["inserted"], response.json()["updated"]), (1, 1))
+        incremental = {bucket: hires for bucket, hires in self.summary().items() if hires}
+        self.assertEqual(incremental, {(2021, 1, 1, 1): 1, (2021, 2, 2, 1): 1})
+        rebuild_hires_summary()
+        self.assertEqual(self.summary(), incremental)
+
+    def test_fallback_engine_upsert(self):
+        fields = ["id", "name", "datetime", "department_id", "job_id"]
+        engine = BulkCreateIngestEngine(HiredEmployee, fields, summaries=[HiresSummaryUpdater()], upsert=True)
+        hired_at = datetime(2021, 5, 1, tzinfo=timezone.utc)
+        for row in [(1, "Renamed", hired_at, 1, 1), (5, "Emp 5", hired_at, 1, 1), (5, "Emp 5 dup", hired_at, 1, 1)]:
+            engine.add(row)
+        engine.finish()
+        self.assertEqual((engine.inserted, engine.updated, engine.unchanged, engine.skipped), (1, 1, 0, 1))
+        self.assertEqual(HiredEmployee.objects.get(id=1).name, "Renamed")
+        self.assertEqual({bucket: hires for bucket, hires in self.summary().items() if hires}, {(2021, 2, 1, 1): 2})
+
+    def test_fallback_engine_updates_summary(self):
+        engine = BulkCreateIngestEngine(HiredEmployee, ["id", "name", "datetime", "department_id", "job_id"], summaries=[HiresSummaryUpdater()])
+        hired_at = datetime(2021, 5, 1, tzinfo=timezone.utc)
+        for row in [(1, "Existing", hired_at, 1, 1), (5, "Emp 5", hired_at, 1, 1), (5, "Emp 5 dup", hired_at, 1, 1)]:
+            engine.add(row)
+        engine.finish()
+        self.assertEqual(self.summary(), {(2021, 1, 1, 1): 1, (2021, 2, 1, 1): 1})
+
+    def test_reports_read_from_summary(self):
+        HiredEmployee.objects.all().delete() # the summary alone must answer the report
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse("query-hires-by-quarter")).json()
+        self.assertEqual(data, [{"department": "Sales", "job": "Manager", "Q1": 1, "Q2": 0, "Q3": 0, "Q4": 0}])
+        self.assertTrue(all("api_hiredemployee" not in q["sql"] for q in queries.captured_queries))
+
+    @override_settings(REPORT_VIEWS_REFRESH_DELAY_SECONDS=-1)
+    def test_admin_edits_update_summary_and_reports(self):
+        User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.login(username="admin", password="password")
+        url = reverse("query-hires-by-quarter")
+        self.assertEqual(self.client.get(url).json()[0]["Q1"], 1) # Cached from here on
+
+        def hires():
+            return {bucket: count for bucket, count in self.summary().items() if count}
+
+        form = {"name": "Emp 2", "datetime_0": "2021-05-10", "datetime_1": "10:00:00", "department_id": 2, "job_id": 1}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("admin:api_hiredemployee_add"), {"id": 2, **form})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(hires(), {(2021, 1, 1, 1): 1, (2021, 2, 2, 1): 1})
+        self.assertEqual(len(self.client.get(url).json()), 2)
+
+        # Moved to Q3, then deleted
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("admin:api_hiredemployee_change", args=[2]), {"id": 2, **form, "datetime_0": "2021-08-10"})
+        self.assertEqual(hires(), {(2021, 1, 1, 1): 1, (2021, 3, 2, 1): 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("admin:api_hiredemployee_delete", args=[2]), {"post": "yes"})
+        self.assertEqual(hires(), {(2021, 1, 1, 1): 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("admin:api_hiredemployee_changelist"), {"action": "delete_selected", "_selected_action": [1], "post": "yes"})
+        self.assertEqual(hires(), {})
+        self.assertEqual(self.client.get(url).json(), [])
+
+    def test_rebuild_command(self):
+        HiresSummary.objects.all().delete()
+        out = io.StringIO()
+        call_command("rebuild_hires_summary", stdout=out)
+        self.assertIn("1 buckets", out.getvalue())
+        self.assertEqual(self.summary(), {(2021, 1, 1, 1): 1})
+
+
+class StreamingReportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Department.objects.create(id=1, department="Sales")
+        Department.objects.create(id=2, department="IT, Ops")
+        Job.objects.create(id=1, job="Manager")
+        HiredEmployee.objects.create(id=1, name="Emp 1", datetime="2021-01-10T10:00:00Z", department_id=1, job_id=1)
+        HiredEmployee.objects.create(id=2, name="Emp 2", datetime="2021-05-10T10:00:00Z", department_id=2, job_id=1)
+        rebuild_hires_summary()
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("query-hires-by-quarter")
+
+    def test_streamed_json_matches_regular_response(self):
+        expected = self.client.get(self.url).json()
+        response = self.client.get(self.url, {"stream": 1})
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), expected)
+        self.assertIn("ETag", response)
+
+        response = self.client.get(self.url, {"stream": 1, "year": 1999})
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), [])
+
+    def test_failing_query_gets_500_before_streaming(self):
+        # Fails while the rows are read, not when the statement is parsed
+        failing = ("SELECT 1 / (g - 3) AS x FROM generate_series(1, 5) g", {})
+        with mock.patch.object(HiresByQuarterReport, "build_query", return_value=failing):
+            response = self.client.get(self.url, {"stream": 1})
+            self.assertEqual(response.status_code, 500)
+            self.assertFalse(response.streaming)
+            self.assertIn("division by zero", response.json()["error"])
+            # The test transaction is aborted from here on, so any error will do
+            response = self.client.get(self.url, {"format": "csv"})
+            self.assertEqual(response.status_code, 500)
+            self.assertFalse(response.streaming)
+
+    def test_csv_format(self):
+        response = self.client.get(self.url, {"format": "csv", "granularity": "month"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response["Content-Type"].startswith("text/csv"))
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode("utf-8"))))
+        self.assertEqual(rows[0], ["department", "job"] + [f"M{m}" for m in range(1, 13)])
+        self.assertEqual(rows[1][:3], ["IT, Ops", "Manager", "0"])
+        self.assertEqual(rows[1][6], "1")
+        self.assertEqual(len(rows), 3)
+
+        response = self.client.get(self.url, {"format": "csv", "year": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_memory_does_not_grow_with_result_size(self):
+        def peak_for(row_count):
+            tracemalloc.start()
+            try:
+                rows = stream_report("SELECT g AS id, 'Department ' || g AS department FROM generate_series(1, %s) g", [row_count], chunk_size=1000)
+                size = sum(len(piece) for piece in iter_json_array(rows))
+                return size, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        small_size, small_peak = peak_for(5000)
+        large_size, large_peak = peak_for(100000)
+        self.assertGreater(large_size, 15 * small_size)
+        self.assertLess(large_peak, 2 * small_peak)
+
+
+@override_settings(REPORTING_DATABASE=None)
+class AsyncReportViewTests(TransactionTestCase):
+    # asyncpg uses its own connections, so the rows have to be committed (to the
+    # primary only: a configured stand-in replica would have none of them)
+
+    def setUp(self):
+        cache.clear()
+        Department.objects.create(id=1, department="Sales")
+        Department.objects.create(id=2, department="IT, Ops")
+        Job.objects.create(id=1, job="Manager")
+        HiredEmployee.objects.create(id=1, name="Emp 1", datetime="2021-01-10T10:00:00Z", department_id=1, job_id=1)
+        HiredEmployee.objects.create(id=2, name="Emp 2", datetime="2021-05-10T10:00:00Z", department_id=2, job_id=1)
+        HiredEmployee.objects.create(id=3, name="Emp 3", datetime="2021-06-10T10:00:00Z", department_id=2, job_id=1)
+        rebuild_hires_summary()
+        self.factory = AsyncRequestFactory()
+
+    async def get(self, view_class, **params):
+        response = await view_class.as_view()(self.factory.get("/", params))
+        if response.streaming:
+            response.body = b"".join([chunk async for chunk in response.streaming_content])
+        else:
+            response.body = response.content
+        return response
+
+    async def test_hires_by_quarter(self):
+        try:
+            response = await self.get(HiresByQuarterAsyncView)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.body), [
+                {"department": "IT, Ops", "job": "Manager", "Q1": 0, "Q2": 2, "Q3": 0, "Q4": 0},
+                {"department": "Sales", "job": "Manager", "Q1": 1, "Q2": 0, "Q3": 0, "Q4": 0},
+            ])
+            streamed = await self.get(HiresByQuarterAsyncView, stream=1)
+            self.assertEqual(json.loads(streamed.body), json.loads(response.body))
+            self.assertEqual(streamed["ETag"], response["ETag"])
+
+            empty = await self.get(HiresByQuarterAsyncView, stream=1, year=1999)
+            self.assertEqual(json.loads(empty.body), [])
+
+            rows = list(csv.reader(io.StringIO((await self.get(HiresByQuarterAsyncView, format="csv", granularity="month")).body.decode())))
+            self.assertEqual(rows[0], ["department", "job"] + [f"M{m}" for m in range(1, 13)])
+            self.assertEqual(rows[1][:7], ["IT, Ops", "Manager", "0", "0", "0", "0", "1"])
+        finally:
+            await async_db.close_pools()
+
+    async def test_departments_above_average_and_revalidation(self):
+        try:
+            response = await self.get(DepartmentsAboveAverageAsyncView)
+            self.assertEqual(json.loads(response.body), [{"id": 2, "department": "IT, Ops", "hired": 2}])
+
+            request = self.factory.get("/", headers={"If-None-Match": response["ETag"]})
+            self.assertEqual((await DepartmentsAboveAverageAsyncView.as_view()(request)).status_code, 304)
+
+            self.assertEqual((await self.get(DepartmentsAboveAverageAsyncView, year="abc")).status_code, 400)
+        finally:
+            await async_db.close_pools()
+
+    async def test_failing_query_gets_500_before_streaming(self):
+        failing = ("SELECT 1 / (g - 3) AS x FROM generate_series(1, 5) g", {})
+        try:
+            with mock.patch.object(HiresByQuarterReport, "build_query", return_value=failing):
+                response = await self.get(HiresByQuarterAsyncView, stream=1)
+            self.assertEqual(response.status_code, 500)
+            self.assertFalse(response.streaming)
+            self.assertIn("division by zero", json.loads(response.body)["error"])
+        finally:
+            await async_db.close_pools()
+
+    def test_sync_and_async_views_share_cache_entries(self):
+        async def fetch():
+            try:
+                return await self.get(HiresByQuarterAsyncView)
+            finally:
+                await async_db.close_pools()
+
+        response = self.client.get(reverse("query-hires-by-quarter"))
+        async_response = async_to_sync(fetch)()
+        self.assertEqual(async_response["ETag"], response["ETag"])
+        self.assertEqual(json.loads(async_response.body), response.json())
+
+
+@override_settings(INGEST_PARALLEL_MIN_PART_BYTES=1, REPORT_VIEWS_REFRESH_DELAY_SECONDS=-1)
+class ParallelIngestTests(TransactionTestCase):
+    # The workers load through their own connections, so nothing can stay in a test transaction
+
+    def setUp(self):
+        cache.clear()
+        lines = [f"{i},Department {i}\n" for i in range(1, 2001)]
+        for line_number in (7, 1200, 1999):
+            lines[line_number - 1] = f"x{line_number},Broken\n"
+        lines.append("1500,Duplicate\n") # Row 2001, same id as row 1500
+        fd, self.path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as f:
+            f.writelines(lines)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_load_csv_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            files = {
+                "departments.csv": "1,Sales\n2,Engineering\n",
+                "jobs.csv": "1,Analyst\n",
+                "hired_employees_1.csv": "".join(f"{i},Employee {i},2021-03-01T08:00:00Z,1,1\n" for i in range(1, 51)),
+                "hired_employees_2.csv": "".join(f"{i},Employee {i},2021-04-01T08:00:00Z,2,1\n" for i in range(51, 101)) + "101,Dangling,2021-04-01T08:00:00Z,3,1\n",
+            }
+            for name, content in files.items():
+                with open(os.path.join(directory, name), "w") as f:
+                    f.write(content)
+            out, err = io.StringIO(), io.StringIO()
+            # Employees are listed first; strict mode only accepts them once departments and jobs are in
+            with self.assertRaisesMessage(CommandError, "1 file(s) finished with errors."):
+                call_command(
+                    "load_csv", "--path", os.path.join(directory, "hired_*.csv"), "--path", directory,
+                    "--workers", "2", "--strict", stdout=out, stderr=err,
+                )
+        self.assertEqual((Department.objects.count(), Job.objects.count(), HiredEmployee.objects.count()), (2, 1, 100))
+        self.assertEqual(
+            [line.split(" ")[0] for line in out.getvalue().splitlines()],
+            ["departments", "departments:", "jobs", "jobs:", "employees", "employees", "employees:", "Total:"],
+        )
+        self.assertIn("Total: 104 rows", out.getvalue())
+        self.assertIn("Row 51", err.getvalue())
+
+    def test_split_file_on_row_boundaries(self):
+        with open(self.path, "rb") as f:
+            content = f.read()
+        ranges = split_file(self.path, 4)
+        self.assertEqual(len(ranges), 4)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(content))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(content[end - 1:end], b"\n")
+
+    def assertLoaded(self, payload, status_code):
+        self.assertEqual(status_code, 207)
+        self.assertEqual(payload["parts"], 3)
+        # Row numbers refer to the whole file, in file order
+        self.assertEqual([error.split(":")[0] for error in payload["errors"]], ["Row 7", "Row 1200", "Row 1999"])
+        self.assertEqual((payload["copied"], payload["merged"], payload["skipped"]), (1998, 1997, 1))
+        self.assertEqual(Department.objects.count(), 1997)
+        self.assertEqual(Department.objects.get(id=1500).department, "Department 1500")
+
+    def test_chunks_mode(self):
+        self.assertLoaded(*ingest_file(DepartmentUploadView(), self.path, parallel="chunks", workers=3))
+
+    def test_atomic_mode_merges_through_a_shared_staging_table(self):
+        self.assertLoaded(*ingest_file(DepartmentUploadView(), self.path, parallel="atomic", workers=3))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM pg_tables WHERE tablename LIKE 'api_department_staging_%%'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_shared_staging_keeps_the_first_row_of_each_id(self):
+        # A later part of the file may be staged before an earlier one
+        staging_table = create_staging_table(Department)
+        try:
+            with transaction.atomic():
+                later = PostgresCopyIngestEngine(Department, ["id", "department"], staging_table=staging_table, first_position=2)
+                later.add((1, "Later"))
+                later.flush()
+                first = PostgresCopyIngestEngine(Department, ["id", "department"], staging_table=staging_table, first_position=1)
+                first.add((1, "First"))
+                first.finish()
+        finally:
+            drop_staging_table(staging_table)
+        self.assertEqual((first.merged, first.skipped), (1, 0))
+        self.assertEqual(Department.objects.get(id=1).department, "First")
+
+    def test_atomic_upsert(self):
+        ingest_file(DepartmentUploadView(), self.path, parallel="chunks", workers=3)
+        with open(self.path, "a") as f:
+            f.write("1000,Renamed\n3000,New\n")
+        payload, status_code = ingest_file(DepartmentUploadView(), self.path, parallel="atomic", workers=3, mode="upsert")
+        self.assertEqual(
+            {key: payload[key] for key in ("inserted", "updated", "unchanged", "skipped")},
+            {"inserted": 1, "updated": 0, "unchanged": 1997, "skipped": 2},
+        )
+        self.assertEqual(Department.objects.get(id=1000).department, "Department 1000")
+        self.assertEqual(Department.objects.get(id=3000).department, "New")
+
+
+@override_settings(REPORTING_DATABASE=None, REPORT_VIEWS_REFRESH_DELAY_SECONDS=-1)
+class MaterializedReportTests(TransactionTestCase):
+    # REFRESH MATERIALIZED VIEW only sees committed rows
+
+    def setUp(self):
+        cache.clear()
+        Department.objects.create(id=1, department="Sales")
+        Department.objects.create(id=2, department="IT")
+        Job.objects.create(id=1, job="Manager")
+        HiredEmployee.objects.create(id=1, name="Emp 1", datetime="2021-01-10T10:00:00Z", department_id=1, job_id=1)
+        HiredEmployee.objects.create(id=2, name="Emp 2", datetime="2021-05-10T10:00:00Z", department_id=2, job_id=1)
+        HiredEmployee.objects.create(id=3, name="Emp 3", datetime="2021-06-10T10:00:00Z", department_id=2, job_id=1)
+        rebuild_hires_summary()
+        self.quarter_url = reverse("query-hires-by-quarter")
+        self.above_url = reverse("query-departments-above-average")
+
+    def add_hire_behind_the_views(self):
+        # Committed but not reported through bump_data_version, so the views look current
+        HiredEmployee.objects.create(id=4, name="Emp 4", datetime="2021-02-10T10:00:00Z", department_id=1, job_id=1)
+        rebuild_hires_summary()
+
+    def sales_q1(self, response):
+        return next(row["Q1"] for row in response.json() if row["department"] == "Sales")
+
+    def test_reports_read_views_refreshed_after_the_last_change(self):
+        get_data_versions(["departments", "jobs", "employees"]) # Before the refresh, as after an upload
+        materialized.refresh_report_views()
+        self.assertEqual(self.client.get(self.above_url).json(), [{"id": 2, "department": "IT", "hired": 2}])
+        self.add_hire_behind_the_views()
+
+        self.assertEqual(self.sales_q1(self.client.get(self.quarter_url)), 1) # From the view
+        self.assertEqual(self.sales_q1(self.client.get(self.quarter_url, {"fresh": 1})), 2)
+        # Reports without a view run the live query
+        self.assertEqual(self.client.get(self.quarter_url, {"granularity": "month"}).json()[1]["M2"], 1)
+        self.assertEqual(self.client.get(self.above_url, {"job_id": 1}).json(), [])
+
+        # A change after the refresh sends the reports back to the live query until the next one
+        bump_data_version("employees")
+        self.assertIsNone(materialized.refreshed_after(max(get_data_versions(["employees"]))))
+        self.assertEqual(self.sales_q1(self.client.get(self.quarter_url)), 2)
+        materialized.refresh_report_views()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.sales_q1(self.client.get(self.quarter_url, {"department_id": 1})), 2)
+        self.assertIn("api_report_hires_by_quarter_2021", queries.captured_queries[-1]["sql"])
+        self.assertEqual(self.client.get(self.above_url).json(), [])
+
+    @override_settings(REPORT_VIEWS_REFRESH_DELAY_SECONDS=60)
+    def test_load_csv_refreshes_the_views_before_exiting(self):
+        get_data_versions(["departments", "jobs", "employees"])
+        fd, path = tempfile.mkstemp(suffix="_employees.csv")
+        with os.fdopen(fd, "w") as f:
+            f.write("4,Emp 4,2021-02-10T10:00:00Z,1,1\n5,Emp 5,2021-03-10T10:00:00Z,1,1\n")
+        try:
+            out = io.StringIO()
+            call_command("load_csv", "--path", path, stdout=out)
+        finally:
+            os.remove(path)
+        self.assertIn("Refreshed the report views.", out.getvalue())
+        self.assertIsNone(materialized._timer)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.sales_q1(self.client.get(self.quarter_url)), 3)
+        self.assertIn("api_report_hires_by_quarter_2021", queries.captured_queries[-1]["sql"])
 
+    @override_settings(REPORT_VIEWS_REFRESH_DELAY_SECONDS=0.2)
+    def test_uploads_in_a_burst_share_one_refresh(self):
+        with mock.patch.object(materialized, "refresh_report_views", wraps=materialized.refresh_report_views) as refresh:
+            for table in ("departments", "jobs", "employees"):
+                bump_data_version(table)
+            deadline = time.monotonic() + 10
+            while cache.get(materialized.REFRESHED_KEY) is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertIsNotNone(materialized.refreshed_after(max(get_data_versions(["departments", "jobs", "employees"]))))
+        self.assertEqual(self.client.get(self.above_url).json(), [{"id": 2, "department": "IT", "hired": 2}])
@@ -1,20 +1,43 @@
+from django.conf import settings
 from django.urls import path
+from .async_views import HiresByQuarterAsyncView, DepartmentsAboveAverageAsyncView
 from .views import (
     DepartmentUploadView, 
     JobUploadView, 
     HiredEmployeeUploadView,
+    IngestJobStatusView,
+    UploadSessionCreateView,
+    UploadSessionView,
+    UploadChunkView,
+    UploadSessionCommitView,
+    MetricsView,
     HiresByQuarterView,
     DepartmentsAboveAverageView
 )
 
+# Under ASGI (globant_challenge/asgi.py) the reports are served by the native async views
+if settings.ASYNC_QUERY_VIEWS:
+    hires_by_quarter_view = HiresByQuarterAsyncView.as_view()
+    departments_above_average_view = DepartmentsAboveAverageAsyncView.as_view()
+else:
+    hires_by_quarter_view = HiresByQuarterView.as_view()
+    departments_above_average_view = DepartmentsAboveAverageView.as_view()
+
 urlpatterns = [
     # Upload endpoints
     path("upload/departments/", DepartmentUploadView.as_view(), name="upload-departments"),
     path("upload/jobs/", JobUploadView.as_view(), name="upload-jobs"),
     path("upload/employees/", HiredEmployeeUploadView.as_view(), name="upload-employees"),
+    path("upload/jobs/<int:pk>/", IngestJobStatusView.as_view(), name="upload-job-status"),
+    path("upload/<str:table>/sessions/", UploadSessionCreateView.as_view(), name="upload-sessions"),
+    path("upload/sessions/<int:pk>/", UploadSessionView.as_view(), name="upload-session"),
+    path("upload/sessions/<int:pk>/chunks/<int:number>/", UploadChunkView.as_view(), name="upload-session-chunk"),
+    path("upload/sessions/<int:pk>/commit/", UploadSessionCommitView.as_view(), name="upload-session-commit"),
     
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+
     # Query endpoints
-    path("query/hires_by_quarter/", HiresByQuarterView.as_view(), name="query-hires-by-quarter"),
-    path("query/departments_above_average/", DepartmentsAboveAverageView.as_view(), name="query-departments-above-average"),
+    path("query/hires_by_quarter/", hires_by_quarter_view, name="query-hires-by-quarter"),
+    path("query/departments_above_average/", departments_above_average_view, name="query-departments-above-average"),
 ]
 
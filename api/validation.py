@@ -0,0 +1,188 @@
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+from django.db import models
+from django.utils.dateparse import parse_datetime
+
+from .metrics import StageTimer
+
+INTEGER_PATTERN = r"-?[0-9]{1,10}" # ASCII digits, as int() would also read "١٢"
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# The layout of the upload files, with ASCII digits only
+UPLOAD_DATETIME = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ", re.ASCII)
+# Characters DRF's CharField rejects (null character and lone surrogates)
+PROHIBITED_CHARACTERS = "[\x00\ud800-\udfff]"
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1
+
+
+def parse_upload_datetime(value):
+    """
+    Datetime of an upload value, or None if it isn't one. Values in the upload
+    layout are read by datetime.fromisoformat alone; other ISO forms go through
+    Django's parse_datetime as before. Raises ValueError for impossible dates.
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parse_datetime(value)
+
+
+class ColumnarValidator:
+    """
+    Validates a batch of raw CSV rows column by column with pandas instead of
+    running one DRF serializer per row.
+
+    `validate(rows)` returns a list aligned with `rows` holding either the row's
+    converted values (a tuple ordered like `fields`) or None. The checks are
+    stricter than the serializers', so a tuple is only returned for rows the
+    serializer would accept as well; None means "not proven valid" and the caller
+    should validate that row through the serializer to get the usual error message.
+    With `check_existing=False` ids already in the table are accepted (upserts).
+    Datetime conversion is timed as its own stage in `timings` (api/metrics.py).
+    """
+
+    def __init__(self, model_class, fields, using="default", check_existing=True, timings=None):
+        self.model_class = model_class
+        self.fields = list(fields)
+        self.using = using
+        self.check_existing = check_existing
+        self.timings = timings or StageTimer()
+        self.model_fields = [model_class._meta.get_field(name) for name in self.fields]
+
+    def validate(self, rows):
+        results = [None] * len(rows)
+        width = len(self.fields)
+        positions = [i for i, row in enumerate(rows) if len(row) == width]
+        if not positions:
+            return results
+
+        if len(positions) == len(rows):
+            return self.validate_frame(pd.DataFrame(rows, columns=self.fields, dtype=object))
+        frame = pd.DataFrame([rows[i] for i in positions], columns=self.fields, dtype=object)
+        for position, row_values in zip(positions, self.validate_frame(frame)):
+            results[position] = row_values
+        return results
+
+    def validate_frame(self, frame):
+        """
+        Like `validate`, for a DataFrame with one column per field. The columns hold
+        CSV text or, for Parquet/Arrow uploads, typed values (integers, timestamps).
+        """
+        results = [None] * len(frame)
+        valid = np.ones(len(frame), dtype=bool)
+        columns = []
+        for name, field in zip(self.fields, self.model_fields):
+            with self.timings.stage("parse_datetime" if isinstance(field, models.DateTimeField) else "validate"):
+                column, matched = self._validate_column(frame[name], field)
+            valid &= matched
+            columns.append(column)
+
+        # Same check as the serializers' UniqueValidator, one query per batch
+        pk_index = self.fields.index(self.model_class._meta.pk.name)
+        ids = columns[pk_index][valid]
+        if len(ids) and self.check_existing:
+            existing = self.model_class.objects.using(self.using).filter(pk__in=ids.tolist()).values_list("pk", flat=True)
+            valid &= ~np.isin(columns[pk_index], np.fromiter(existing, dtype=np.int64))
+
+        accepted = np.flatnonzero(valid)
+        values = zip(*(column[accepted].tolist() for column in columns))
+        for position, row_values in zip(accepted.tolist(), values):
+            results[position] = row_values
+        return results
+
+    def _validate_column(self, column, field):
+        """Returns (converted values as an ndarray, boolean mask of valid entries)."""
+        if isinstance(field, models.IntegerField) and is_numeric_dtype(column) and not is_bool_dtype(column):
+            # Typed column; integer columns with nulls come as floats
+            numbers = column.to_numpy(dtype=np.float64, na_value=np.nan)
+            matched = np.isfinite(numbers) & (numbers == np.trunc(numbers))
+            matched = matched & (numbers >= INT32_MIN) & (numbers <= INT32_MAX)
+            return np.where(matched, numbers, 0).astype(np.int64), matched
+        if isinstance(field, models.DateTimeField) and is_datetime64_any_dtype(column):
+            # Typed column; naive timestamps are taken as UTC
+            parsed = pd.DatetimeIndex(column)
+            parsed = parsed.tz_localize("UTC") if parsed.tz is None else parsed.tz_convert("UTC")
+            return parsed.to_pydatetime(), ~parsed.isna()
+        if column.dtype != object:
+            # Any other typed values are only accepted through their text, by the serializer
+            column = column.astype(object)
+
+        # Text; entries that aren't strings give NaN in the .str methods and don't match
+        if isinstance(field, models.IntegerField):
+            matched = column.str.fullmatch(INTEGER_PATTERN).eq(True).to_numpy()
+            numbers = pd.to_numeric(column.where(matched, "0")).to_numpy(dtype=np.int64)
+            matched = matched & (numbers >= INT32_MIN) & (numbers <= INT32_MAX)
+            return numbers, matched
+        if isinstance(field, models.DateTimeField):
+            # A Python loop over fromisoformat beats pd.to_datetime + to_pydatetime,
+            # which spends most of its time building the datetime objects
+            parsed = np.empty(len(column), dtype=object)
+            matched = np.zeros(len(column), dtype=bool)
+            fullmatch, fromisoformat = UPLOAD_DATETIME.fullmatch, datetime.fromisoformat
+            for i, value in enumerate(column.tolist()):
+                if isinstance(value, str) and fullmatch(value):
+                    try:
+                        parsed[i] = fromisoformat(value)
+                        matched[i] = True
+                    except ValueError: # e.g. month 13
+                        pass
+            return parsed, matched
+        if isinstance(field, models.CharField):
+            # DRF's CharField trims whitespace and rejects blank values
+            stripped = column.str.strip()
+            lengths = stripped.str.len().to_numpy(dtype=np.float64, na_value=np.nan)
+            matched = (lengths > 0) & (lengths <= field.max_length)
+            matched = matched & stripped.str.contains(PROHIBITED_CHARACTERS).eq(False).to_numpy()
+            return stripped.to_numpy(dtype=object), matched
+        raise TypeError(f"No columnar validation for field type {type(field).__name__}.")
+
+
+class ReferenceChecker:
+    """
+    Strict mode for reference columns stored as plain integers (e.g. the
+    department_id and job_id of a hire). The ids of every referenced table are
+    loaded once, when the checker is created, into a sorted numpy array; each
+    batch of validated rows is then checked against them in memory with np.isin,
+    without any per-row query.
+
+    `references` maps a field name to the referenced model. `rejected` counts, per
+    field, the rows dropped because that reference doesn't exist.
+    """
+
+    def __init__(self, fields, references, using="default"):
+        self.checks = []
+        for field, model in references.items():
+            ids = model.objects.using(using).order_by("pk").values_list("pk", flat=True)
+            self.checks.append((field, list(fields).index(field), model, np.fromiter(ids, dtype=np.int64)))
+        self.rejected = {field: 0 for field in references}
+
+    def filter(self, rows, errors):
+        """
+        Takes a list of (row_number, values) and returns the ones whose references
+        all exist; the others are reported in `errors`.
+        """
+        if not rows:
+            return rows
+        missing = []
+        for field, index, model, ids in self.checks:
+            column = np.fromiter((values[index] for _, values in rows), dtype=np.int64, count=len(rows))
+            absent = ~np.isin(column, ids)
+            self.rejected[field] += int(absent.sum())
+            missing.append(absent)
+        dangling = np.logical_or.reduce(missing)
+        if not dangling.any():
+            return rows
+        kept = []
+        for i, (row_number, values) in enumerate(rows):
+            if not dangling[i]:
+                kept.append((row_number, values))
+                continue
+            problems = [
+                f"{model._meta.verbose_name.capitalize()} with id {values[index]} does not exist."
+                for (_, index, model, _), absent in zip(self.checks, missing) if absent[i]
+            ]
+            errors.append(f"Row {row_number}: {' '.join(problems)}")
+        return kept
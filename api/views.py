@@ -1,21 +1,67 @@
+from itertools import islice
+
 from rest_framework import views, status
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.db import transaction, connection
-from django.utils.dateparse import parse_datetime
-from django.http import HttpResponse # Import HttpResponse
-import csv
-import io
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueValidator
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from django.http import HttpResponse, StreamingHttpResponse # Import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 
-from .models import Department, Job, HiredEmployee
-from .serializers import DepartmentSerializer, JobSerializer, HiredEmployeeSerializer
+from . import chunked, formats, jobs, metrics
+from .batching import AdaptiveBatchSize, recorded_batch_sizes
+from . import parallel as parallel_ingest
+from .ingest import get_ingest_engine, iter_csv_rows
+from .materialized import refreshed_after
+from .models import Department, Job, HiredEmployee, IngestJob, UploadSession
+from .renderers import CSVRenderer
+from .reports import (
+    MATERIALIZED_YEAR,
+    bump_data_version,
+    departments_above_average_materialized_query,
+    departments_above_average_summary_query,
+    get_data_versions,
+    hires_by_period_query,
+    hires_by_quarter_materialized_query,
+    hires_by_quarter_summary_query,
+    iter_csv,
+    iter_json_array,
+    report_cache_key,
+    run_report,
+    started_report,
+    stream_report,
+)
+from .routers import reporting_database
+from .serializers import (
+    DepartmentSerializer,
+    JobSerializer,
+    HiredEmployeeSerializer,
+    IngestJobSerializer,
+    UploadSessionSerializer,
+    ReportParamsSerializer,
+    HiresByPeriodParamsSerializer,
+)
+from .summary import HiresSummaryUpdater
+from .validation import ColumnarValidator, ReferenceChecker, parse_upload_datetime
 
 # --- Upload Views ---
+UPLOAD_MODES = ["insert", "upsert"]
+
 class BaseUploadView(views.APIView):
     parser_classes = (MultiPartParser, FormParser)
     serializer_class = None
     model_class = None
-    batch_size = 1000
+    table_name = None
+    summaries = () # Summary tables maintained from the inserted rows (api/summary.py)
+    references = {} # Reference field -> referenced model, checked in strict mode
+    batch_size = 1000 # First batch size when bench_batch_size recorded none for the table
+    validation_batch_size = 10000
     form_title = "Upload CSV File"
     expected_header = [] # To be defined in child classes
 
@@ -30,10 +76,10 @@ class BaseUploadView(views.APIView):
         </head>
         <body>
             <h2>{self.form_title}</h2>
-            <p>Nota: El archivo CSV no debe contener una fila de encabezado.</p>
+            <p>Nota: El archivo CSV no debe contener una fila de encabezado. También se aceptan CSV comprimidos (.csv.gz, .csv.zst) y archivos Parquet o Arrow.</p>
             <form action="{ request.path }" method="post" enctype="multipart/form-data">
                 <label for="file">Selecciona el archivo CSV (sin encabezado):</label>
-                <input type="file" name="file" id="file" accept=".csv" required>
+                <input type="file" name="file" id="file" accept=".csv,.gz,.zst,.parquet,.arrow,.feather" required>
                 <br><br>
                 <input type="submit" value="Cargar Archivo">
             </form>
@@ -42,182 +88,494 @@ class BaseUploadView(views.APIView):
         """
         return HttpResponse(html_form, content_type="text/html")
 
+    def validate_row(self, row_number, row, errors, upsert=False, timings=None):
+        """
+        Validates a single row through the serializer. Returns its values as a tuple
+        ordered like `expected_header`, or None after reporting the problem in `errors`.
+        When upserting, ids that already exist are accepted.
+        """
+        timings = timings or metrics.StageTimer()
+        # Check for column count consistency against expected_header
+        if len(row) != len(self.expected_header):
+            errors.append(f"Row {row_number}: Incorrect number of columns. Expected {len(self.expected_header)}, got {len(row)}.")
+            return None
+
+        data = dict(zip(self.expected_header, row))
+        
+        if self.model_class == HiredEmployee and "datetime" in data:
+            dt_str = data["datetime"]
+            try:
+                with timings.stage("parse_datetime"):
+                    parsed_dt = parse_upload_datetime(dt_str)
+            except ValueError: # Well formatted but not a valid date, e.g. month 13
+                parsed_dt = None
+            if parsed_dt is None:
+                 errors.append(f"Row {row_number}: Invalid datetime format '{dt_str}'. Use ISO format YYYY-MM-DDTHH:MM:SSZ.")
+                 return None
+            data["datetime"] = parsed_dt
+            
+        serializer = self.serializer_class(data=data)
+        if upsert:
+            pk_field = serializer.fields[self.model_class._meta.pk.name]
+            pk_field.validators = [v for v in pk_field.validators if not isinstance(v, UniqueValidator)]
+        if serializer.is_valid():
+            validated_data = serializer.validated_data
+            return tuple(validated_data[field] for field in self.expected_header)
+        errors.append(f"Row {row_number}: {serializer.errors}")
+        return None
+
+    def validated_rows(self, rows, errors, progress=None, first_row_number=1, references=None, upsert=False, timings=None):
+        """
+        Generator over parsed CSV rows: validates them in batches with the columnar
+        validator and yields each valid row as a tuple ordered like `expected_header`.
+        Rows the columnar checks can't accept go through `validate_row`, so invalid
+        rows are reported in `errors` with the same messages as the serializer path.
+        `progress`, if given, is called with the number of rows read after each batch.
+        `first_row_number` is the line of the file the first row comes from.
+        `references`, a ReferenceChecker, also drops rows with dangling references.
+        With `upsert`, rows whose id already exists are valid.
+        The time of each stage and the rows read are recorded in `timings` (api/metrics.py).
+        """
+        timings = timings or metrics.StageTimer()
+        validator = ColumnarValidator(self.model_class, self.expected_header, check_existing=not upsert, timings=timings)
+        numbered = enumerate(rows, start=first_row_number) # Start from line 1 as there's no header
+        rows_read = 0
+        while True:
+            # Timed a batch at a time: timing every row would cost more than parsing it
+            with timings.stage("parse"):
+                batch = list(islice(numbered, self.validation_batch_size))
+            if not batch:
+                break
+            rows_read = batch[-1][0] - first_row_number + 1
+            timings.counters["rows"] += len(batch)
+            batch = [(row_number, row) for row_number, row in batch if row] # Skip empty rows
+            yield from self._validate_batch(validator, batch, errors, references, upsert, timings)
+            if progress:
+                progress(rows_read)
+        if progress:
+            progress(rows_read)
+
+    def validated_frames(self, frames, errors, progress=None, references=None, upsert=False, timings=None):
+        """
+        Counterpart of `validated_rows` for Parquet/Arrow uploads: takes DataFrames
+        with typed columns (api/formats.py) and validates them as they are, without
+        going through text. Rows the columnar checks can't accept are turned into
+        text and go through `validate_row`, so they get the usual error messages.
+        """
+        timings = timings or metrics.StageTimer()
+        validator = ColumnarValidator(self.model_class, self.expected_header, check_existing=not upsert, timings=timings)
+        rows_read = 0
+        for frame in timings.timed(frames, "read"):
+            timings.counters["rows"] += len(frame)
+            with timings.stage("validate"):
+                checked = validator.validate_frame(frame)
+            batch = [
+                (rows_read + i + 1, None if values is not None else [formats.as_text(value) for value in frame.iloc[i]])
+                for i, values in enumerate(checked)
+            ]
+            yield from self._accepted_values(batch, checked, errors, references, upsert, timings)
+            rows_read += len(frame)
+            if progress:
+                progress(rows_read)
+
+    def _validate_batch(self, validator, batch, errors, references=None, upsert=False, timings=None):
+        with timings.stage("validate"):
+            checked = validator.validate([row for _, row in batch])
+        return self._accepted_values(batch, checked, errors, references, upsert, timings)
+
+    def _accepted_values(self, batch, checked, errors, references=None, upsert=False, timings=None):
+        # `batch` holds (row_number, raw row) pairs aligned with the validator's results
+        accepted = []
+        with timings.stage("validate_serializer"):
+            for (row_number, row), values in zip(batch, checked):
+                if values is None:
+                    values = self.validate_row(row_number, row, errors, upsert, timings)
+                if values is not None:
+                    accepted.append((row_number, values))
+        if references:
+            with timings.stage("references"):
+                accepted = references.filter(accepted, errors)
+        for _, values in accepted:
+            yield values
+
+    def ingest_batch_size(self):
+        """
+        Batch size for the ingest engine of a load: an AdaptiveBatchSize (unless
+        INGEST_ADAPTIVE_BATCH_SIZE is off) starting from the size recorded for the
+        table by bench_batch_size, or from `batch_size`.
+        """
+        initial = recorded_batch_sizes().get(self.table_name, self.batch_size)
+        if settings.INGEST_ADAPTIVE_BATCH_SIZE:
+            return AdaptiveBatchSize(initial)
+        return initial
+
+    def reference_checker(self, strict=None):
+        """ReferenceChecker for an upload, or None when not in strict mode (INGEST_STRICT_REFERENCES by default)."""
+        if strict is None:
+            strict = settings.INGEST_STRICT_REFERENCES
+        if not (strict and self.references):
+            return None
+        return ReferenceChecker(self.expected_header, self.references)
+
+    def ingest(self, chunks, progress=None, first_row_number=1, strict=None, mode="insert", file_format="csv"):
+        """
+        Parses, validates and loads a CSV given as an iterable of byte chunks.
+        `file_format` is one of api/formats.py: compressed CSV is decompressed as
+        it's read, and Parquet/Arrow files are given as a seekable file object
+        instead of chunks.
+        `mode` is "insert" (rows whose id exists are rejected) or "upsert" (they
+        replace the stored values when those differ).
+        Returns the response payload and status code; used by `post`, by background
+        jobs (api/jobs.py) and, for each part of a file, by parallel ingest (api/parallel.py).
+        The payload includes the time spent in each stage under `timings`, and the
+        load is added to the process metrics (api/metrics.py).
+        """
+        errors = []
+        upsert = mode == "upsert"
+        timings = metrics.StageTimer()
+        engine = get_ingest_engine(
+            self.model_class, self.expected_header, batch_size=self.ingest_batch_size(), summaries=self.summaries, upsert=upsert, timings=timings
+        )
+        references = self.reference_checker(strict)
+
+        with transaction.atomic():
+            if file_format in formats.COLUMNAR_FORMATS:
+                timings.counters["bytes"] += getattr(chunks, "size", 0) or 0
+                frames = formats.iter_frames(chunks, file_format, self.expected_header, self.validation_batch_size)
+                rows = self.validated_frames(frames, errors, progress=progress, references=references, upsert=upsert, timings=timings)
+            else:
+                # Stream the upload chunk by chunk instead of reading it whole into memory
+                data = timings.timed(chunks, "read", count_bytes=True)
+                if file_format != "csv":
+                    data = timings.timed(formats.iter_decompressed(data, file_format), "decompress")
+                reader = iter_csv_rows(data, timings=timings)
+                rows = self.validated_rows(
+                    reader, errors, progress=progress, first_row_number=first_row_number, references=references, upsert=upsert, timings=timings
+                )
+            for values in rows:
+                try:
+                    engine.add(values)
+                except Exception as bulk_e:
+                    errors.append(f"Bulk load error: {str(bulk_e)}")
+            try:
+                engine.finish()
+            except Exception as bulk_e:
+                errors.append(f"Bulk load error (final batch): {str(bulk_e)}")
+            if engine.merged:
+                # Invalidate cached reports once the new rows are visible to other connections
+                transaction.on_commit(lambda: bump_data_version(self.table_name))
+        counts = engine.as_dict()
+        if references:
+            counts["rejected_references"] = references.rejected
+        payload, status_code = self.ingest_result(errors, counts)
+        metrics.observe(self.table_name, timings, counts, status_code)
+        payload["timings"] = timings.as_dict()
+        return payload, status_code
+
+    def ingest_result(self, errors, counts):
+        """
+        Response payload and status code for a finished load. The counts come from
+        the ingest engine (rows the merge really inserted), so no table-wide count is needed.
+        """
+        if "updated" in counts: # upsert
+            outcome = f"Inserted {counts['inserted']} records, updated {counts['updated']}, {counts['unchanged']} unchanged"
+        else:
+            outcome = f"Inserted {counts['merged']} records"
+        if errors:
+            return {"message": f"Completed with errors. {outcome}.", "errors": errors, **counts}, status.HTTP_207_MULTI_STATUS
+        else:
+            message = f"Successfully processed file. {outcome}, skipped {counts['skipped']} duplicate ids."
+            return {"message": message, **counts}, status.HTTP_201_CREATED
+
+    def strict_references(self, request):
+        # ?strict=1/0 overrides INGEST_STRICT_REFERENCES for this upload
+        flag = request.query_params.get("strict", request.data.get("strict"))
+        if flag is None:
+            return settings.INGEST_STRICT_REFERENCES
+        return flag.lower() in ("1", "true", "yes")
+
+    def include_timings(self, request):
+        # ?timings=1 returns the time spent in each ingest stage with the response
+        flag = request.query_params.get("timings", request.data.get("timings"))
+        return flag is not None and flag.lower() in ("1", "true", "yes")
+
+    def run_in_background(self, request, file_obj):
+        # Explicit ?background=1/0 wins; otherwise large files go to a background job
+        flag = request.query_params.get("background", request.data.get("background"))
+        if flag is not None:
+            return flag.lower() in ("1", "true", "yes")
+        return file_obj.size >= settings.INGEST_BACKGROUND_MIN_BYTES
+
     def post(self, request, *args, **kwargs):
         file_obj = request.FILES.get("file")
         if not file_obj:
             return Response({"error": "No file provided."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not file_obj.name.endswith(".csv"):
-            return Response({"error": "File must be a CSV."}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = formats.detect_format(file_obj.name)
+        if file_format is None:
+            return Response({"error": "File must be a CSV (optionally .csv.gz or .csv.zst), Parquet or Arrow file."}, status=status.HTTP_400_BAD_REQUEST)
+        if formats.unavailable_reason(file_format):
+            return Response({"error": formats.unavailable_reason(file_format)}, status=status.HTTP_400_BAD_REQUEST)
         
         if not self.expected_header:
             return Response({"error": "Expected header not defined for this view."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        if not apps.get_app_config("api").check_schema():
+            return Response({"error": "Database schema is not up to date. Run `python manage.py migrate`."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        # ?parallel=atomic|chunks splits the file across worker processes (api/parallel.py)
+        parallel = request.query_params.get("parallel", request.data.get("parallel")) or ""
+        if parallel and parallel not in parallel_ingest.MODES:
+            return Response({"error": f"parallel must be one of {', '.join(parallel_ingest.MODES)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # ?mode=upsert replaces existing rows whose values changed instead of rejecting them
+        mode = request.query_params.get("mode", request.data.get("mode")) or "insert"
+        if mode not in UPLOAD_MODES:
+            return Response({"error": f"mode must be one of {', '.join(UPLOAD_MODES)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        strict = self.strict_references(request)
         try:
-            from django.core.management import call_command
-            call_command("migrate") # Ensure migrations are applied
-
-            decoded_file = file_obj.read().decode("utf-8")
-            io_string = io.StringIO(decoded_file)
-            reader = csv.reader(io_string)
-            # No longer reading header from file: header = next(reader)
-
-            objects_to_create = []
-            errors = []
-            row_count = 0
-            total_inserted = 0
-
-            with transaction.atomic():
-                for row_number, row in enumerate(reader, start=1): # Start from line 1 as there's no header
-                    if not row: # Skip empty rows
-                        continue
-                    
-                    # Check for column count consistency against expected_header
-                    if len(row) != len(self.expected_header):
-                        errors.append(f"Row {row_number}: Incorrect number of columns. Expected {len(self.expected_header)}, got {len(row)}.")
-                        continue
-
-                    data = dict(zip(self.expected_header, row))
-                    
-                    if self.model_class == HiredEmployee and "datetime" in data:
-                        dt_str = data["datetime"]
-                        parsed_dt = parse_datetime(dt_str)
-                        if parsed_dt is None:
-                             errors.append(f"Row {row_number}: Invalid datetime format '{dt_str}'. Use ISO format YYYY-MM-DDTHH:MM:SSZ.")
-                             continue
-                        data["datetime"] = parsed_dt
-                        
-                    serializer = self.serializer_class(data=data)
-                    if serializer.is_valid():
-                        validated_data = serializer.validated_data
-                        instance_data = {}
-                        for field, value in validated_data.items():
-                            instance_data[field] = value
-                        if self.model_class == HiredEmployee:
-                            try:
-                                department_id = instance_data.pop("department_id")
-                                job_id = instance_data.pop("job_id")
-                                instance_data["department_id"] = department_id
-                                instance_data["job_id"] = job_id
-                            except KeyError:
-                                errors.append(f"Row {row_number}: Missing department_id or job_id in data {data}. Ensure CSV structure matches expected: {self.expected_header}")
-                                continue
-                        objects_to_create.append(self.model_class(**instance_data))
-                        row_count += 1
-                        if row_count >= self.batch_size:
-                            try:
-                                self.model_class.objects.bulk_create(objects_to_create, ignore_conflicts=True)
-                                total_inserted += len(objects_to_create)
-                            except Exception as bulk_e:
-                                errors.append(f"Bulk create error: {str(bulk_e)}")
-                            objects_to_create = []
-                            row_count = 0
-                    else:
-                        errors.append(f"Row {row_number}: {serializer.errors}")
-                if objects_to_create:
-                    try:
-                        self.model_class.objects.bulk_create(objects_to_create, ignore_conflicts=True)
-                        total_inserted += len(objects_to_create)
-                    except Exception as bulk_e:
-                        errors.append(f"Bulk create error (final batch): {str(bulk_e)}")
-            if errors:
-                return Response({"message": f"Completed with errors. Inserted approximately {total_inserted} records.", "errors": errors}, status=status.HTTP_207_MULTI_STATUS)
+            if self.run_in_background(request, file_obj):
+                job = jobs.create_job(self.table_name, file_obj, parallel=parallel, strict_references=strict, mode=mode)
+                return Response({
+                    "message": "File queued for background processing.",
+                    "job_id": job.pk,
+                    "status_url": reverse("upload-job-status", args=[job.pk]),
+                }, status=status.HTTP_202_ACCEPTED)
+
+            # Only plain CSV uploads spooled to disk can be split; small ones are kept in memory
+            if parallel and file_format == "csv" and hasattr(file_obj, "temporary_file_path"):
+                payload, status_code = parallel_ingest.ingest_file(
+                    self, file_obj.temporary_file_path(), parallel=parallel, strict=strict, mode=mode
+                )
+            elif file_format in formats.COLUMNAR_FORMATS:
+                payload, status_code = self.ingest(file_obj, strict=strict, mode=mode, file_format=file_format)
             else:
-                final_count = self.model_class.objects.count()
-                return Response({"message": f"Successfully processed file. Total records in table: {final_count}"}, status=status.HTTP_201_CREATED)
+                payload, status_code = self.ingest(file_obj.chunks(), strict=strict, mode=mode, file_format=file_format)
+            if not self.include_timings(request):
+                payload.pop("timings", None)
+            return Response(payload, status=status_code)
+        except formats.FileFormatError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class DepartmentUploadView(BaseUploadView):
     serializer_class = DepartmentSerializer
     model_class = Department
+    table_name = "departments"
     form_title = "Cargar Archivo CSV de Departamentos (sin encabezado)"
     expected_header = ["id", "department"]
 
 class JobUploadView(BaseUploadView):
     serializer_class = JobSerializer
     model_class = Job
+    table_name = "jobs"
     form_title = "Cargar Archivo CSV de Trabajos (sin encabezado)"
     expected_header = ["id", "job"]
 
 class HiredEmployeeUploadView(BaseUploadView):
     serializer_class = HiredEmployeeSerializer
     model_class = HiredEmployee
+    table_name = "employees"
     form_title = "Cargar Archivo CSV de Empleados Contratados (sin encabezado)"
     expected_header = ["id", "name", "datetime", "department_id", "job_id"]
+    summaries = (HiresSummaryUpdater(),)
+    references = {"department_id": Department, "job_id": Job}
 
-# --- Query Views ---
-class HiresByQuarterView(views.APIView):
+UPLOAD_VIEWS = {
+    view.table_name: view
+    for view in (DepartmentUploadView, JobUploadView, HiredEmployeeUploadView)
+}
+
+class IngestJobStatusView(views.APIView):
+    def get(self, request, pk, *args, **kwargs):
+        try:
+            job = IngestJob.objects.get(pk=pk)
+        except IngestJob.DoesNotExist:
+            return Response({"error": f"Job {pk} not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(IngestJobSerializer(job).data, status=status.HTTP_200_OK)
+
+class MetricsView(views.APIView):
     def get(self, request, *args, **kwargs):
-        query = """
-            SELECT 
-            d.department,
-            j.job,
-            COUNT(*) FILTER (WHERE EXTRACT(quarter FROM h.datetime) = 1) AS Q1,
-            COUNT(*) FILTER (WHERE EXTRACT(quarter FROM h.datetime) = 2) AS Q2,
-            COUNT(*) FILTER (WHERE EXTRACT(quarter FROM h.datetime) = 3) AS Q3,
-            COUNT(*) FILTER (WHERE EXTRACT(quarter FROM h.datetime) = 4) AS Q4
-            FROM api_hiredemployee h
-            INNER JOIN api_department d ON h.department_id = d.id
-            INNER JOIN api_job j ON h.job_id = j.id
-            WHERE EXTRACT(year FROM h.datetime) = 2021
-            GROUP BY d.department, j.job
-            ORDER BY d.department, j.job;
-        """
+        # Prometheus text format, rendered as is (no DRF content negotiation)
+        return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# --- Resumable chunked uploads (api/chunked.py) ---
+
+class UploadSessionCreateView(views.APIView):
+    def post(self, request, table, *args, **kwargs):
+        if table not in UPLOAD_VIEWS:
+            return Response({"error": f"Unknown table '{table}'."}, status=status.HTTP_404_NOT_FOUND)
+        if not chunked.available():
+            return Response({"error": "Chunked uploads need a PostgreSQL database."}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        if not apps.get_app_config("api").check_schema():
+            return Response({"error": "Database schema is not up to date. Run `python manage.py migrate`."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        mode = request.query_params.get("mode", request.data.get("mode")) or "insert"
+        if mode not in UPLOAD_MODES:
+            return Response({"error": f"mode must be one of {', '.join(UPLOAD_MODES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        upload_view = UPLOAD_VIEWS[table]()
+        session = chunked.create_session(upload_view, mode=mode, strict=upload_view.strict_references(request))
+        return Response({
+            "session_id": session.pk,
+            "session_url": reverse("upload-session", args=[session.pk]),
+            # Chunks are PUT to <session_url>chunks/<n>/, starting at 0
+            "first_chunk_url": reverse("upload-session-chunk", args=[session.pk, 0]),
+            "commit_url": reverse("upload-session-commit", args=[session.pk]),
+        }, status=status.HTTP_201_CREATED)
+
+class UploadSessionView(views.APIView):
+    def get(self, request, pk, *args, **kwargs):
+        try:
+            session = UploadSession.objects.get(pk=pk)
+        except UploadSession.DoesNotExist:
+            return Response({"error": "Upload session not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+    def delete(self, request, pk, *args, **kwargs):
+        payload, status_code = chunked.abort_session(pk)
+        return Response(payload, status=status_code)
+
+class UploadChunkView(views.APIView):
+    read_size = 64 * 1024
+
+    def put(self, request, pk, number, *args, **kwargs):
+        checksum = request.headers.get("X-Chunk-SHA256")
+        if not checksum:
+            return Response({"error": "X-Chunk-SHA256 header (hex SHA-256 of the chunk) is required."}, status=status.HTTP_400_BAD_REQUEST)
+        # The raw body is read as a stream and staged while it arrives
+        chunks = iter(lambda: request.read(self.read_size), b"")
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                columns = [col[0] for col in cursor.description]
-                results = [
-                    dict(zip(columns, row))
-                    for row in cursor.fetchall()
-                ]
-            return Response(results, status=status.HTTP_200_OK)
+            payload, status_code = chunked.receive_chunk(pk, number, chunks, checksum)
         except Exception as e:
             return Response({"error": f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(payload, status=status_code)
 
-class DepartmentsAboveAverageView(views.APIView):
-    def get(self, request, *args, **kwargs):
-        query = """
-        WITH DepartmentHires2021 AS (
-            SELECT
-                d.id,
-                d.department,
-                COUNT(he.id) AS hired_count
-            FROM
-                api_department d
-            JOIN
-                api_hiredemployee he ON d.id = he.department_id
-            WHERE
-                EXTRACT(YEAR FROM he.datetime) = 2021
-            GROUP BY
-                d.id,
-                d.department
-        ),
-        AverageHires2021 AS (
-            SELECT AVG(hired_count) AS avg_hires
-            FROM DepartmentHires2021
-        )
-        SELECT
-            dh.id,
-            dh.department,
-            dh.hired_count AS hired
-        FROM
-            DepartmentHires2021 dh,
-            AverageHires2021 avg
-        WHERE
-            dh.hired_count > avg.avg_hires
-        ORDER BY
-            dh.hired_count DESC;
-        """
+class UploadSessionCommitView(views.APIView):
+    def post(self, request, pk, *args, **kwargs):
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                columns = [col[0] for col in cursor.description]
-                results = [
-                    dict(zip(columns, row))
-                    for row in cursor.fetchall()
-                ]
-            return Response(results, status=status.HTTP_200_OK)
+            payload, status_code = chunked.commit_session(pk)
         except Exception as e:
             return Response({"error": f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(payload, status=status_code)
+
+# --- Query Views ---
+class CachedReportView(views.APIView):
+    """
+    Runs a report query and caches the result per parameters and data version of
+    the tables it reads (see api/reports.py). Responses carry ETag and Last-Modified
+    so clients can revalidate with If-None-Match / If-Modified-Since and get a 304.
+
+    With `?stream=1` (JSON) or `?format=csv` the rows are streamed from a server-side
+    cursor instead, without building or caching the whole result.
+
+    The queries run on the reporting replica when it can be used (api/routers.py).
+    A result from a replica that may not have the latest upload yet is served, but
+    neither cached nor given validators, so it can't outlive the replica's lag.
+
+    Reports with a materialized view (`materialized_query`) read it once it has
+    been refreshed after the last change (api/materialized.py); `?fresh=1` always
+    runs the live query, bypassing the view and the cached result.
+    """
+    params_serializer_class = ReportParamsSerializer
+    report_name = "report"
+    report_tables = ("employees", "departments", "jobs")
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer]
+    stream_chunk_size = 2000
+
+    def build_query(self, **params):
+        raise NotImplementedError
+
+    def materialized_query(self, **params):
+        """(sql, params) reading the report from its materialized view, or None if it has none for `params`."""
+        return None
+
+    def get(self, request, *args, **kwargs):
+        params = self.params_serializer_class(data=request.query_params)
+        if not params.is_valid():
+            return Response({"error": params.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        versions = get_data_versions(self.report_tables)
+        key = report_cache_key(self.report_name, params.validated_data, versions)
+        etag = quote_etag(key.rsplit(":", 1)[1])
+        last_modified = max(versions) // 10**9
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        fresh = request.query_params.get("fresh") in ("1", "true")
+        changed_at = max(versions)
+        query = None if fresh else self.materialized_query(**params.validated_data)
+        refreshed = query and refreshed_after(changed_at)
+        if refreshed:
+            changed_at = max(changed_at, refreshed) # A replica needs the refresh as well
+        else:
+            query = self.build_query(**params.validated_data)
+
+        using, current = reporting_database(changed_at=changed_at / 10**9)
+        if request.query_params.get("stream") in ("1", "true") or request.accepted_renderer.format == "csv":
+            try:
+                response = self.streaming_response(request, *query, using=using)
+            except Exception as e:
+                return Response({"error": f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        else:
+            results = None if fresh else cache.get(key)
+            if results is None:
+                try:
+                    results = run_report(*query, using=using)
+                except Exception as e:
+                    return Response({"error": f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                if current:
+                    cache.set(key, results, settings.REPORT_CACHE_TIMEOUT)
+            response = Response(results, status=status.HTTP_200_OK)
+        if current:
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def streaming_response(self, request, sql, params, using="default"):
+        # The query runs here, before the response starts
+        rows = started_report(stream_report(sql, params, chunk_size=self.stream_chunk_size, using=using))
+        if request.accepted_renderer.format == "csv":
+            response = StreamingHttpResponse(iter_csv(rows), content_type="text/csv; charset=utf-8")
+            response["Content-Disposition"] = f'attachment; filename="{self.report_name}.csv"'
+            return response
+        return StreamingHttpResponse(iter_json_array(rows), content_type="application/json")
+
+# Report definitions, shared by these views and the async ones (api/async_views.py)
+class HiresByQuarterReport:
+    params_serializer_class = HiresByPeriodParamsSerializer
+    report_name = "hires_by_quarter"
+    report_tables = ("employees", "departments", "jobs")
+
+    def build_query(self, **params):
+        # Quarters come from the summary table; finer buckets need the hires themselves
+        if params["granularity"] == "quarter":
+            return hires_by_quarter_summary_query(**{k: v for k, v in params.items() if k != "granularity"})
+        return hires_by_period_query(**params)
+
+    def materialized_query(self, **params):
+        if params["year"] == MATERIALIZED_YEAR and params["granularity"] == "quarter":
+            return hires_by_quarter_materialized_query(params.get("department_id"), params.get("job_id"))
+        return None
+
+class DepartmentsAboveAverageReport:
+    params_serializer_class = ReportParamsSerializer
+    report_name = "departments_above_average"
+    report_tables = ("employees", "departments")
+
+    def build_query(self, **params):
+        return departments_above_average_summary_query(**params)
+
+    def materialized_query(self, **params):
+        # The view holds the average over every job
+        if params["year"] == MATERIALIZED_YEAR and params.get("job_id") is None:
+            return departments_above_average_materialized_query(params.get("department_id"))
+        return None
+
+class HiresByQuarterView(HiresByQuarterReport, CachedReportView):
+    pass
+
+class DepartmentsAboveAverageView(DepartmentsAboveAverageReport, CachedReportView):
+    pass
@@ -12,5 +12,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'globant_challenge.settings')
+# The report endpoints use the async views (api/async_views.py) under ASGI
+os.environ.setdefault('ASYNC_QUERY_VIEWS', '1')
+# Django connections are tied to the request context under ASGI, so persistent ones
+# would pile up (one per request); the async views pool their own connections.
+os.environ['DB_CONN_MAX_AGE'] = '0'
 
 application = get_asgi_application()
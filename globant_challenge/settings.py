@@ -89,10 +89,29 @@ DATABASES = {
         'USER': os.environ.get('POSTGRES_USER', 'globant_user'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'Gl034nt'),
         'HOST': os.environ.get('POSTGRES_HOST', 'db'),
-        'PORT': 5432 
+        'PORT': 5432,
+        # Keep connections open between requests instead of reconnecting every time
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
     }
 }
 
+# Optional read replica for the report endpoints and the admin lists (api/routers.py)
+REPORTING_DATABASE = 'reporting' # None turns the replica off
+if os.environ.get('REPORTING_DB_HOST'):
+    DATABASES[REPORTING_DATABASE] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('REPORTING_DB_NAME', DATABASES['default']['NAME']),
+        'USER': os.environ.get('REPORTING_DB_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('REPORTING_DB_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.environ['REPORTING_DB_HOST'],
+        'PORT': int(os.environ.get('REPORTING_DB_PORT', 5432)),
+    }
+DATABASE_ROUTERS = ['api.routers.ReportingRouter']
+# Replication lag above which the reports read from the primary again, and how often it is checked
+REPORTING_MAX_LAG_SECONDS = float(os.environ.get('REPORTING_MAX_LAG_SECONDS', 30))
+REPORTING_CHECK_SECONDS = float(os.environ.get('REPORTING_CHECK_SECONDS', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -135,6 +154,61 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Cache for report results (api/reports.py). Local memory by default; use the
+# file based backend (or any shared one) when running several worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'globant-reports'),
+    }
+}
+REPORT_CACHE_TIMEOUT = int(os.environ.get('REPORT_CACHE_TIMEOUT', 3600))
+
+# Serve the report endpoints with the native async views (set by asgi.py)
+ASYNC_QUERY_VIEWS = os.environ.get('ASYNC_QUERY_VIEWS', '0') == '1'
+# Connections per event loop in the asyncpg pool used by those views
+ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 10))
+
+# Uploaded files waiting for a background ingest job are kept here
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
+
+# Background ingest jobs (api/jobs.py)
+INGEST_JOB_WORKERS = int(os.environ.get('INGEST_JOB_WORKERS', 2))
+# Uploads at least this large are processed in the background unless ?background=0
+INGEST_BACKGROUND_MIN_BYTES = int(os.environ.get('INGEST_BACKGROUND_MIN_BYTES', 50 * 1024 * 1024))
+INGEST_JOB_PROGRESS_SECONDS = 2
+# Running jobs without progress for this long are considered interrupted and re-queued
+INGEST_JOB_STALE_SECONDS = 600
+# Run jobs inline when they are enqueued (used by the tests)
+INGEST_JOBS_EAGER = False
+
+# Reject uploaded hires whose department or job doesn't exist (?strict=0 to accept them)
+INGEST_STRICT_REFERENCES = os.environ.get('INGEST_STRICT_REFERENCES', '1') == '1'
+
+# Parallel ingest (?parallel=atomic|chunks, api/parallel.py): at most this many
+# worker processes, each given at least INGEST_PARALLEL_MIN_PART_BYTES of the file
+INGEST_PARALLEL_WORKERS = int(os.environ.get('INGEST_PARALLEL_WORKERS', os.cpu_count() or 1))
+INGEST_PARALLEL_MIN_PART_BYTES = int(os.environ.get('INGEST_PARALLEL_MIN_PART_BYTES', 16 * 1024 * 1024))
+
+# Rows per ingest batch (api/batching.py): adjusted during each load from the
+# measured throughput, within these bounds and under INGEST_BATCH_MAX_BYTES of
+# payload per batch. Each table starts from the size recorded by
+# `manage.py bench_batch_size` in INGEST_BATCH_SIZES_FILE, if any.
+INGEST_ADAPTIVE_BATCH_SIZE = os.environ.get('INGEST_ADAPTIVE_BATCH_SIZE', '1') == '1'
+INGEST_BATCH_SIZE_MIN = int(os.environ.get('INGEST_BATCH_SIZE_MIN', 100))
+INGEST_BATCH_SIZE_MAX = int(os.environ.get('INGEST_BATCH_SIZE_MAX', 100000))
+INGEST_BATCH_MAX_BYTES = int(os.environ.get('INGEST_BATCH_MAX_BYTES', 32 * 1024 * 1024))
+INGEST_BATCH_SIZES_FILE = os.environ.get('INGEST_BATCH_SIZES_FILE', BASE_DIR / 'ingest_batch_sizes.json')
+
+# Resumable chunked uploads (api/chunked.py): open sessions without a chunk for
+# this long are expired and their staged rows dropped
+UPLOAD_SESSION_EXPIRY_SECONDS = int(os.environ.get('UPLOAD_SESSION_EXPIRY_SECONDS', 24 * 3600))
+
+# Materialized views of the 2021 reports (api/materialized.py): refreshed this many
+# seconds after a committed upload, one refresh for every upload in between.
+# A negative value turns the refresh off and the reports run the live queries.
+REPORT_VIEWS_REFRESH_DELAY_SECONDS = float(os.environ.get('REPORT_VIEWS_REFRESH_DELAY_SECONDS', 2))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
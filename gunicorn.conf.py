@@ -0,0 +1,17 @@
+# Gunicorn settings for serving the API in production (see docker-compose.yml).
+# Every value can be overridden through the environment.
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# More than one thread switches to the gthread worker; persistent DB connections
+# (DB_CONN_MAX_AGE) are then kept per thread.
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+# Large synchronous uploads can take a while; bigger files go to background jobs
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+# An empty GUNICORN_ACCESS_LOG disables the access log
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None